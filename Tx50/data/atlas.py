@@ -0,0 +1,315 @@
+import numpy as np
+import hashlib
+import os
+import sys
+import time
+import warnings
+
+from commun import (base_path, path_brut, path_cor, DTYPE_CALCUL, model_files, model_name,
+                    paires_modeles, align_spatial, grille_lonlat, pyplot)
+from obs_partage import charger_obs
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Atlas de cartes pour tous les modèles. Chaque produit (carte 2D) est
+# réduit une fois en pyramide (blocs FACTEURS x FACTEURS, max ou moyenne),
+# les coordonnées projetées des coins de mailles et le trait de côte sont
+# calculés une fois par niveau et mis en cache. Le tracé n'utilise ensuite
+# que des axes matplotlib simples (pcolormesh + LineCollection), sans
+# reprojection cartopy. Pleine résolution (niveau 1) seulement sur demande.
+#
+#   python atlas.py [niveau]     (défaut NIVEAU_ATLAS)
+
+path_out = os.path.join(base_path, "atlas/")
+path_cache = os.path.join(path_out, "cache/")
+
+# Facteurs de réduction de la pyramide (1 = pleine résolution)
+FACTEURS = [1, 2, 4, 8]
+NIVEAU_ATLAS = 4
+
+SEUIL_DEPASSEMENT = 40.0   # °C, années avec TXx >= seuil
+
+# produit -> (réduction par bloc, palette, centrée sur 0)
+PRODUITS = {
+    "moyenne_brut": ("mean", "Reds", False),
+    "moyenne_cor":  ("mean", "Reds", False),
+    "difference":   ("mean", "coolwarm", True),
+    "depassements": ("max", "YlOrRd", False),
+}
+
+# Projection conique conforme de Lambert centrée sur la France
+# (cartopy), approximation équirectangulaire sans cartopy
+PROJECTION = {"central_longitude": 2.5, "central_latitude": 46.5,
+              "standard_parallels": (44.0, 49.0)}
+RESOLUTION_COTES = "50m"
+
+N_COLONNES = 5
+
+# =========================================================
+# PYRAMIDES
+# =========================================================
+
+def reduire(x, f, stat="mean"):
+    """Carte (ny, nx) -> blocs f x f (bords complétés par NaN), max ou moyenne sans NaN."""
+    if f == 1:
+        return x
+    ny, nx = x.shape
+    py, px = -ny % f, -nx % f
+    x = np.pad(x.astype(float), ((0, py), (0, px)), constant_values=np.nan)
+    blocs = x.reshape((ny + py) // f, f, (nx + px) // f, f)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return (np.nanmax if stat == "max" else np.nanmean)(blocs, axis=(1, 3))
+
+
+def pyramide(carte, stat, facteurs=FACTEURS):
+    """
+    {facteur: carte réduite}. Le max d'un niveau se déduit exactement du
+    niveau précédent ; la moyenne repart de la pleine résolution (sinon
+    les blocs partiellement NaN seraient mal pondérés).
+    """
+    res = {1: np.asarray(carte, dtype=float)}
+    prec = 1
+    for f in sorted(facteurs):
+        if f == 1:
+            continue
+        if stat == "max" and f % prec == 0:
+            res[f] = reduire(res[prec], f // prec, stat)
+        else:
+            res[f] = reduire(res[1], f, stat)
+        prec = f
+    return {f: res[f].astype(DTYPE_CALCUL) for f in facteurs}
+
+
+def produits_modele(da_b, da_c, seuil=SEUIL_DEPASSEMENT):
+    """Cartes 2D d'un modèle (brut / cor alignés sur la grille obs)."""
+    moy_b = da_b.mean(dim="time", skipna=True).values
+    moy_c = da_c.mean(dim="time", skipna=True).values
+    dep = (da_c >= seuil).sum(dim="time").values.astype(float)
+    dep[~np.isfinite(moy_c)] = np.nan
+    return {"moyenne_brut": moy_b, "moyenne_cor": moy_c,
+            "difference": moy_c - moy_b, "depassements": dep}
+
+
+def _version_fichiers(*chemins):
+    """Taille et date des fichiers sources : une pyramide est recalculée s'ils changent."""
+    return "|".join(f"{os.stat(c).st_size}_{os.stat(c).st_mtime_ns}" if os.path.exists(c) else "absent"
+                    for c in chemins)
+
+
+def charger_ou_construire_pyramides(ref):
+    """{modèle: {produit: {facteur: carte}}}, relues du cache si les fichiers n'ont pas changé."""
+    os.makedirs(path_cache, exist_ok=True)
+    cle_params = f"{SEUIL_DEPASSEMENT}|{FACTEURS}"
+    pyramides = {}
+    a_calculer = []
+
+    for filename in model_files:
+        model = model_name(filename)
+        version = _version_fichiers(os.path.join(path_brut, filename),
+                                    os.path.join(path_cor, filename)) + "|" + cle_params
+        cache = os.path.join(path_cache, f"pyramide_{model}.npz")
+        if os.path.exists(cache):
+            with np.load(cache) as z:
+                if str(z["version"]) == version:
+                    pyramides[model] = {p: {f: z[f"{p}__{f}"] for f in FACTEURS} for p in PRODUITS}
+                    continue
+        a_calculer.append((filename, version, cache))
+
+    # Fichiers modèles lus (avec préchargement) seulement pour les pyramides à refaire
+    versions = {f: (v, c) for f, v, c in a_calculer}
+    for filename, da_b, da_c in paires_modeles([f for f, _, _ in a_calculer], (path_brut, path_cor)):
+        model = model_name(filename)
+        if da_b is None or da_c is None:
+            print(f"{model} -> Fichier manquant ou invalide")
+            continue
+        da_b, da_c = align_spatial(da_b, ref), align_spatial(da_c, ref)
+        if da_b is None or da_c is None:
+            print(f"{model} -> Alignement impossible")
+            continue
+        cartes = produits_modele(da_b, da_c)
+        pyramides[model] = {p: pyramide(cartes[p], PRODUITS[p][0]) for p in PRODUITS}
+
+        version, cache = versions[filename]
+        np.savez(cache, version=np.array(version),
+                 **{f"{p}__{f}": pyramides[model][p][f] for p in PRODUITS for f in FACTEURS})
+        print(f"{model} -> pyramide calculée")
+
+    return {model_name(f): pyramides[model_name(f)] for f in model_files if model_name(f) in pyramides}
+
+# =========================================================
+# GÉOMÉTRIE (COORDONNÉES PROJETÉES, TRAIT DE CÔTE)
+# =========================================================
+
+def coins(c):
+    """Centres (ny, nx) -> coins (ny+1, nx+1), bords extrapolés linéairement."""
+    c = np.vstack([2 * c[:1] - c[1:2], c, 2 * c[-1:] - c[-2:-1]])
+    c = np.hstack([2 * c[:, :1] - c[:, 1:2], c, 2 * c[:, -1:] - c[:, -2:-1]])
+    return 0.25 * (c[:-1, :-1] + c[1:, :-1] + c[:-1, 1:] + c[1:, 1:])
+
+
+def coins_niveau(coins_pleins, f):
+    """Coins des blocs f x f extraits des coins pleine résolution (dernier bloc tronqué au bord)."""
+    iy, ix = (np.union1d(np.arange(0, n, f), [n - 1]) for n in coins_pleins.shape)
+    return coins_pleins[np.ix_(iy, ix)]
+
+
+def _projection():
+    """Projection cartopy, None si cartopy est absent."""
+    try:
+        import cartopy.crs as ccrs
+    except ImportError:
+        return None
+    return ccrs.LambertConformal(**PROJECTION)
+
+
+def projeter(lon, lat, proj):
+    """lon / lat -> (x, y) projetés (équirectangulaire si proj est None)."""
+    if proj is None:
+        lat0 = np.radians(PROJECTION["central_latitude"])
+        return (lon - PROJECTION["central_longitude"]) * np.cos(lat0), lat
+    import cartopy.crs as ccrs
+    xyz = proj.transform_points(ccrs.PlateCarree(), np.asarray(lon), np.asarray(lat))
+    return xyz[..., 0], xyz[..., 1]
+
+
+def traits_de_cote(lon, lat, proj):
+    """Segments du trait de côte dans l'emprise de la grille, projetés (liste de (n, 2))."""
+    if proj is None:
+        return []
+    try:
+        import cartopy.feature as cfeature
+        from shapely.geometry import box
+        emprise = box(np.nanmin(lon) - 1, np.nanmin(lat) - 1, np.nanmax(lon) + 1, np.nanmax(lat) + 1)
+        geoms = list(cfeature.NaturalEarthFeature("physical", "coastline",
+                                                  RESOLUTION_COTES).intersecting_geometries(emprise.bounds))
+    except Exception as e:
+        print(f" -> Trait de côte indisponible : {e}")
+        return []
+
+    segments = []
+    for g in geoms:
+        for ligne in getattr(g, "geoms", [g]):
+            xy = np.asarray(ligne.coords)
+            if len(xy) > 1:
+                x, y = projeter(xy[:, 0], xy[:, 1], proj)
+                segments.append(np.column_stack([x, y]))
+    return segments
+
+
+def charger_ou_construire_geometrie(ref, facteurs=FACTEURS):
+    """
+    Coins projetés de chaque niveau et trait de côte projeté, calculés une
+    fois pour la grille et la projection puis relus du cache.
+    """
+    proj = _projection()
+    try:
+        lon, lat = grille_lonlat(ref)
+        geographique = True
+    except ValueError:
+        # Grille sans lon/lat : indices de mailles, sans projection
+        dims = [d for d in ref.dims if d != "time"]
+        lat, lon = np.meshgrid(np.arange(ref.sizes[dims[0]], dtype=float),
+                               np.arange(ref.sizes[dims[1]], dtype=float), indexing="ij")
+        proj, geographique = None, False
+
+    h = hashlib.sha256()
+    for a in (lon, lat):
+        h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+    h.update(repr((sorted(facteurs), PROJECTION, RESOLUTION_COTES, proj is None, geographique)).encode())
+    cache = os.path.join(path_cache, f"geometrie_{h.hexdigest()[:16]}.npz")
+
+    if os.path.exists(cache):
+        with np.load(cache) as z:
+            return {
+                "coins": {f: (z[f"x__{f}"], z[f"y__{f}"]) for f in facteurs},
+                "cotes": np.split(z["cotes"], z["bornes_cotes"]) if z["cotes"].size else [],
+            }
+
+    # Projection des coins pleine résolution, une seule fois pour tous les niveaux
+    if geographique:
+        x, y = projeter(coins(lon), coins(lat), proj)
+    else:
+        x, y = coins(lon), coins(lat)
+    geo = {"coins": {f: (coins_niveau(x, f), coins_niveau(y, f)) for f in facteurs},
+           "cotes": traits_de_cote(lon, lat, proj) if geographique else []}
+
+    os.makedirs(path_cache, exist_ok=True)
+    cotes = geo["cotes"]
+    np.savez(cache,
+             cotes=np.concatenate(cotes) if cotes else np.zeros((0, 2)),
+             bornes_cotes=np.cumsum([len(s) for s in cotes])[:-1] if cotes else np.zeros(0, dtype=int),
+             **{f"x__{f}": geo["coins"][f][0] for f in facteurs},
+             **{f"y__{f}": geo["coins"][f][1] for f in facteurs})
+    return geo
+
+# =========================================================
+# TRACÉ
+# =========================================================
+
+def tracer_planche(produit, pyramides, geo, niveau, out_file, dpi=120):
+    """Une carte par modèle au niveau demandé, échelle de couleur commune."""
+    from matplotlib.collections import LineCollection
+
+    plt = pyplot()
+    stat, cmap, centree = PRODUITS[produit]
+    cartes = {m: p[produit][niveau] for m, p in pyramides.items()}
+    valeurs = np.concatenate([c[np.isfinite(c)] for c in cartes.values()])
+    if centree:
+        vmax = float(np.nanmax(np.abs(valeurs))) if valeurs.size else 1.0
+        vmin = -vmax
+    else:
+        vmin, vmax = (float(valeurs.min()), float(valeurs.max())) if valeurs.size else (0.0, 1.0)
+
+    n = len(cartes)
+    ncols = min(N_COLONNES, n)
+    nrows = int(np.ceil(n / ncols))
+    fig, axes = plt.subplots(nrows, ncols, figsize=(3.2 * ncols, 3.2 * nrows), squeeze=False)
+    x, y = geo["coins"][niveau]
+
+    mappable = None
+    for ax, (model, carte) in zip(axes.ravel(), cartes.items()):
+        mappable = ax.pcolormesh(x, y, np.ma.masked_invalid(carte), cmap=cmap,
+                                 vmin=vmin, vmax=vmax, shading="flat")
+        if geo["cotes"]:
+            ax.add_collection(LineCollection(geo["cotes"], colors="black", linewidths=0.5))
+        ax.set_xlim(np.nanmin(x), np.nanmax(x))
+        ax.set_ylim(np.nanmin(y), np.nanmax(y))
+        ax.set_aspect("equal")
+        ax.set_title(model, fontsize=8)
+        ax.set_axis_off()
+    for ax in axes.ravel()[n:]:
+        ax.set_visible(False)
+
+    if mappable is not None:
+        fig.colorbar(mappable, ax=axes.ravel().tolist(), shrink=0.6, label=produit)
+    fig.suptitle(f"{produit} (blocs {niveau}x{niveau}, {stat})")
+    fig.savefig(out_file, dpi=dpi)
+    plt.close(fig)
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    niveau = int(sys.argv[1]) if len(sys.argv) > 1 else NIVEAU_ATLAS
+    if niveau not in FACTEURS:
+        print(f"Niveau {niveau} absent de la pyramide {FACTEURS}")
+        sys.exit(1)
+
+    os.makedirs(path_out, exist_ok=True)
+    ref = charger_obs()
+    if ref is None:
+        raise RuntimeError("Impossible de charger les observations")
+
+    debut = time.perf_counter()
+    pyramides = charger_ou_construire_pyramides(ref)
+    geo = charger_ou_construire_geometrie(ref)
+    print(f"Pyramides et géométrie prêtes en {time.perf_counter() - debut:.2f} s")
+
+    for produit in PRODUITS:
+        debut = time.perf_counter()
+        out = os.path.join(path_out, f"atlas_{produit}_n{niveau}.png")
+        tracer_planche(produit, pyramides, geo, niveau, out)
+        print(f"{produit:14s} {len(pyramides)} cartes en {time.perf_counter() - debut:.2f} s -> {out}")
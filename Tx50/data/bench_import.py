@@ -0,0 +1,83 @@
+import subprocess
+import sys
+import os
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Budget de temps d'import (secondes) des modules utilisés par les jobs
+# batch sans tracé. Chaque module est importé dans un interpréteur neuf
+# (python -X importtime) ; aucun ne doit charger de module de tracé.
+# Le harnais de non-régression verif_golden.py est lancé à la suite.
+
+BUDGETS = {
+    "tx50":            0.05,
+    "commun":          0.05,
+    "obs_partage":     0.3,
+    "inventaire":      0.6,
+    "coherence":       0.6,
+    "anaylse_compare": 1.0,
+    "cache_seuils":    1.0,
+    "distrib_tmax":    0.5,
+    "regions":         1.0,
+}
+
+MODULES_INTERDITS = ["matplotlib", "cartopy"]
+
+N_REPETITIONS = 3
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# =========================================================
+# MESURE
+# =========================================================
+
+def temps_import(module):
+    """Temps cumulé d'import du module (s) et modules lourds chargés."""
+    code = (f"import {module}, sys; "
+            f"print(','.join(m for m in {MODULES_INTERDITS!r} if m in sys.modules))")
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         cwd=HERE, capture_output=True, text=True,
+                         env=dict(os.environ, MPLBACKEND="Agg"))
+    if res.returncode != 0:
+        raise RuntimeError(f"Import de {module} impossible :\n{res.stderr[-2000:]}")
+
+    cumul = None
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        champs = [c.strip() for c in line.split("|")]
+        if len(champs) == 3 and champs[2] == module:
+            cumul = int(champs[1]) / 1e6
+
+    charges = [m for m in res.stdout.strip().split(",") if m]
+    return cumul, charges
+
+
+def main():
+    echecs = 0
+    print(f"{'module':18s} {'temps (s)':>10s} {'budget':>8s}  modules lourds")
+    for module, budget in BUDGETS.items():
+        mesures = []
+        charges = []
+        for _ in range(N_REPETITIONS):
+            t, charges = temps_import(module)
+            mesures.append(t)
+        t = min(mesures)
+
+        ok = t <= budget and not charges
+        echecs += not ok
+        print(f"{module:18s} {t:10.3f} {budget:8.2f}  {','.join(charges) or '-'}"
+              f"{'' if ok else '   <- HORS BUDGET'}")
+
+    # Les optimisations mesurées ici ne doivent pas changer les métriques
+    print("\n--- Non-régression des métriques (verif_golden.py) ---")
+    res = subprocess.run([sys.executable, "verif_golden.py"], cwd=HERE,
+                         env=dict(os.environ, MPLBACKEND="Agg"))
+    echecs += res.returncode != 0
+
+    return 1 if echecs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
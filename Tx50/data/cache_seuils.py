@@ -0,0 +1,199 @@
+import xarray as xr
+import numpy as np
+import os
+
+from commun import (base_path, path_brut, path_cor, DTYPE_ACCUMULATION, PERIODES,
+                    model_files, model_name, paires_modeles, align_spatial)
+from obs_partage import charger_obs
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Résultats indexés par seuil, calculés une seule fois :
+# (modèle, condition, version, seuil, année) -> nombre de points, somme et
+# somme des carrés de (modèle - obs) sur les points où Tx_ref >= seuil.
+# Barplots, courbes ΔRMSE et séries annuelles en sont tous dérivés.
+
+file_cache = os.path.join(base_path, "cache_seuils.nc")
+
+# Seuil "sans filtre" : tous les points valides
+SEUIL_AUCUN = -np.inf
+
+THRESHOLDS = np.concatenate([[SEUIL_AUCUN], np.arange(30, 50.5, 0.5)])
+
+VERSIONS = ["brut", "cor"]
+
+# Champ de référence du filtre (Tx_ref >= seuil), tous calculés dans la
+# même passe : corrigé, brut, obs, union (au moins un des trois) ou
+# intersection (les trois)
+CONDITIONS = ["cor", "brut", "obs", "union", "intersection"]
+
+YEARS_OBS = slice(*PERIODES["obs"])
+
+# =========================================================
+# REMPLISSAGE
+# =========================================================
+
+def sommes_par_seuil(ref, diffs, thresholds):
+    """
+    Pour une année : tri des points par Tx_ref décroissant puis sommes
+    cumulées, ce qui donne count/sum/sumsq pour tous les seuils d'un coup.
+    ref : (n_points,), diffs : liste de (n_points,) -> (n_diffs, 3, n_seuils)
+    """
+    r = np.where(np.isfinite(ref), ref, -np.inf)
+    order = np.argsort(-r, kind="stable")
+    r_desc = r[order]
+
+    # Nombre de points avec ref >= seuil
+    k = np.searchsorted(-r_desc, -np.asarray(thresholds), side="right")
+
+    out = np.empty((len(diffs), 3, len(thresholds)))
+    for v, d in enumerate(diffs):
+        d = d[order]
+        ok = np.isfinite(d)
+        d0 = np.where(ok, d, 0.0)
+        cs = np.zeros((3, d.size + 1))
+        cs[0, 1:] = np.cumsum(ok)
+        # Champs en float32, accumulations en float64
+        cs[1, 1:] = np.cumsum(d0, dtype=DTYPE_ACCUMULATION)
+        cs[2, 1:] = np.cumsum(np.square(d0, dtype=DTYPE_ACCUMULATION))
+        out[v] = cs[:, k]
+    return out
+
+
+def refs_conditions(o, b, c):
+    """Champ de référence de chaque condition (NaN = point jamais retenu)."""
+    return {
+        "cor": c,
+        "brut": b,
+        "obs": o,
+        "union": np.fmax(np.fmax(o, b), c),
+        "intersection": np.minimum(np.minimum(o, b), c),
+    }
+
+
+def remplir_modele(da_b, da_c, da_obs, thresholds=THRESHOLDS):
+    """Tableau (condition, version, stat, seuil, année) pour un modèle."""
+    years = sorted(set(da_b.time.values) & set(da_c.time.values) & set(da_obs.time.values))
+    if not years:
+        return None, None
+
+    da_o = da_obs.sel(time=years)
+    da_b = align_spatial(da_b.sel(time=years), da_o)
+    da_c = align_spatial(da_c.sel(time=years), da_o)
+    if da_b is None or da_c is None:
+        return None, None
+
+    o = da_o.values.reshape(len(years), -1)
+    b = da_b.values.reshape(len(years), -1)
+    c = da_c.values.reshape(len(years), -1)
+
+    out = np.empty((len(CONDITIONS), len(VERSIONS), 3, len(thresholds), len(years)))
+    for iy in range(len(years)):
+        diffs = [b[iy] - o[iy], c[iy] - o[iy]]
+        refs = refs_conditions(o[iy], b[iy], c[iy])
+        for ic, cond in enumerate(CONDITIONS):
+            out[ic, ..., iy] = sommes_par_seuil(refs[cond], diffs, thresholds)
+
+    return np.asarray(years), out
+
+
+def construire_cache(thresholds=THRESHOLDS, out_file=file_cache):
+    """Une passe sur tous les modèles ; écrit et retourne le Dataset."""
+    print("Chargement observations...")
+    da_obs = charger_obs()
+    if da_obs is None:
+        raise RuntimeError("Impossible de charger les observations")
+    da_obs = da_obs.sel(time=YEARS_OBS)
+
+    all_years = np.asarray(da_obs.time.values)
+    models = []
+    blocs = []
+
+    # Modèle suivant décodé en arrière-plan pendant le calcul du courant
+    for filename, da_b, da_c in paires_modeles(model_files, (path_brut, path_cor)):
+        model = model_name(filename)
+        print(f"--- {model} ---")
+
+        if da_b is None or da_c is None:
+            print(" -> Fichier manquant ou invalide")
+            continue
+
+        years, res = remplir_modele(da_b, da_c, da_obs, thresholds)
+        if res is None:
+            print(" -> Pas d'années communes / alignement impossible")
+            continue
+
+        # Réindexation sur toutes les années obs (comptes nuls si absentes)
+        full = np.zeros(res.shape[:-1] + (len(all_years),))
+        full[..., np.searchsorted(all_years, years)] = res
+        models.append(model)
+        blocs.append(full)
+
+    data = np.stack(blocs)
+    dims = ["model", "condition", "version", "threshold", "year"]
+    ds = xr.Dataset(
+        data_vars={
+            "count": (dims, data[:, :, :, 0].astype(np.int32)),
+            "sum":   (dims, data[:, :, :, 1]),
+            "sumsq": (dims, data[:, :, :, 2]),
+        },
+        coords={"model": models, "condition": CONDITIONS, "version": VERSIONS,
+                "threshold": np.asarray(thresholds, dtype=float), "year": all_years},
+    )
+    ds.attrs["comment"] = ("Sommes de (modèle - obs) sur les points où Tx_ref >= seuil, "
+                           "Tx_ref selon 'condition' ; threshold = -inf : tous les points.")
+    ds.to_netcdf(out_file)
+    print(f"-> Cache écrit : {out_file}")
+    return ds
+
+
+def charger_cache(thresholds=THRESHOLDS, in_file=file_cache):
+    """Relit le cache, le reconstruit si absent ou s'il manque des seuils."""
+    if os.path.exists(in_file):
+        ds = xr.load_dataset(in_file)
+        if ("condition" in ds.dims
+                and np.isin(np.asarray(thresholds, dtype=float), ds.threshold.values).all()):
+            return ds
+    return construire_cache(np.union1d(THRESHOLDS, thresholds), in_file)
+
+# =========================================================
+# DÉRIVATIONS
+# =========================================================
+
+def rmse_annuel(ds):
+    """RMSE spatial par (modèle, condition, version, seuil, année)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(ds["sumsq"] / ds["count"].where(ds["count"] > 0))
+
+
+def biais_annuel(ds):
+    """Biais spatial moyen par (modèle, condition, version, seuil, année)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return ds["sum"] / ds["count"].where(ds["count"] > 0)
+
+
+def rmse_moyen(ds):
+    """Moyenne temporelle des RMSE annuels (années sans point ignorées)."""
+    return rmse_annuel(ds).mean(dim="year", skipna=True)
+
+
+def delta_rmse(ds):
+    """ΔRMSE = RMSE(brut) - RMSE(corrigé) par (modèle, condition, seuil)."""
+    r = rmse_moyen(ds)
+    return r.sel(version="brut") - r.sel(version="cor")
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    ds = construire_cache()
+    seuils = [30.0, 35.0, 40.0, 45.0, 50.0]
+    print(delta_rmse(ds).sel(condition="cor", threshold=seuils).to_pandas().round(2))
+
+    # Biais conditionnel : dépendance du biais moyen au champ de filtrage
+    biais = biais_annuel(ds).mean(dim=["model", "year"], skipna=True)
+    for th in [35.0, 40.0]:
+        print(f"\n--- Biais moyen multi-modèles, Tx_ref >= {th}°C ---")
+        print(biais.sel(threshold=th).to_pandas().round(2))
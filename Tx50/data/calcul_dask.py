@@ -0,0 +1,92 @@
+import xarray as xr
+import dask
+from dask.diagnostics import ProgressBar
+import os
+
+from commun import DTYPE_CALCUL
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Exécution hors mémoire des traitements journaliers : les fichiers sont
+# ouverts par blocs (chunks) et les calculs deviennent des graphes dask
+# exécutés par un ordonnanceur local configurable.
+
+# "cluster" (LocalCluster dask.distributed) : seul ordonnanceur avec limite
+# mémoire par worker et débordement disque, donc le défaut des scripts
+# journaliers. "threads" / "processes" (ordonnanceurs locaux sans limite
+# ni débordement) ne conviennent qu'aux fichiers qui tiennent en mémoire.
+SCHEDULER = "cluster"
+N_WORKERS = 4
+
+# Limite mémoire par worker (N_WORKERS x MEMORY_LIMIT au total) et débordement disque
+MEMORY_LIMIT = "4GB"
+SPILL_DIR = os.path.join(os.path.expanduser("~"), "dask-spill")
+
+# Taille des blocs le long du temps (jours)
+CHUNK_TIME = 365
+
+# =========================================================
+# FONCTIONS
+# =========================================================
+
+def ouvrir_chunks(filepath, chunk_time=CHUNK_TIME):
+    """
+    Ouvre un NetCDF en lecture paresseuse, découpé le long du temps.
+    Les variables flottantes sont ramenées en float32 bloc par bloc.
+    """
+    ds = xr.open_dataset(filepath, chunks={"time": chunk_time})
+    for nom, var in ds.data_vars.items():
+        if var.dtype.kind == "f" and var.dtype != DTYPE_CALCUL:
+            ds[nom] = var.astype(DTYPE_CALCUL)
+    return ds
+
+
+def demarrer_scheduler(mode=SCHEDULER, n_workers=N_WORKERS,
+                       memory_limit=MEMORY_LIMIT, spill_dir=SPILL_DIR):
+    """
+    Configure l'ordonnanceur dask. Retourne un Client pour "cluster",
+    None pour les ordonnanceurs locaux "threads" / "processes".
+    """
+    if mode == "cluster":
+        try:
+            from dask.distributed import Client, LocalCluster
+        except ImportError:
+            raise RuntimeError("dask.distributed est nécessaire pour l'ordonnanceur 'cluster' "
+                               "(limite mémoire) ; SCHEDULER = 'threads' tourne sans limite")
+
+        os.makedirs(spill_dir, exist_ok=True)
+        dask.config.set({
+            "temporary-directory": spill_dir,
+            "distributed.worker.memory.target": 0.6,
+            "distributed.worker.memory.spill": 0.7,
+            "distributed.worker.memory.pause": 0.8,
+            "distributed.worker.memory.terminate": 0.95,
+        })
+        cluster = LocalCluster(n_workers=n_workers, threads_per_worker=1,
+                               memory_limit=memory_limit,
+                               local_directory=spill_dir)
+        client = Client(cluster)
+        print(f"LocalCluster : {n_workers} workers x {memory_limit} ({client.dashboard_link})")
+        return client
+
+    if mode not in ("threads", "processes"):
+        raise ValueError(f"Ordonnanceur inconnu : {mode}")
+
+    dask.config.set(scheduler=mode, num_workers=n_workers)
+    print(f"Ordonnanceur dask local : {mode} ({n_workers} workers), "
+          "sans limite mémoire ni débordement disque")
+    return None
+
+
+def calculer(*objs, client=None):
+    """Calcule les objets dask avec affichage de la progression."""
+    if client is None:
+        with ProgressBar():
+            return dask.compute(*objs)
+
+    from dask.distributed import progress
+
+    futures = client.compute(list(objs))
+    progress(futures)
+    return tuple(client.gather(futures))
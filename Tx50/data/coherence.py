@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+import os
+
+from commun import base_path
+from inventaire import charger_inventaire, fiabilite_tableau
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Règles de cohérence des simulations (Critères 1/2/3 du tableau
+# d'inventaire) évaluées sur tous les événements de tous les modèles
+# en une passe vectorisée. Remplace le code couleur manuel.
+
+path_out = os.path.join(base_path, "coherence/")
+
+# Écart brut -> corrigé par modèle, dérivé du cache indexé par seuil
+# (cache_seuils.file_cache). Les règles qui en dépendent sont ignorées
+# sans cache ; xarray n'est importé que s'il existe.
+file_cache_seuils = os.path.join(base_path, "cache_seuils.nc")
+
+# Seuils calibrés sur les verdicts du tableau (colonne 9 : "Fiable à X%",
+# "N cas fiables") : la fiabilité par modèle qui en résulte reste à moins
+# de ECART_FIABILITE_MAX points du tableau (verif_golden.py).
+#
+# Critère 1, "explosion" : plus d'un tiers des points > 45°C dépassent
+# déjà 50°C. Les ratios plus faibles ((N50)<(N>45)/10 de la légende)
+# éliminent des événements que le tableau juge fiables (IPSL-CM5A-MR_RCA4,
+# 5 724 points > 45°C dont 1 896 > 50°C).
+RATIO_EXPLOSION = 3
+# Critère 2 : pic au-dessus de 50°C sans étendue, moins d'un point > 50°C
+# par degré au-dessus de 50°C (N50 < 2(Tmax-50) de la légende élimine des
+# événements fiables de CNRM-CM5_ALADIN63).
+POINTS_PAR_DEGRE = 1
+# Critère 3 rouge, "points isolés" : zone T > 45°C de moins de
+# N45_POINTS_ISOLES points de grille SAFRAN (8 km, 64 km² par point),
+# soit moins de 3 200 km², plus petite qu'un département moyen (~5 700 km²).
+# Critère 3 jaune : zone restreinte. La légende donne N45 < 250 ; les
+# verdicts du tableau placent la limite entre 338 points (IPSL-CM5A-MR_RCA4,
+# non fiable) et 370 (NorESM1-M_REMO2015).
+N45_POINTS_ISOLES = 50
+N45_ZONE_RESTREINTE = 350
+# Saut brut -> corrigé (°C, écart des biais moyens sans filtre)
+SAUT_CORRECTION_MAX = 3.0
+
+# Chaque règle signale un problème (True = incohérent). Niveaux :
+# "rouge" / "jaune" fixent la couleur, "signal" n'entre que dans le score
+# (le tableau juge fiables des événements précoces, ex. MPI-ESM-LR_CLMcom-
+# CCLM4-8-17 en 2009, "<2.0°C").
+# Colonnes : celles de l'inventaire typé (inventaire.py) + métriques modèle
+REGLES = [
+    {"nom": "C1_rouge", "critere": "Critère 1", "niveau": "rouge",
+     "expr": f"N50 > N45 / {RATIO_EXPLOSION}"},
+    {"nom": "C2_rouge", "critere": "Critère 2", "niveau": "rouge",
+     "expr": f"N50 < {POINTS_PAR_DEGRE} * (T_max - 50)"},
+    {"nom": "C3_rouge", "critere": "Critère 3", "niveau": "rouge",
+     "expr": f"N45 < {N45_POINTS_ISOLES}"},
+    {"nom": "C3_jaune", "critere": "Critère 3", "niveau": "jaune",
+     "expr": f"N45 < {N45_ZONE_RESTREINTE}"},
+    # Dépassement avant un niveau de réchauffement plausible
+    {"nom": "precoce", "critere": "Précocité", "niveau": "signal",
+     "expr": "(warming < 2.0) | (warming_ouvert & (warming_max <= 2.0))"},
+    # Saut brut -> corrigé anormalement grand (métriques modèle)
+    {"nom": "saut_correction", "critere": "Correction", "niveau": "signal",
+     "expr": f"abs(ecart_moyen) > {SAUT_CORRECTION_MAX}"},
+]
+
+POIDS = {"rouge": 2.0, "jaune": 1.0, "signal": 0.5}
+
+# Événements fiables à ce niveau de réchauffement ou moins : "vert foncé"
+# (borne haute du niveau : "2.7 à 4.0" ou ">4.0" n'en font pas partie)
+HORIZON_VERT_FONCE = 2.7
+
+# =========================================================
+# CHARGEMENT
+# =========================================================
+
+def metriques_modeles(cache_file=file_cache_seuils):
+    """
+    Par modèle : biais moyen brut / cor contre SAFRAN (tous points, toutes
+    années) et leur écart, depuis les count / sum du cache ; None sans cache.
+    """
+    if not os.path.exists(cache_file):
+        print(f" -> Cache absent, métriques modèle ignorées : {cache_file}")
+        return None
+    import xarray as xr
+    from cache_seuils import SEUIL_AUCUN
+
+    with xr.open_dataset(cache_file) as ds:
+        ds = ds[["count", "sum"]].sel(threshold=SEUIL_AUCUN,
+                                       condition="cor").sum(dim="year").load()
+    biais = (ds["sum"] / ds["count"].where(ds["count"] > 0)).to_pandas()
+    return pd.DataFrame({
+        "modele": biais.index.astype(str),
+        "biais_brut": biais["brut"].values,
+        "biais_cor": biais["cor"].values,
+        "ecart_moyen": (biais["cor"] - biais["brut"]).values,
+    })
+
+
+def joindre_metriques(df, met):
+    """Ajoute les métriques par modèle (si disponibles)."""
+    if met is None:
+        return df
+    return df.astype({"modele": str}).merge(met, on="modele", how="left")
+
+# =========================================================
+# MOTEUR DE RÈGLES
+# =========================================================
+
+def evaluer_regles(df, regles=REGLES):
+    """
+    Évalue toutes les règles sur toutes les lignes (df.eval vectorisé).
+    Retourne (drapeaux booléens (n_evenements, n_regles), règles évaluées).
+    """
+    colonnes = []
+    actives = []
+    for regle in regles:
+        try:
+            res = df.eval(regle["expr"])
+        except (pd.errors.UndefinedVariableError, KeyError) as e:
+            print(f" -> Règle '{regle['nom']}' ignorée (colonnes absentes : {e})")
+            continue
+        colonnes.append(pd.Series(res).fillna(False).to_numpy(dtype=bool))
+        actives.append(regle)
+
+    if not colonnes:
+        return np.zeros((len(df), 0), dtype=bool), actives
+    return np.column_stack(colonnes), actives
+
+
+def scorer(df, regles=REGLES):
+    """Score et couleur par événement, une colonne booléenne par règle."""
+    drapeaux, actives = evaluer_regles(df, regles)
+    out = df.copy()
+
+    for k, regle in enumerate(actives):
+        out[regle["nom"]] = drapeaux[:, k]
+
+    poids = np.array([POIDS[r["niveau"]] for r in actives])
+    out["score"] = drapeaux @ poids if actives else 0.0
+
+    rouge = drapeaux[:, [r["niveau"] == "rouge" for r in actives]].any(axis=1)
+    jaune = drapeaux[:, [r["niveau"] == "jaune" for r in actives]].any(axis=1)
+    vert_fonce = (out["warming_max"] <= HORIZON_VERT_FONCE).to_numpy(dtype=bool)
+
+    out["couleur"] = np.select(
+        [rouge, jaune, vert_fonce], ["rouge", "jaune", "vert_fonce"], default="vert")
+    return out
+
+
+def synthese_modeles(scores, tableau=None):
+    """Par modèle : nombre d'événements par couleur et fiabilité (%), + verdicts du tableau."""
+    comptes = pd.crosstab(scores["modele"], scores["couleur"])
+    for c in ["rouge", "jaune", "vert", "vert_fonce"]:
+        if c not in comptes:
+            comptes[c] = 0
+    comptes = comptes[["rouge", "jaune", "vert", "vert_fonce"]]
+    comptes["n"] = comptes.sum(axis=1)
+    comptes["fiabilite_pct"] = 100 * (comptes["vert"] + comptes["vert_fonce"]) / comptes["n"]
+    comptes["score_moyen"] = scores.groupby("modele", observed=True)["score"].mean()
+    if tableau is not None:
+        comptes = comptes.join(tableau.add_suffix("_tableau"))
+    return comptes
+
+
+def fiabilite_par_rechauffement(scores):
+    """Fraction d'événements fiables par niveau de réchauffement (libellé du tableau)."""
+    fiable = scores["couleur"].isin(["vert", "vert_fonce"])
+    return (scores.assign(fiable=fiable)
+                  .groupby("niveau", observed=True)["fiable"]
+                  .agg(n="count", fiabilite_pct=lambda s: 100 * s.mean()))
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    os.makedirs(path_out, exist_ok=True)
+
+    df = charger_inventaire()
+    df = joindre_metriques(df, metriques_modeles())
+    print(f"{len(df)} événements, {df['modele'].nunique()} modèles")
+
+    scores = scorer(df)
+    modeles = synthese_modeles(scores, fiabilite_tableau())
+    rechauffement = fiabilite_par_rechauffement(scores)
+
+    scores.to_csv(os.path.join(path_out, "coherence_evenements.csv"), index=False)
+    modeles.to_csv(os.path.join(path_out, "coherence_modeles.csv"))
+    rechauffement.to_csv(os.path.join(path_out, "fiabilite_rechauffement.csv"))
+
+    print("\n--- Synthèse par modèle ---")
+    print(modeles.round(1))
+    print("\n--- Fiabilité par niveau de réchauffement ---")
+    print(rechauffement.round(1))
@@ -0,0 +1,251 @@
+import os
+import sys
+
+# =========================================================
+# CONFIGURATION COMMUNE
+# =========================================================
+# Chemins et liste des modèles partagés par les scripts d'analyse.
+
+base_path = "/home/florent/Documents/ENM_3A/Tx50/Tx50/data/"
+
+path_brut = os.path.join(base_path, "brut/")
+path_cor  = os.path.join(base_path, "cor/")
+path_obs  = os.path.join(base_path, "obs/")
+
+file_obs = "txx_France-Metro_SAFRAN_year_1959-2024.nc"
+
+model_files = [
+    "txx_CNRM-CM5_ALADIN63.nc", "txx_CNRM-CM5_HadREM3-GA7-05.nc",
+    "txx_EC-EARTH_HadREM3-GA7-05.nc", "txx_EC-EARTH_RACMO22E.nc",
+    "txx_EC-EARTH_RCA4.nc", "txx_HadGEM2-ES_ALADIN63.nc",
+    "txx_HadGEM2-ES_CCLM4-8-17.nc", "txx_HadGEM2-ES_HadREM3-GA7-05.nc",
+    "txx_HadGEM2-ES_RegCM4-6.nc", "txx_IPSL-CM5A-MR_HIRHAM5.nc",
+    "txx_IPSL-CM5A-MR_RCA4.nc", "txx_MPI-ESM-LR_CLMcom-CCLM4-8-17.nc",
+    "txx_MPI-ESM-LR_RegCM4-6.nc", "txx_MPI-ESM-LR_REMO2009.nc",
+    "txx_NorESM1-M_HIRHAM5.nc", "txx_NorESM1-M_REMO2015.nc",
+    "txx_NorESM1-M_WRF381P.nc"
+]
+
+VAR_NAMES = ['tasmax', 'tx', 'tasmaxAdjust']
+
+# Périodes nommées (années incluses) : observations SAFRAN, référence
+# CMIP5, horizon pivot RCP8.5 et fin de siècle
+PERIODES = {
+    "obs":        (1959, 2024),
+    "reference":  (1976, 2005),
+    "pivot":      (2046, 2065),
+    "fin_siecle": (2071, 2100),
+}
+
+# Politique de types : champs décodés en float32 pour le calcul (erreur
+# relative ~1e-7, très en deçà du 0.01 °C des données), sommes et sommes
+# de carrés accumulées en float64, stockage NetCDF en int16 au 1/100 °C,
+# masques de dépassement stockés en bits (np.packbits).
+DTYPE_CALCUL = "float32"
+DTYPE_ACCUMULATION = "float64"
+
+ECHELLE_INT16 = 0.01        # °C par unité stockée (±327 °C)
+FILL_INT16 = -32768
+
+# Préchargement des fichiers modèles : paires brut / cor suivantes décodées
+# en arrière-plan pendant le calcul de la paire courante, au plus
+# PREFETCH_MODELES d'avance et dans la limite de BUDGET_PREFETCH octets
+# (paire courante comprise)
+PREFETCH_MODELES = 2
+BUDGET_PREFETCH = 2 * 1024 ** 3
+
+# Grille sans lon/lat : positions en indices de maille x taille (km)
+TAILLE_MAILLE_KM = 8.0
+
+# =========================================================
+# FONCTIONS UTILITAIRES
+# =========================================================
+
+def model_name(filename):
+    """Nom court du modèle : 'txx_CNRM-CM5_ALADIN63.nc' -> 'CNRM-CM5_ALADIN63'."""
+    return filename.replace("txx_", "").replace(".nc", "")
+
+
+def to_year_index(da):
+    """Force l'axe temporel en années."""
+    if 'time' not in da.coords:
+        return da
+    try:
+        return da.assign_coords(time=da.time.dt.year)
+    except Exception:
+        return da
+
+
+def ouvrir_champ(path, filename):
+    """
+    Ouvre un NetCDF sans lire les données (lecture paresseuse, bloc par
+    bloc avec isel) : variable Tx, temps en années. None si absent ou illisible.
+    """
+    full_path = os.path.join(path, filename)
+    if not os.path.exists(full_path):
+        return None
+
+    # Import local : les étapes sans NetCDF (inventaire, cohérence)
+    # n'ont pas à payer le coût d'import de xarray
+    import xarray as xr
+
+    try:
+        ds = xr.open_dataset(full_path, decode_times=True)
+    except (OSError, ValueError) as e:
+        print(f"{filename} -> lecture impossible : {e}")
+        return None
+
+    var_name = next((v for v in VAR_NAMES if v in ds), None)
+    if var_name is None:
+        print(f"{filename} -> aucune variable parmi {VAR_NAMES}")
+        return None
+
+    return to_year_index(ds[var_name])
+
+
+def en_celsius(da):
+    """Champ (ou bloc d'années) -> float32 en °C ; lit les données s'il est paresseux."""
+    da = da.astype(DTYPE_CALCUL)
+    if da.mean() > 200:
+        da = da - 273.15
+    return da
+
+
+def load_and_clean(path, filename):
+    """Charge un NetCDF en float32, convertit en °C et simplifie le temps."""
+    da = ouvrir_champ(path, filename)
+    return None if da is None else en_celsius(da)
+
+
+def _charger_paire(filename, dossiers):
+    """Fichiers du modèle dans chaque dossier, décodés en mémoire (None si absent)."""
+    das = [load_and_clean(d, filename) for d in dossiers]
+    return [None if da is None else da.load() for da in das]
+
+
+def paires_modeles(filenames=None, dossiers=None, profondeur=PREFETCH_MODELES,
+                   budget=BUDGET_PREFETCH):
+    """
+    Itère (filename, da_brut, da_cor) (un champ par dossier, brut / cor par
+    défaut) en décodant les modèles suivants sur un pool de threads pendant
+    que l'appelant traite le modèle courant. L'avance est limitée à
+    `profondeur` modèles et au budget mémoire, estimé sur la plus grosse
+    paire déjà reçue.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    filenames = iter(model_files if filenames is None else filenames)
+    dossiers = (path_brut, path_cor) if dossiers is None else tuple(dossiers)
+
+    with ThreadPoolExecutor(max_workers=max(1, profondeur)) as pool:
+        en_cours = deque()
+
+        def completer(n):
+            while len(en_cours) < n:
+                filename = next(filenames, None)
+                if filename is None:
+                    return
+                en_cours.append((filename, pool.submit(_charger_paire, filename, dossiers)))
+
+        completer(1)
+        taille = 0
+        while en_cours:
+            filename, futur = en_cours.popleft()
+            champs = futur.result()
+            taille = max(taille, sum(da.nbytes for da in champs if da is not None))
+            avance = profondeur if taille == 0 else min(profondeur, budget // taille - 1)
+            completer(avance)
+            yield (filename, *champs)
+            completer(1)
+
+
+def encodage_int16(*noms):
+    """Encodage NetCDF int16 (échelle 0.01, NaN -> FILL_INT16) des variables données."""
+    return {nom: {"dtype": "int16", "scale_factor": ECHELLE_INT16, "add_offset": 0.0,
+                  "_FillValue": FILL_INT16} for nom in noms}
+
+
+def empaqueter_masque(masque):
+    """Masque booléen -> octets (8 valeurs par octet, dernier axe) et longueur de cet axe."""
+    import numpy as np
+    masque = np.asarray(masque, dtype=bool)
+    return np.packbits(masque, axis=-1), masque.shape[-1]
+
+
+def depaqueter_masque(octets, n):
+    """Inverse de empaqueter_masque."""
+    import numpy as np
+    return np.unpackbits(np.asarray(octets, dtype=np.uint8), axis=-1, count=n).astype(bool)
+
+
+# =========================================================
+# GÉOMÉTRIE DE GRILLE
+# =========================================================
+
+def grille_lonlat(da):
+    """Longitudes / latitudes 2D des points de grille de da."""
+    import numpy as np
+
+    lon_name = next((c for c in ["lon", "longitude", "nav_lon"] if c in da.coords), None)
+    lat_name = next((c for c in ["lat", "latitude", "nav_lat"] if c in da.coords), None)
+    if lon_name is None or lat_name is None:
+        raise ValueError("Coordonnées lon/lat absentes de la grille")
+
+    lon, lat = da[lon_name].values, da[lat_name].values
+    if lon.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+    return lon, lat
+
+
+def positions(da):
+    """
+    Position (n_points, 3) de chaque point de grille : vecteur unitaire
+    si lon/lat disponibles (sphérique), sinon plan en km.
+    """
+    import numpy as np
+
+    try:
+        lon, lat = grille_lonlat(da)
+    except ValueError:
+        dims = [d for d in da.dims if d != "time"]
+        jj, ii = np.meshgrid(np.arange(da.sizes[dims[1]]), np.arange(da.sizes[dims[0]]))
+        pos = np.column_stack([jj.ravel(), ii.ravel(), np.zeros(jj.size)]) * TAILLE_MAILLE_KM
+        return pos, False
+
+    lon, lat = np.radians(lon.ravel()), np.radians(lat.ravel())
+    pos = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    return pos, True
+
+# =========================================================
+# TRACÉ
+# =========================================================
+
+def pyplot():
+    """
+    Import paresseux de matplotlib.pyplot, réservé aux étapes de tracé.
+    Sans écran (batch, ssh) le backend non interactif Agg est choisi.
+    """
+    import matplotlib
+    if ("MPLBACKEND" not in os.environ and not os.environ.get("DISPLAY")
+            and sys.platform.startswith("linux")):
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def align_spatial(da, da_ref):
+    """Aligne les dimensions spatiales de da sur da_ref."""
+    dims_ref = [d for d in da_ref.dims if d != 'time']
+    dims_da  = [d for d in da.dims if d != 'time']
+
+    if len(dims_ref) != 2 or len(dims_da) != 2:
+        return None
+
+    da = da.rename({dims_da[0]: dims_ref[0], dims_da[1]: dims_ref[1]})
+    da = da.assign_coords({
+        dims_ref[0]: da_ref[dims_ref[0]],
+        dims_ref[1]: da_ref[dims_ref[1]]
+    })
+
+    return da
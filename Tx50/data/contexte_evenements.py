@@ -0,0 +1,207 @@
+import xarray as xr
+import numpy as np
+import glob
+import os
+
+from commun import base_path
+from inventaire import charger_inventaire
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Extraction, autour de chaque date de dépassement Tx50, de fenêtres
+# temporelles (± DEMI_FENETRE jours) des champs de contexte (Z500,
+# humidité, sécheresse...) dans les fichiers journaliers DRIAS/CMIP.
+# Seuls les pas de temps utiles sont lus, jamais le fichier entier.
+
+path_journalier = os.path.join(base_path, "journalier/")
+path_out = os.path.join(base_path, "contexte_evenements/")
+path_cache = os.path.join(base_path, "cache_contexte/")
+
+# Motif des fichiers journaliers : une variable, un modèle
+DAILY_FILE_PATTERN = "{var}_*{model}*_day*.nc"
+
+# Variables de contexte (noms CMIP/DRIAS)
+VARIABLES_CONTEXTE = ["zg500", "hurs", "huss", "mrso", "tasmax"]
+
+DEMI_FENETRE = 15
+
+# Cache disque des fenêtres extraites (.npy relus en mémoire mappée)
+USE_CACHE = True
+
+# =========================================================
+# LECTURES INDEXÉES
+# =========================================================
+
+def trouver_fichier(var, model):
+    """Fichier journalier de la variable pour le modèle (None si absent)."""
+    pattern = os.path.join(path_journalier, DAILY_FILE_PATTERN.format(var=var, model=model))
+    files = sorted(glob.glob(pattern))
+    return files[0] if files else None
+
+
+def cles_temps(da):
+    """Clés entières AAAAMMJJ de l'axe temps (datetime64 ou cftime)."""
+    t = da.time.dt
+    return (t.year.values * 10000 + t.month.values * 100 + t.day.values).astype(np.int64)
+
+
+def cle_date(date):
+    """'AAAA-MM-JJ' -> AAAAMMJJ."""
+    return int(date.replace("-", ""))
+
+
+def chunk_temps(da):
+    """Taille des chunks sur disque le long du temps (1 si non chunké)."""
+    chunks = da.encoding.get("chunksizes")
+    if not chunks:
+        return 1
+    return int(chunks[da.dims.index("time")])
+
+
+def regrouper_lectures(centres, demi_fenetre, n_time, chunk_t):
+    """
+    Fusionne les fenêtres [c - w, c + w] en plages de lecture contiguës.
+    Les bornes sont alignées sur les chunks disque pour ne jamais
+    décompresser deux fois le même chunk.
+    Retourne [(debut, fin, [indices des événements])].
+    """
+    ordre = np.argsort(centres)
+    lectures = []
+    for k in ordre:
+        c = centres[k]
+        d0 = max(c - demi_fenetre, 0) // chunk_t * chunk_t
+        d1 = min(-(-(c + demi_fenetre + 1) // chunk_t) * chunk_t, n_time)
+        if lectures and d0 <= lectures[-1][1]:
+            lectures[-1][1] = max(lectures[-1][1], d1)
+            lectures[-1][2].append(k)
+        else:
+            lectures.append([d0, d1, [k]])
+    return lectures
+
+
+def _cache_file(model, var, date, demi_fenetre):
+    return os.path.join(path_cache, f"{var}_{model}_{date}_w{demi_fenetre}.npy")
+
+
+def extraire_fenetres(model, var, dates, demi_fenetre=DEMI_FENETRE, use_cache=USE_CACHE):
+    """
+    Fenêtres (2 * demi_fenetre + 1, y, x) de var autour de chaque date.
+    Les jours hors fichier sont à NaN. Retourne {date: np.ndarray} ou None.
+    """
+    fenetres = {}
+    a_lire = []
+    for date in dates:
+        cf = _cache_file(model, var, date, demi_fenetre)
+        if use_cache and os.path.exists(cf):
+            fenetres[date] = np.load(cf, mmap_mode="r")
+        else:
+            a_lire.append(date)
+
+    if not a_lire:
+        return fenetres
+
+    fichier = trouver_fichier(var, model)
+    if fichier is None:
+        print(f" -> Pas de fichier {var} pour {model}")
+        return fenetres or None
+
+    ds = xr.open_dataset(fichier, decode_times=True)
+    if var not in ds:
+        ds.close()
+        return fenetres or None
+    da = ds[var]
+
+    cles = cles_temps(da)
+    n_time = len(cles)
+    centres = np.searchsorted(cles, [cle_date(d) for d in a_lire])
+    present = (centres < n_time) & (cles[np.minimum(centres, n_time - 1)]
+                                    == [cle_date(d) for d in a_lire])
+
+    largeur = 2 * demi_fenetre + 1
+    spatial = [da.sizes[d] for d in da.dims if d != "time"]
+
+    for d0, d1, membres in regrouper_lectures(centres, demi_fenetre, n_time, chunk_temps(da)):
+        bloc = da.isel(time=slice(d0, d1)).values
+        for k in membres:
+            date = a_lire[k]
+            if not present[k]:
+                print(f" -> {date} absente de {os.path.basename(fichier)}")
+                continue
+
+            out = np.full([largeur] + spatial, np.nan, dtype=bloc.dtype)
+            c = centres[k]
+            lo = max(c - demi_fenetre, 0)
+            hi = min(c + demi_fenetre + 1, n_time)
+            out[lo - (c - demi_fenetre):hi - (c - demi_fenetre)] = bloc[lo - d0:hi - d0]
+
+            if use_cache:
+                os.makedirs(path_cache, exist_ok=True)
+                cf = _cache_file(model, var, date, demi_fenetre)
+                np.save(cf, out)
+                out = np.load(cf, mmap_mode="r")
+            fenetres[date] = out
+
+    ds.close()
+    return fenetres
+
+
+def composite(fenetres):
+    """Moyenne des fenêtres alignées sur le jour de l'événement."""
+    if not fenetres:
+        return None
+    return np.nanmean(np.stack(list(fenetres.values())), axis=0)
+
+# =========================================================
+# EXTRACTION COMPLÈTE
+# =========================================================
+
+def extraire_contexte(evenements, variables=VARIABLES_CONTEXTE, demi_fenetre=DEMI_FENETRE):
+    """Extrait et sauve fenêtres + composite par (modèle, variable)."""
+    par_modele = {}
+    for model, date in evenements:
+        par_modele.setdefault(model, []).append(date)
+
+    lags = np.arange(-demi_fenetre, demi_fenetre + 1)
+
+    for model, dates in par_modele.items():
+        dates = sorted(set(dates))
+        print(f"\n--- {model} : {len(dates)} événements ---")
+
+        for var in variables:
+            fenetres = extraire_fenetres(model, var, dates, demi_fenetre)
+            if not fenetres:
+                continue
+
+            ev = sorted(fenetres)
+            data = np.stack([fenetres[d] for d in ev])
+            spatial = [f"dim_{i}" for i in range(data.ndim - 2)]
+
+            ds_out = xr.Dataset(
+                data_vars={
+                    var: (["event", "lag"] + spatial, data),
+                    f"{var}_composite": (["lag"] + spatial, composite(fenetres)),
+                },
+                coords={"event": ev, "lag": lags},
+            )
+            ds_out.attrs["comment"] = (f"Fenêtres ±{demi_fenetre} j autour des dates "
+                                       f"de dépassement Tx50 ({model}).")
+
+            out = os.path.join(path_out, f"contexte_{var}_{model}.nc")
+            ds_out.to_netcdf(out)
+            print(f" -> {var} : {len(ev)} fenêtres -> {out}")
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    os.makedirs(path_out, exist_ok=True)
+
+    df = charger_inventaire()
+    evenements = list(zip(df["modele"].astype(str), df["date"].dt.strftime("%Y-%m-%d")))
+    print(f"{len(evenements)} événements dans l'inventaire")
+
+    extraire_contexte(evenements)
+
+    print("\n--- Extraction du contexte terminée ---")
@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from commun import (base_path, path_brut, path_cor, PERIODES,
+                    model_files, model_name, load_and_clean, align_spatial,
+                    encodage_int16)
+from obs_partage import charger_obs
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Réimplémentation locale de la correction de biais (quantile mapping)
+# calibrée sur SAFRAN, point de grille par point de grille, pour
+# reproduire / éprouver la correction DRIAS (tasmaxAdjust) :
+# élévation des Tx, valeurs au-delà de 50°C, écart à DRIAS.
+
+path_out = os.path.join(base_path, "correction_qm/")
+
+PERIODE_CALIBRATION = PERIODES["reference"]
+
+# "qm"  : quantile mapping empirique (fonction de transfert fixe)
+# "qdm" : quantile delta mapping, conserve le signal de changement du
+#         modèle par fenêtre glissante (esprit CDF-t)
+METHODE = "qm"
+
+# Hors de la plage de calibration (queue au-delà du max de la période de
+# référence) : "additive" (écart du dernier quantile), "lineaire" (pente
+# des deux derniers quantiles) ou "bornee" (valeur obs extrême)
+EXTRAPOLATION = "additive"
+
+# Fenêtre (années) sur laquelle les rangs sont calculés en mode "qdm"
+FENETRE_QDM = 30
+
+SEUIL_QUEUE = 50.0
+
+N_PROCESS = 4
+
+# Écrit les champs corrigés (txx_<modèle>.nc) en plus du résumé
+ECRIRE_CHAMPS = True
+
+# =========================================================
+# CORRECTION (vectorisée sur les points de grille)
+# =========================================================
+
+def noeuds_quantiles(ref, n_q):
+    """Quantiles (n_q, n_points) de la période de calibration, NaN ignorés."""
+    p = np.linspace(0.0, 1.0, n_q)
+    with np.errstate(invalid="ignore"):
+        return np.nanquantile(ref, p, axis=0)
+
+
+def _interpoler(q_from, q_to, x, extrapolation):
+    """
+    Fonction de transfert q_from -> q_to appliquée à une ligne x
+    (n_points,), chaque colonne ayant ses propres noeuds.
+    """
+    n_q = q_from.shape[0]
+    idx = (q_from <= x).sum(axis=0)
+    lo = np.clip(idx - 1, 0, n_q - 2)[None]
+    m_lo = np.take_along_axis(q_from, lo, 0)[0]
+    m_hi = np.take_along_axis(q_from, lo + 1, 0)[0]
+    o_lo = np.take_along_axis(q_to, lo, 0)[0]
+    o_hi = np.take_along_axis(q_to, lo + 1, 0)[0]
+
+    dm = m_hi - m_lo
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(dm > 0, (x - m_lo) / dm, 0.0)
+    y = o_lo + t * (o_hi - o_lo)
+
+    if extrapolation == "lineaire":
+        return y
+
+    bas, haut = idx == 0, idx == n_q
+    if extrapolation == "additive":
+        y = np.where(bas, x + (q_to[0] - q_from[0]), y)
+        y = np.where(haut, x + (q_to[-1] - q_from[-1]), y)
+    elif extrapolation == "bornee":
+        y = np.where(bas, q_to[0], y)
+        y = np.where(haut, q_to[-1], y)
+    else:
+        raise ValueError(f"Extrapolation inconnue : {extrapolation}")
+    return y
+
+
+def quantile_mapping(x, q_mod, q_obs, extrapolation=EXTRAPOLATION):
+    """x (n_temps, n_points) -> valeurs corrigées, ligne par ligne."""
+    out = np.full(x.shape, np.nan)
+    for it in range(x.shape[0]):
+        out[it] = _interpoler(q_mod, q_obs, x[it], extrapolation)
+    return np.where(np.isfinite(x), out, np.nan)
+
+
+def _quantile_noeuds(q, p):
+    """Quantile p (n_points,) interpolé sur les noeuds q (n_q, n_points)."""
+    f = p * (q.shape[0] - 1)
+    lo = np.clip(np.floor(f).astype(int), 0, q.shape[0] - 2)
+    t = f - lo
+    a = np.take_along_axis(q, lo[None], 0)[0]
+    b = np.take_along_axis(q, lo[None] + 1, 0)[0]
+    return a + t * (b - a)
+
+
+def quantile_delta_mapping(x, years, q_mod, q_obs, debut=PERIODE_CALIBRATION[0],
+                           fenetre=FENETRE_QDM):
+    """
+    Par fenêtre de `fenetre` années : rang de chaque valeur dans la fenêtre,
+    puis correction x + Qobs(p) - Qmod(p) au même niveau de probabilité.
+    """
+    out = np.full(x.shape, np.nan)
+    blocs = (np.asarray(years) - debut) // fenetre
+    for b in np.unique(blocs):
+        sel = np.flatnonzero(blocs == b)
+        xb = x[sel]
+        ok = np.isfinite(xb)
+        n_ok = np.maximum(ok.sum(axis=0), 1)
+        # NaN classés en dernier par argsort : rangs des valeurs valides inchangés
+        rangs = np.argsort(np.argsort(np.where(ok, xb, np.inf), axis=0), axis=0)
+        p = np.clip((rangs + 0.5) / n_ok, 0.0, 1.0)
+        for i, it in enumerate(sel):
+            out[it] = xb[i] + _quantile_noeuds(q_obs, p[i]) - _quantile_noeuds(q_mod, p[i])
+    return np.where(np.isfinite(x), out, np.nan)
+
+
+def corriger(x, years, mod_ref, obs_ref, methode=METHODE, extrapolation=EXTRAPOLATION):
+    """Correction de x (n_temps, n_points) calibrée sur mod_ref / obs_ref."""
+    n_q = max(mod_ref.shape[0], 2)
+    q_mod = noeuds_quantiles(mod_ref, n_q)
+    q_obs = noeuds_quantiles(obs_ref, n_q)
+    if methode == "qm":
+        return quantile_mapping(x, q_mod, q_obs, extrapolation)
+    if methode == "qdm":
+        return quantile_delta_mapping(x, years, q_mod, q_obs)
+    raise ValueError(f"Méthode inconnue : {methode}")
+
+# =========================================================
+# ÉVALUATION PAR MODÈLE (un processus par modèle)
+# =========================================================
+
+def evaluer_modele(filename, methode=METHODE, extrapolation=EXTRAPOLATION,
+                   ecrire=ECRIRE_CHAMPS):
+    """Correction QM d'un modèle et comparaison à DRIAS ; None si impossible."""
+    model = model_name(filename)
+    da_obs = charger_obs()
+    da_b = load_and_clean(path_brut, filename)
+    da_c = load_and_clean(path_cor, filename)
+    if da_obs is None or da_b is None or da_c is None:
+        return None
+
+    years = sorted(set(da_b.time.values) & set(da_c.time.values))
+    da_b = align_spatial(da_b.sel(time=years), da_obs)
+    da_c = align_spatial(da_c.sel(time=years), da_obs)
+    if da_b is None or da_c is None:
+        return None
+
+    debut, fin = PERIODE_CALIBRATION
+    ref = [y for y in years if debut <= y <= fin and y in set(da_obs.time.values)]
+    if len(ref) < 2:
+        return None
+
+    n_years = len(years)
+    b = da_b.values.reshape(n_years, -1)
+    c = da_c.values.reshape(n_years, -1)
+    o_ref = da_obs.sel(time=ref).values.reshape(len(ref), -1)
+    b_ref = b[np.searchsorted(years, ref)]
+
+    qm = corriger(b, years, b_ref, o_ref, methode, extrapolation)
+
+    if ecrire:
+        out = da_b.copy(data=qm.reshape(da_b.shape).astype(np.float32))
+        out.name = "tasmaxQM"
+        out.attrs = {"units": "degC", "methode": methode, "extrapolation": extrapolation,
+                     "calibration": f"{debut}-{fin}"}
+        os.makedirs(path_out, exist_ok=True)
+        out.to_netcdf(os.path.join(path_out, filename), encoding=encodage_int16(out.name))
+
+    hors_plage = b > np.nanmax(b_ref, axis=0)
+    ecart = qm - c
+    with np.errstate(invalid="ignore"):
+        res = {
+            "modele": model,
+            "rmse_qm_drias": np.sqrt(np.nanmean(ecart ** 2)),
+            "biais_qm_drias": np.nanmean(ecart),
+            "elevation_drias": np.nanmean(c - b),
+            "elevation_qm": np.nanmean(qm - b),
+            "max_brut": np.nanmax(b),
+            "max_drias": np.nanmax(c),
+            "max_qm": np.nanmax(qm),
+            f"n_sup{SEUIL_QUEUE:g}_brut": int((b > SEUIL_QUEUE).sum()),
+            f"n_sup{SEUIL_QUEUE:g}_drias": int((c > SEUIL_QUEUE).sum()),
+            f"n_sup{SEUIL_QUEUE:g}_qm": int((qm > SEUIL_QUEUE).sum()),
+            "frac_extrapolee": hors_plage.sum() / max(np.isfinite(b).sum(), 1),
+        }
+    return res
+
+
+def evaluer_tous(methode=METHODE, extrapolation=EXTRAPOLATION, n_process=N_PROCESS):
+    """Tous les modèles dans le pool de processus ; DataFrame indexé par modèle."""
+    n = len(model_files)
+    with ProcessPoolExecutor(max_workers=n_process) as pool:
+        resultats = list(pool.map(evaluer_modele, model_files,
+                                  [methode] * n, [extrapolation] * n))
+
+    for filename, res in zip(model_files, resultats):
+        if res is None:
+            print(f"{model_name(filename)} -> Fichier manquant ou calibration impossible")
+    lignes = [r for r in resultats if r is not None]
+    if not lignes:
+        raise RuntimeError("Aucun modèle corrigé")
+    return pd.DataFrame(lignes).set_index("modele")
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    df = evaluer_tous()
+
+    os.makedirs(path_out, exist_ok=True)
+    out_csv = os.path.join(path_out, f"resume_{METHODE}_{EXTRAPOLATION}.csv")
+    df.to_csv(out_csv)
+
+    pd.set_option("display.width", 200)
+    print(df.round(3))
+    print(f"\n-> Résumé écrit : {out_csv}")
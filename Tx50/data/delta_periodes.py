@@ -0,0 +1,237 @@
+import xarray as xr
+import numpy as np
+import pandas as pd
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from commun import (base_path, path_brut, path_cor, DTYPE_ACCUMULATION, DTYPE_CALCUL,
+                    model_files, model_name, paires_modeles)
+from distrib_tmax import periodes_modele
+from obs_partage import charger_obs
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Statistiques par période nommée (commun.PERIODES + fenêtres propres au
+# modèle) et par point de grille : moyenne, écart-type, quantiles,
+# fréquences de dépassement, et leurs écarts à la période de référence.
+# Une passe par fichier, par blocs d'années, relève les sommes cumulées aux
+# bornes des périodes ; moyenne / écart-type / fréquences d'une période sont
+# alors deux soustractions, quelle que soit sa longueur. Seuls les quantiles
+# relisent les années de la période.
+
+path_out = os.path.join(base_path, "delta_periodes/")
+
+PERIODE_REFERENCE = "reference"
+
+SEUILS_FREQUENCE = [35.0, 40.0, 45.0, 50.0]   # °C
+
+QUANTILES_CELLULE = [0.5, 0.9, 0.99]
+
+# Années lues à la fois
+CHUNK_YEARS = 10
+
+SOURCE_OBS = "SAFRAN"
+
+# =========================================================
+# MOTEUR
+# =========================================================
+
+def cumuls(lire, n_t, n_c, bornes, seuils=SEUILS_FREQUENCE, chunk_years=CHUNK_YEARS):
+    """
+    Une passe par blocs d'années : lire(i0, i1) -> valeurs (i1 - i0, n_cellules),
+    le bloc suivant lu dans un thread pendant le traitement du courant. Seuls
+    les totaux cumulés aux indices `bornes` sont gardés : la période [i0, i1[
+    vaut C[i1] - C[i0]. count / depasse en int32, sum / sumsq en float64.
+    """
+    seuils = np.asarray(seuils, dtype=DTYPE_CALCUL)
+    bornes = sorted({int(i) for i in bornes})
+    total = {
+        "count": np.zeros(n_c, dtype=np.int32),
+        "sum": np.zeros(n_c, dtype=DTYPE_ACCUMULATION),
+        "sumsq": np.zeros(n_c, dtype=DTYPE_ACCUMULATION),
+        "depasse": np.zeros((len(seuils), n_c), dtype=np.int32),
+    }
+    cum = {stat: np.zeros((len(bornes),) + t.shape, dtype=t.dtype) for stat, t in total.items()}
+    cum["indice"] = {i: k for k, i in enumerate(bornes)}
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        suivant = pool.submit(lire, 0, min(chunk_years, n_t)) if n_t else None
+        for i0 in range(0, n_t, chunk_years):
+            i1 = min(i0 + chunk_years, n_t)
+            x = suivant.result()
+            if i1 < n_t:
+                suivant = pool.submit(lire, i1, min(i1 + chunk_years, n_t))
+            ok = np.isfinite(x)
+            x0 = np.where(ok, x, 0)
+            with np.errstate(invalid="ignore"):
+                dep = x[:, None, :] >= seuils[None, :, None]
+            # Cumul du bloc, relevé aux bornes qui y tombent, puis reporté
+            bloc = {
+                "count": np.cumsum(ok, axis=0, dtype=np.int32),
+                "sum": np.cumsum(x0, axis=0, dtype=DTYPE_ACCUMULATION),
+                "sumsq": np.cumsum(np.square(x0, dtype=DTYPE_ACCUMULATION), axis=0),
+                "depasse": np.cumsum(dep, axis=0, dtype=np.int32),
+            }
+            for i in bornes:
+                if i0 < i <= i1:
+                    for stat, c in bloc.items():
+                        cum[stat][cum["indice"][i]] = total[stat] + c[i - i0 - 1]
+            for stat, c in bloc.items():
+                total[stat] += c[-1]
+    return cum
+
+
+def bornes_periodes(years, periodes):
+    """{nom: (i0, i1)} : indices des années [y0, y1] dans l'axe trié `years`."""
+    years = np.asarray(years)
+    return {nom: (int(np.searchsorted(years, y0, side="left")),
+                  int(np.searchsorted(years, y1, side="right")))
+            for nom, (y0, y1) in periodes.items()}
+
+
+def stats_periode(cum, lire, i0, i1, quantiles=QUANTILES_CELLULE):
+    """
+    Statistiques par cellule des années [i0, i1[ (NaN si aucune valeur).
+    Les quantiles relisent la période seule par lire(i0, i1).
+    """
+    k0, k1 = cum["indice"][i0], cum["indice"][i1]
+    n = (cum["count"][k1] - cum["count"][k0]).astype(DTYPE_ACCUMULATION)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        moyenne = (cum["sum"][k1] - cum["sum"][k0]) / n
+        var = (cum["sumsq"][k1] - cum["sumsq"][k0]) / n - moyenne ** 2
+        frequence = (cum["depasse"][k1] - cum["depasse"][k0]) / n
+
+    if i1 > i0:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            q = np.nanquantile(lire(i0, i1), quantiles, axis=0)
+    else:
+        q = np.full((len(quantiles), len(n)), np.nan)
+
+    return {
+        "n_annees": n,
+        "moyenne": moyenne,
+        "ecart_type": np.sqrt(np.maximum(var, 0)),
+        "quantile": q,
+        "frequence": frequence,
+    }
+
+
+def periodes_champ(da, periodes, seuils=SEUILS_FREQUENCE, quantiles=QUANTILES_CELLULE,
+                   reference=PERIODE_REFERENCE, chunk_years=CHUNK_YEARS):
+    """
+    Champ (time=années, y, x) -> Dataset (periode, [quantile | seuil], y, x)
+    des statistiques par période et de leurs écarts (delta_*) à `reference`.
+    """
+    da = da.sortby("time")
+    years = np.asarray(da.time.values)
+    dims = [d for d in da.dims if d != "time"]
+    forme = [da.sizes[d] for d in dims]
+
+    # Blocs lus par isel : le champ n'est jamais chargé en entier
+    def lire(i0, i1):
+        return da.isel(time=slice(i0, i1)).transpose("time", *dims).values.reshape(i1 - i0, -1)
+
+    bornes = bornes_periodes(years, periodes)
+    cum = cumuls(lire, len(years), int(np.prod(forme)),
+                 [i for b in bornes.values() for i in b], seuils, chunk_years)
+    noms = list(periodes)
+    res = [stats_periode(cum, lire, i0, i1, quantiles) for i0, i1 in bornes.values()]
+
+    def empiler(cle, extra=()):
+        return np.stack([r[cle] for r in res]).reshape(len(noms), *extra, *forme).astype(DTYPE_CALCUL)
+
+    ds = xr.Dataset(
+        data_vars={
+            "n_annees": (["periode"] + dims, empiler("n_annees")),
+            "moyenne": (["periode"] + dims, empiler("moyenne")),
+            "ecart_type": (["periode"] + dims, empiler("ecart_type")),
+            "quantiles": (["periode", "quantile"] + dims, empiler("quantile", (len(quantiles),))),
+            "frequence": (["periode", "seuil"] + dims, empiler("frequence", (len(seuils),))),
+        },
+        coords={"periode": noms, "quantile": list(quantiles), "seuil": list(seuils),
+                **{d: da[d] for d in dims if d in da.coords}},
+    )
+    if reference in noms:
+        for v in ["moyenne", "ecart_type", "quantiles", "frequence"]:
+            ds[f"delta_{v}"] = ds[v] - ds[v].sel(periode=reference)
+    return ds
+
+# =========================================================
+# SORTIES
+# =========================================================
+
+def resume(ds, source, version):
+    """Moyennes spatiales par période : une ligne par période."""
+    dims = [d for d in ds["moyenne"].dims if d != "periode"]
+    m = ds.mean(dim=dims, skipna=True)
+    lignes = []
+    for p in ds.periode.values:
+        mp = m.sel(periode=p)
+        ligne = {"source": source, "version": version, "periode": str(p),
+                 "n_annees_max": float(ds["n_annees"].sel(periode=p).max()),
+                 "moyenne": float(mp["moyenne"]), "ecart_type": float(mp["ecart_type"])}
+        for q in ds["quantile"].values:
+            ligne[f"q{int(round(q * 100))}"] = float(mp["quantiles"].sel(quantile=q))
+        for s in ds["seuil"].values:
+            ligne[f"freq_{s:g}"] = float(mp["frequence"].sel(seuil=s))
+        if "delta_moyenne" in mp:
+            ligne["delta_moyenne"] = float(mp["delta_moyenne"])
+            for s in ds["seuil"].values:
+                ligne[f"delta_freq_{s:g}"] = float(mp["delta_frequence"].sel(seuil=s))
+        lignes.append(ligne)
+    return lignes
+
+
+def traiter_source(source, champs, periodes):
+    """champs {version: DataArray} -> .nc par source (dimension version) et lignes du résumé."""
+    blocs, lignes = [], []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for version, da in champs.items():
+            if da is None:
+                continue
+            ds = periodes_champ(da, periodes)
+            blocs.append(ds.expand_dims(version=[version]))
+            lignes += resume(ds, source, version)
+    if not blocs:
+        return []
+
+    out = os.path.join(path_out, f"periodes_{source}.nc")
+    ds = xr.concat(blocs, dim="version")
+    ds.attrs["periodes"] = "; ".join(f"{k}={y0}-{y1}" for k, (y0, y1) in periodes.items())
+    ds.attrs["reference"] = PERIODE_REFERENCE
+    ds.to_netcdf(out)
+    return lignes
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    os.makedirs(path_out, exist_ok=True)
+    lignes = []
+
+    da_obs = charger_obs()
+    if da_obs is not None:
+        print(f"--- {SOURCE_OBS} ---")
+        lignes += traiter_source(SOURCE_OBS, {"obs": da_obs}, periodes_modele(SOURCE_OBS))
+
+    # Paire brut / cor suivante décodée en arrière-plan
+    for filename, da_b, da_c in paires_modeles(model_files, (path_brut, path_cor)):
+        model = model_name(filename)
+        print(f"--- {model} ---")
+        if da_b is None and da_c is None:
+            print(" -> Fichiers manquants ou invalides")
+            continue
+        lignes += traiter_source(model, {"brut": da_b, "cor": da_c}, periodes_modele(model))
+
+    df = pd.DataFrame(lignes)
+    out = os.path.join(path_out, "resume_periodes.csv")
+    df.to_csv(out, index=False)
+
+    cols = ["source", "version", "periode", "n_annees_max", "moyenne", "delta_moyenne"]
+    print(df[[c for c in cols if c in df]].to_string(index=False))
+    print(f"\n-> Statistiques par période : {path_out}")
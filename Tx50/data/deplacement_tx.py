@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import os
+
+from commun import (base_path, path_brut, path_cor, PERIODES,
+                    model_files, model_name, paires_modeles, align_spatial, positions)
+from obs_partage import charger_obs
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Déplacement des Tx maximales entre champs brut, corrigé et obs :
+# position du maximum et des TOP_K points les plus chauds à chaque pas
+# de temps, distances entre positions et recouvrement des points chauds.
+
+path_out = os.path.join(base_path, "deplacement_tx/")
+
+TOP_K = 20
+
+# Paires de champs comparées
+PAIRES = [("brut", "cor"), ("brut", "obs"), ("cor", "obs")]
+
+# Pas de temps traités à la fois (années en TXx, jours en journalier)
+CHUNK_TEMPS = 10
+
+RAYON_TERRE_KM = 6371.0
+
+YEARS_OBS = slice(*PERIODES["obs"])
+
+# =========================================================
+# GÉOMÉTRIE
+# =========================================================
+
+def distance_km(a, b, spherique):
+    """Distance entre positions (..., 3) ; grand cercle si sphérique."""
+    if not spherique:
+        return np.linalg.norm(a - b, axis=-1)
+    croix = np.linalg.norm(np.cross(a, b), axis=-1)
+    return RAYON_TERRE_KM * np.arctan2(croix, (a * b).sum(axis=-1))
+
+# =========================================================
+# POINTS CHAUDS
+# =========================================================
+
+def points_chauds(x, k=TOP_K):
+    """
+    x (n_temps, n_points) -> (argmax (n_temps,), top-k (n_temps, k)).
+    argmax = -1 pour un pas de temps entièrement NaN.
+    """
+    v = np.where(np.isfinite(x), x, -np.inf)
+    k = min(k, v.shape[1])
+    top = np.argpartition(-v, k - 1, axis=1)[:, :k]
+    imax = np.argmax(v, axis=1)
+    imax[~np.isfinite(v[np.arange(v.shape[0]), imax])] = -1
+    return imax, top
+
+
+def recouvrement(top_a, top_b, n_points):
+    """Part des top-k de a présents dans les top-k de b, par pas de temps."""
+    dans_b = np.zeros((top_b.shape[0], n_points), dtype=bool)
+    np.put_along_axis(dans_b, top_b, True, axis=1)
+    return np.take_along_axis(dans_b, top_a, axis=1).mean(axis=1)
+
+
+def comparer(chauds, pos, spherique, paires=PAIRES):
+    """Distances (maximum, barycentre des top-k) et recouvrement par paire."""
+    n_points = pos.shape[0]
+    res = {}
+    for a, b in paires:
+        (ia, ta), (ib, tb) = chauds[a], chauds[b]
+        d_max = distance_km(pos[ia], pos[ib], spherique)
+        d_centre = distance_km(pos[ta].mean(axis=1), pos[tb].mean(axis=1), spherique)
+        rec = recouvrement(ta, tb, n_points)
+        # Pas de temps vide dans l'un des champs : rien à comparer
+        vide = (ia < 0) | (ib < 0)
+        for v in (d_max, d_centre, rec):
+            v[vide] = np.nan
+        res[f"{a}-{b}"] = (d_max, d_centre, rec)
+    return res
+
+
+def suivre_points_chauds(champs, k=TOP_K, chunk=CHUNK_TEMPS, paires=PAIRES):
+    """
+    Une passe par blocs de temps sur des champs alignés {nom: DataArray}
+    (mêmes temps et grille). Retourne un DataFrame long :
+    temps, paire, dist_max_km, dist_centre_km, recouvrement.
+    """
+    ref = next(iter(champs.values()))
+    pos, spherique = positions(ref)
+    temps = ref.time.values
+    blocs = []
+
+    for t0 in range(0, len(temps), chunk):
+        sl = slice(t0, t0 + chunk)
+        n_t = len(temps[sl])
+        chauds = {nom: points_chauds(da.isel(time=sl).values.reshape(n_t, -1), k)
+                  for nom, da in champs.items()}
+        for paire, (d_max, d_centre, rec) in comparer(chauds, pos, spherique, paires).items():
+            blocs.append(pd.DataFrame({"temps": temps[sl], "paire": paire,
+                                       "dist_max_km": d_max, "dist_centre_km": d_centre,
+                                       "recouvrement": rec}))
+
+    return pd.concat(blocs, ignore_index=True)
+
+
+def deplacements_modeles(k=TOP_K):
+    """Tous les modèles, années communes brut / cor / obs."""
+    da_obs = charger_obs()
+    if da_obs is None:
+        raise RuntimeError("Impossible de charger les observations")
+    da_obs = da_obs.sel(time=YEARS_OBS)
+
+    tables = []
+    for filename, da_b, da_c in paires_modeles(model_files, (path_brut, path_cor)):
+        model = model_name(filename)
+        if da_b is None or da_c is None:
+            print(f"{model} -> Fichier manquant ou invalide")
+            continue
+
+        years = sorted(set(da_b.time.values) & set(da_c.time.values) & set(da_obs.time.values))
+        da_o = da_obs.sel(time=years)
+        champs = {"brut": align_spatial(da_b.sel(time=years), da_o),
+                  "cor": align_spatial(da_c.sel(time=years), da_o),
+                  "obs": da_o}
+        if not years or champs["brut"] is None or champs["cor"] is None:
+            print(f"{model} -> Pas d'années communes / alignement impossible")
+            continue
+
+        df = suivre_points_chauds(champs, k)
+        df.insert(0, "modele", model)
+        tables.append(df)
+
+    return pd.concat(tables, ignore_index=True)
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    df = deplacements_modeles()
+
+    os.makedirs(path_out, exist_ok=True)
+    out_csv = os.path.join(path_out, f"deplacement_top{TOP_K}.csv")
+    df.to_csv(out_csv, index=False)
+
+    resume = df.groupby(["modele", "paire"])[["dist_max_km", "dist_centre_km", "recouvrement"]].mean()
+    pd.set_option("display.width", 200)
+    print(resume.round(2))
+    print(f"\n-> Déplacements écrits : {out_csv}")
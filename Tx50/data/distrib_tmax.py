@@ -0,0 +1,277 @@
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from commun import (base_path, path_brut, path_cor, path_obs, file_obs, PERIODES,
+                    model_files, model_name, ouvrir_champ, en_celsius, pyplot)
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Distribution des Tmax annuels (TXx) par modèle, version (brut/cor/obs)
+# et période, construite en une seule lecture de chaque fichier txx_*.nc.
+
+path_out = os.path.join(base_path, "distrib_txx/")
+
+# Histogramme à pas fixe : 0.1°C entre 20 et 60°C
+# (+ une case "sous" et une case "sur" pour les valeurs hors bornes)
+BIN_MIN = 20.0
+BIN_MAX = 60.0
+BIN_WIDTH = 0.1
+N_BINS = int(round((BIN_MAX - BIN_MIN) / BIN_WIDTH))
+EDGES = BIN_MIN + BIN_WIDTH * np.arange(N_BINS + 1)
+
+# Fenêtres de niveau de réchauffement (TRACC) propres à chaque modèle,
+# ajoutées aux périodes communes. Ex :
+# {"CNRM-CM5_ALADIN63": {"GWL_2.7": (2051, 2070)}}
+PERIODES_RECHAUFFEMENT = {}
+
+# Nombre d'années lues à la fois (borne la mémoire)
+CHUNK_YEARS = 10
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+# =========================================================
+# HISTOGRAMME / SKETCH DE QUANTILES
+# =========================================================
+# Un sketch = comptes par case + min/max exacts. Deux sketches se
+# fusionnent par simple addition, les quantiles sont exacts à BIN_WIDTH près.
+
+def sketch_vide():
+    """Sketch vide : comptes [sous, cases..., sur], min et max."""
+    return {
+        "counts": np.zeros(N_BINS + 2, dtype=np.int64),
+        "vmin": np.inf,
+        "vmax": -np.inf,
+    }
+
+
+def ajouter(sketch, values):
+    """Ajoute un tableau de valeurs (°C) au sketch, NaN ignorés."""
+    v = np.asarray(values).ravel()
+    v = v[np.isfinite(v)]
+    if v.size == 0:
+        return sketch
+
+    idx = np.floor((v - BIN_MIN) / BIN_WIDTH).astype(np.int64) + 1
+    np.clip(idx, 0, N_BINS + 1, out=idx)
+    sketch["counts"] += np.bincount(idx, minlength=N_BINS + 2)
+    sketch["vmin"] = min(sketch["vmin"], float(v.min()))
+    sketch["vmax"] = max(sketch["vmax"], float(v.max()))
+    return sketch
+
+
+def fusionner(a, b):
+    """Fusionne deux sketches (ex : plusieurs modèles ou périodes)."""
+    return {
+        "counts": a["counts"] + b["counts"],
+        "vmin": min(a["vmin"], b["vmin"]),
+        "vmax": max(a["vmax"], b["vmax"]),
+    }
+
+
+def _bords(sketch):
+    """Bords des N_BINS + 2 cases, cases extrêmes bornées par min/max."""
+    lo = min(sketch["vmin"], BIN_MIN)
+    hi = max(sketch["vmax"], BIN_MAX)
+    return np.concatenate([[lo], EDGES, [hi]])
+
+
+def quantiles(sketch, q):
+    """Quantiles interpolés linéairement dans chaque case."""
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    counts = sketch["counts"]
+    n = counts.sum()
+    if n == 0:
+        return np.full(q.shape, np.nan)
+
+    cum = np.cumsum(counts)
+    target = q * n
+    i = np.searchsorted(cum, target, side="left")
+    i = np.clip(i, 0, N_BINS + 1)
+
+    bords = _bords(sketch)
+    prev = np.where(i > 0, cum[i - 1], 0)
+    frac = (target - prev) / np.maximum(counts[i], 1)
+    val = bords[i] + frac * (bords[i + 1] - bords[i])
+
+    return np.clip(val, sketch["vmin"], sketch["vmax"])
+
+
+def cdf(sketch):
+    """Fonction de répartition aux bords EDGES."""
+    counts = sketch["counts"]
+    n = counts.sum()
+    if n == 0:
+        return np.full(N_BINS + 1, np.nan)
+    return np.cumsum(counts)[:-1] / n
+
+
+def ks_distance(a, b):
+    """Statistique de Kolmogorov-Smirnov entre deux sketches (à BIN_WIDTH près)."""
+    return float(np.nanmax(np.abs(cdf(a) - cdf(b))))
+
+# =========================================================
+# CONSTRUCTION EN UNE PASSE
+# =========================================================
+
+def periodes_modele(model):
+    """Périodes communes + fenêtres de réchauffement propres au modèle."""
+    periodes = dict(PERIODES)
+    periodes.update(PERIODES_RECHAUFFEMENT.get(model, {}))
+    return periodes
+
+
+def sketches_fichier(path, filename, periodes, chunk_years=CHUNK_YEARS):
+    """Ouvre le fichier sans le charger et alimente un sketch par période."""
+    da = ouvrir_champ(path, filename)
+    if da is None:
+        return None
+    return sketches_champ(da, periodes, chunk_years)
+
+
+def sketches_champ(da, periodes, chunk_years=CHUNK_YEARS):
+    """
+    Parcourt le champ par blocs d'années, un sketch par période. Sur un
+    champ paresseux (ouvrir_champ), seul le bloc courant est en mémoire ;
+    le bloc suivant est lu dans un thread pendant le traitement du courant.
+    """
+    years = np.asarray(da.time.values)
+    sketches = {nom: sketch_vide() for nom in periodes}
+
+    def lire(i0):
+        return en_celsius(da.isel(time=slice(i0, i0 + chunk_years))).values
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        suivant = pool.submit(lire, 0) if len(years) else None
+        for i0 in range(0, len(years), chunk_years):
+            bloc = suivant.result()
+            if i0 + chunk_years < len(years):
+                suivant = pool.submit(lire, i0 + chunk_years)
+            yrs = years[i0:i0 + chunk_years]
+
+            for nom, (y0, y1) in periodes.items():
+                sel = (yrs >= y0) & (yrs <= y1)
+                if sel.any():
+                    ajouter(sketches[nom], bloc[sel])
+
+    return sketches
+
+
+def construire_distributions():
+    """Sketches {(modèle, version, période): sketch} pour obs + brut/cor."""
+    store = {}
+
+    print("Distribution observations...")
+    sk = sketches_fichier(path_obs, file_obs, {"obs": PERIODES["obs"]})
+    if sk is not None:
+        store[("SAFRAN", "obs", "obs")] = sk["obs"]
+
+    # Lecture par blocs d'années, bloc suivant préchargé : au plus deux blocs en mémoire
+    for filename in model_files:
+        model = model_name(filename)
+        print(f"--- {model} ---")
+        periodes = periodes_modele(model)
+
+        for version, path in (("brut", path_brut), ("cor", path_cor)):
+            sk = sketches_fichier(path, filename, periodes)
+            if sk is None:
+                print(f" -> Fichier {version} manquant ou invalide")
+                continue
+            for periode, s in sk.items():
+                store[(model, version, periode)] = s
+
+    return store
+
+# =========================================================
+# STOCKAGE COMPACT
+# =========================================================
+
+def sauver_distributions(store, out_file):
+    """Sauve les sketches dans un .npz compressé (comptes en uint32)."""
+    keys = list(store)
+    np.savez_compressed(
+        out_file,
+        keys=np.array(["|".join(k) for k in keys]),
+        counts=np.stack([store[k]["counts"] for k in keys]).astype(np.uint32),
+        vmin=np.array([store[k]["vmin"] for k in keys], dtype=np.float32),
+        vmax=np.array([store[k]["vmax"] for k in keys], dtype=np.float32),
+        bins=np.array([BIN_MIN, BIN_MAX, BIN_WIDTH]),
+    )
+
+
+def charger_distributions(in_file):
+    """Relit un .npz produit par sauver_distributions."""
+    with np.load(in_file) as f:
+        if not np.allclose(f["bins"], [BIN_MIN, BIN_MAX, BIN_WIDTH]):
+            raise ValueError("Cases de l'histogramme différentes de la configuration")
+        store = {}
+        for k, c, lo, hi in zip(f["keys"], f["counts"], f["vmin"], f["vmax"]):
+            store[tuple(str(k).split("|"))] = {
+                "counts": c.astype(np.int64),
+                "vmin": float(lo),
+                "vmax": float(hi),
+            }
+    return store
+
+# =========================================================
+# PLOT
+# =========================================================
+
+def plot_distributions(store, model, periode, out_file):
+    """Densités brut / cor (+ obs sur la période obs) pour un modèle."""
+    plt = pyplot()
+    centres = EDGES[:-1] + BIN_WIDTH / 2
+
+    plt.figure(figsize=(10, 5))
+    styles = {"brut": ("red", "--"), "cor": ("blue", "-")}
+    for version, (color, ls) in styles.items():
+        s = store.get((model, version, periode))
+        if s is None:
+            continue
+        dens = s["counts"][1:-1] / max(s["counts"].sum(), 1) / BIN_WIDTH
+        plt.plot(centres, dens, color=color, linestyle=ls, label=version)
+
+    s_obs = store.get(("SAFRAN", "obs", "obs"))
+    if periode == "obs" and s_obs is not None:
+        dens = s_obs["counts"][1:-1] / max(s_obs["counts"].sum(), 1) / BIN_WIDTH
+        plt.plot(centres, dens, color="black", label="SAFRAN")
+
+    plt.axvline(50, color="black", linewidth=0.8, linestyle=":")
+    plt.title(f"Distribution des Tmax annuels ({periode})\nModèle : {model}")
+    plt.xlabel("TXx (°C)")
+    plt.ylabel("Densité")
+    plt.legend()
+    plt.grid(alpha=0.3)
+    plt.savefig(out_file, bbox_inches="tight")
+    plt.close()
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    os.makedirs(path_out, exist_ok=True)
+    out_store = os.path.join(path_out, "distrib_txx.npz")
+
+    store = construire_distributions()
+    sauver_distributions(store, out_store)
+    print(f"\n-> Distributions sauvées : {out_store}")
+
+    s_obs = store.get(("SAFRAN", "obs", "obs"))
+    for filename in model_files:
+        model = model_name(filename)
+        for periode in periodes_modele(model):
+            plot_distributions(store, model, periode,
+                               os.path.join(path_out, f"DISTRIB_{periode}_{model}.png"))
+
+        for version in ("brut", "cor"):
+            s = store.get((model, version, "obs"))
+            if s is None:
+                continue
+            q = quantiles(s, QUANTILES)
+            ks = ks_distance(s, s_obs) if s_obs is not None else np.nan
+            print(f"{model:35s} {version:4s} KS={ks:.3f} "
+                  + " ".join(f"q{int(p * 100)}={v:.1f}" for p, v in zip(QUANTILES, q)))
+
+    print("\n--- Distributions TXx générées ---")
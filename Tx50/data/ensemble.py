@@ -0,0 +1,310 @@
+import xarray as xr
+import numpy as np
+import pandas as pd
+import os
+import warnings
+
+from commun import (base_path, path_brut, path_cor, DTYPE_ACCUMULATION, DTYPE_CALCUL,
+                    model_files, model_name, paires_modeles, align_spatial)
+from obs_partage import charger_obs
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Produits d'ensemble multi-modèles par année et point de grille : moyenne
+# et écart-type (Welford), quantiles (médiane...) par histogramme, fraction
+# des modèles dépassant chaque seuil. Les modèles sont lus un par un et
+# fusionnés dans un état de taille fixe : la mémoire ne dépend pas du
+# nombre de modèles.
+
+path_out = os.path.join(base_path, "ensemble/")
+
+ANNEES = (1951, 2100)
+
+VERSIONS = ["brut", "cor"]
+
+QUANTILES_ENSEMBLE = [0.1, 0.5, 0.9]
+
+SEUILS_ACCORD = [35.0, 40.0, 45.0, 50.0]   # °C
+
+# Histogramme par (année, point de terre) : N_BINS cases de BIN_WIDTH de
+# climatologie SAFRAN du point - ECART_BAS à + ECART_HAUT (biais bruts et
+# réchauffement de fin de siècle compris), + "sous" / "sur" bornées par le
+# min / max du point. Quantiles exacts à BIN_WIDTH près dans la fenêtre
+# (moins précis pour les rares valeurs hors fenêtre). Comptes en uint8
+# tant qu'il y a moins de 256 modèles.
+# Mémoire par (année, point) : ~80 octets (17 cubes float32 : 68 octets
+# par point de grille, mer comprise).
+BIN_WIDTH = 0.5
+ECART_BAS = 8.0
+ECART_HAUT = 16.0
+N_BINS = int(round((ECART_BAS + ECART_HAUT) / BIN_WIDTH))
+
+# Points traités à la fois pour les quantiles (borne les temporaires)
+BLOC_QUANTILES = 1 << 16
+
+# =========================================================
+# ÉTAT D'ENSEMBLE
+# =========================================================
+# Un état couvre n_annees x n_points (points de terre) aplatis, année
+# par année ; la case de base d'un point ne dépend que de sa
+# climatologie, donc deux états du même domaine se fusionnent.
+
+def dtype_comptes(n_modeles):
+    """Plus petit entier non signé pouvant compter n_modeles."""
+    return np.min_scalar_type(int(n_modeles))
+
+
+def base_cases(climatologie):
+    """Bord bas de la première case de chaque point, aligné sur BIN_WIDTH."""
+    centre = np.round(np.asarray(climatologie, dtype=float) / BIN_WIDTH) * BIN_WIDTH
+    return (centre - ECART_BAS).astype(DTYPE_CALCUL)
+
+
+def etat_vide(n_annees, climatologie, n_modeles, n_seuils=len(SEUILS_ACCORD)):
+    """État vide pour au plus n_modeles modèles ; climatologie (n_points,) en °C."""
+    n_cellules = n_annees * len(climatologie)
+    comptes = dtype_comptes(n_modeles)
+    return {
+        "base": base_cases(climatologie),
+        "n": np.zeros(n_cellules, dtype=comptes),
+        "moyenne": np.zeros(n_cellules, dtype=DTYPE_ACCUMULATION),
+        "m2": np.zeros(n_cellules, dtype=DTYPE_ACCUMULATION),
+        "vmin": np.full(n_cellules, np.inf, dtype=DTYPE_CALCUL),
+        "vmax": np.full(n_cellules, -np.inf, dtype=DTYPE_CALCUL),
+        "counts": np.zeros((n_cellules, N_BINS + 2), dtype=comptes),
+        "accord": np.zeros((n_seuils, n_cellules), dtype=comptes),
+    }
+
+
+def taille_etat(etat):
+    """Taille de l'état en octets."""
+    return sum(v.nbytes for v in etat.values())
+
+
+def ajouter(etat, x, seuils=SEUILS_ACCORD):
+    """Ajoute un modèle : x (n_annees x n_points aplatis) en °C, NaN ignorés."""
+    if etat["n"].max(initial=0) >= np.iinfo(etat["n"].dtype).max:
+        raise OverflowError(f"Plus de {np.iinfo(etat['n'].dtype).max} modèles : "
+                            "agrandir n_modeles dans etat_vide")
+    ok = np.flatnonzero(np.isfinite(x))
+    v = x[ok].astype(DTYPE_ACCUMULATION)
+
+    etat["n"][ok] += 1
+    delta = v - etat["moyenne"][ok]
+    etat["moyenne"][ok] += delta / etat["n"][ok]
+    etat["m2"][ok] += delta * (v - etat["moyenne"][ok])
+
+    etat["vmin"][ok] = np.minimum(etat["vmin"][ok], x[ok])
+    etat["vmax"][ok] = np.maximum(etat["vmax"][ok], x[ok])
+
+    # Une valeur par point : pas de doublon dans l'indexation
+    base = etat["base"][ok % etat["base"].size]
+    idx = np.clip(np.floor((v - base) / BIN_WIDTH).astype(np.int64) + 1, 0, N_BINS + 1)
+    etat["counts"][ok, idx] += 1
+
+    for k, s in enumerate(seuils):
+        etat["accord"][k, ok] += (x[ok] >= s)
+
+
+def fusionner(a, b):
+    """Fusionne deux états du même domaine (ex : deux lots de modèles traités séparément)."""
+    if not np.array_equal(a["base"], b["base"]):
+        raise ValueError("États de domaines différents")
+    n = a["n"].astype(np.int64) + b["n"]
+    comptes = dtype_comptes(n.max(initial=0))
+    delta = b["moyenne"] - a["moyenne"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        f = np.where(n > 0, b["n"] / np.maximum(n, 1), 0.0)
+    return {
+        "base": a["base"],
+        "n": n.astype(comptes),
+        "moyenne": a["moyenne"] + delta * f,
+        "m2": a["m2"] + b["m2"] + delta ** 2 * a["n"] * f,
+        "vmin": np.minimum(a["vmin"], b["vmin"]),
+        "vmax": np.maximum(a["vmax"], b["vmax"]),
+        "counts": np.add(a["counts"], b["counts"], dtype=comptes),
+        "accord": np.add(a["accord"], b["accord"], dtype=comptes),
+    }
+
+
+def _valeur_rang(r, cum, counts, base, lo, hi, vmin, vmax):
+    """
+    Estimation de la valeur de rang r (0 = minimum) de chaque point : au
+    centre de sa part de case, sauf dans les cases "sous" / "sur" dont la
+    plus petite / plus grande valeur est exactement le min / max du point.
+    """
+    lignes = np.arange(counts.shape[0])
+    i = np.minimum((cum <= r[:, None]).sum(axis=1), N_BINS + 1)
+    prev = np.where(i > 0, cum[lignes, np.maximum(i - 1, 0)], 0)
+    k, c = r - prev, np.maximum(counts[lignes, i], 1)
+    frac = np.select([i == 0, i == N_BINS + 1], [k / c, (k + 1) / c], (k + 0.5) / c)
+    b0 = np.where(i == 0, lo, base + BIN_WIDTH * np.clip(i - 1, 0, N_BINS))
+    b1 = np.where(i == N_BINS + 1, hi, base + BIN_WIDTH * np.clip(i, 0, N_BINS))
+    return np.clip(b0 + frac * (b1 - b0), vmin, vmax)
+
+
+def quantiles(etat, q, bloc=BLOC_QUANTILES):
+    """
+    Quantiles (len(q), n_cellules), même convention que np.quantile :
+    interpolation entre les valeurs de rang floor(q (n-1)) et suivant,
+    chacune connue à BIN_WIDTH près par l'histogramme.
+    """
+    q = np.asarray(q, dtype=float)
+    n_cellules = etat["n"].size
+    n_points = etat["base"].size
+    res = np.full((len(q), n_cellules), np.nan)
+
+    for c0 in range(0, n_cellules, bloc):
+        sl = slice(c0, c0 + bloc)
+        counts = etat["counts"][sl]
+        n = etat["n"][sl].astype(np.int64)
+        vmin, vmax = etat["vmin"][sl], etat["vmax"][sl]
+        base = etat["base"][np.arange(c0, c0 + n.size) % n_points].astype(float)
+        cum = np.cumsum(counts, axis=1, dtype=np.int32)
+
+        # Cases extrêmes bornées par min / max du point
+        lo = np.minimum(vmin, base)
+        hi = np.maximum(vmax, base + BIN_WIDTH * N_BINS)
+
+        for k, qk in enumerate(q):
+            h = qk * np.maximum(n - 1, 0)
+            r0 = np.floor(h)
+            r1 = np.minimum(r0 + 1, np.maximum(n - 1, 0))
+            v0 = _valeur_rang(r0, cum, counts, base, lo, hi, vmin, vmax)
+            v1 = _valeur_rang(r1, cum, counts, base, lo, hi, vmin, vmax)
+            with np.errstate(invalid="ignore"):
+                res[k, sl] = np.where(n > 0, v0 + (h - r0) * (v1 - v0), np.nan)
+    return res
+
+
+def produits(etat, quantiles_ens=QUANTILES_ENSEMBLE):
+    """Champs d'ensemble (aplatis) à partir de l'état."""
+    n = etat["n"].astype(np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        moyenne = np.where(n > 0, etat["moyenne"], np.nan)
+        ecart_type = np.where(n > 1, np.sqrt(etat["m2"] / np.maximum(n - 1, 1)), np.nan)
+        accord = np.where(n > 0, etat["accord"] / np.maximum(n, 1), np.nan)
+    return {
+        "n_modeles": n,
+        "moyenne": moyenne,
+        "ecart_type": ecart_type,
+        "quantiles": quantiles(etat, quantiles_ens),
+        "accord": accord,
+    }
+
+# =========================================================
+# PASSE SUR LES MODÈLES
+# =========================================================
+
+def construire_ensemble(annees=ANNEES, versions=VERSIONS):
+    """Un état par version ; chaque paire brut / cor n'est lue qu'une fois."""
+    # Grille SAFRAN (mmap partagé) sur laquelle les modèles sont alignés
+    ref = charger_obs()
+    if ref is None:
+        raise RuntimeError("Impossible de charger les observations")
+    dims = [d for d in ref.dims if d != "time"]
+    forme = [ref.sizes[d] for d in dims]
+    years = np.arange(annees[0], annees[1] + 1)
+
+    # Points de terre (SAFRAN défini) et leur climatologie
+    obs = ref.transpose("time", *dims).values.reshape(ref.sizes["time"], -1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        climatologie = np.nanmean(obs, axis=0)
+    terre = np.flatnonzero(np.isfinite(climatologie))
+
+    etats = {v: etat_vide(len(years), climatologie[terre], len(model_files)) for v in versions}
+    print(f"État d'ensemble : {taille_etat(etats[versions[0]]) / 1e6:.0f} Mo par version "
+          f"({len(years)} années x {terre.size} points de terre)")
+    modeles = {v: [] for v in versions}
+    dossiers = {"brut": path_brut, "cor": path_cor}
+
+    for filename, *champs in paires_modeles(model_files, [dossiers[v] for v in versions]):
+        model = model_name(filename)
+        print(f"--- {model} ---")
+        for version, da in zip(versions, champs):
+            if da is None:
+                print(f" -> Fichier {version} manquant ou invalide")
+                continue
+            da = align_spatial(da, ref)
+            if da is None:
+                print(f" -> Alignement impossible ({version})")
+                continue
+            da = da.isel(time=np.flatnonzero(np.isin(da.time.values, years)))
+            x = np.full((len(years), terre.size), np.nan, dtype=DTYPE_CALCUL)
+            x[np.searchsorted(years, da.time.values)] = (
+                da.transpose("time", *dims).values.reshape(da.sizes["time"], -1)[:, terre])
+            ajouter(etats[version], x.ravel())
+            modeles[version].append(model)
+
+    return etats, modeles, years, ref, dims, terre
+
+# =========================================================
+# SORTIES
+# =========================================================
+
+def dataset_ensemble(etat, years, ref, dims, terre, modeles):
+    """Cartes d'ensemble (year, y, x) et accords (seuil, year, y, x), NaN hors terre."""
+    forme = tuple(ref.sizes[d] for d in dims)
+    p = produits(etat)
+
+    def carte(v, dtype=DTYPE_CALCUL, vide=np.nan):
+        """(..., n_annees x n_points) -> (..., year, y, x) sur la grille complète."""
+        v = v.reshape(v.shape[:-1] + (len(years), terre.size))
+        out = np.full(v.shape[:-1] + (int(np.prod(forme)),), vide, dtype=dtype)
+        out[..., terre] = v
+        return out.reshape(v.shape[:-1] + forme)
+
+    ds = xr.Dataset(
+        data_vars={
+            "n_modeles": (["year"] + dims, carte(p["n_modeles"], np.int16, 0)),
+            "moyenne": (["year"] + dims, carte(p["moyenne"])),
+            "ecart_type": (["year"] + dims, carte(p["ecart_type"])),
+            "quantiles": (["quantile", "year"] + dims, carte(p["quantiles"])),
+            "accord": (["seuil", "year"] + dims, carte(p["accord"])),
+        },
+        coords={"year": years, "quantile": QUANTILES_ENSEMBLE, "seuil": SEUILS_ACCORD,
+                **{d: ref[d] for d in dims if d in ref.coords}},
+    )
+    ds.attrs["modeles"] = ", ".join(modeles)
+    ds.attrs["comment"] = ("accord = fraction des modèles disponibles avec TXx >= seuil ; "
+                           f"quantiles par histogramme (précision {BIN_WIDTH} °C).")
+    return ds
+
+
+def series_ensemble(ds, dims):
+    """Séries annuelles : moyennes spatiales des cartes d'ensemble."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        m = ds.mean(dim=dims, skipna=True)
+    df = pd.DataFrame({"year": ds.year.values,
+                       "n_modeles_max": ds["n_modeles"].max(dim=dims).values,
+                       "moyenne": m["moyenne"].values,
+                       "ecart_type": m["ecart_type"].values})
+    for q in ds["quantile"].values:
+        df[f"q{int(round(q * 100))}"] = m["quantiles"].sel(quantile=q).values
+    for s in ds["seuil"].values:
+        df[f"accord_{s:g}"] = m["accord"].sel(seuil=s).values
+    return df
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    os.makedirs(path_out, exist_ok=True)
+
+    etats, modeles, years, ref, dims, terre = construire_ensemble()
+
+    for version, etat in etats.items():
+        if not modeles[version]:
+            print(f"{version} : aucun modèle")
+            continue
+        ds = dataset_ensemble(etat, years, ref, dims, terre, modeles[version])
+        out_nc = os.path.join(path_out, f"ensemble_{version}.nc")
+        ds.to_netcdf(out_nc)
+
+        out_csv = os.path.join(path_out, f"series_ensemble_{version}.csv")
+        series_ensemble(ds, dims).to_csv(out_csv, index=False)
+        print(f"{version} : {len(modeles[version])} modèles -> {out_nc}, {out_csv}")
@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+import importlib.util
+import os
+import pickle
+
+from commun import base_path
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Couche de données de l'inventaire Tx50 : le tableau CSV est lu et
+# validé une seule fois en colonnes typées, puis mis en cache en Parquet
+# (colonnes, types conservés). Sans pyarrow, repli sur un pickle pandas.
+
+file_inventaire = os.path.join(base_path, "..", "..", "Tableau_Tx50 - Feuille 1.csv")
+
+# Incrémenté à chaque changement de colonnes : le cache d'un autre schéma
+# porte un autre nom et n'est jamais relu
+VERSION_SCHEMA = 2
+
+CACHE_PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+file_cache = os.path.join(base_path, f"inventaire_tx50_v{VERSION_SCHEMA}"
+                          + (".parquet" if CACHE_PARQUET else ".pkl"))
+
+COLONNES_CSV = ["gcm", "rcm", "date", "niveau", "N45", "N50", "T_max", "commentaire"]
+
+# Noms de l'inventaire -> noms des fichiers txx_*.nc (par GCM)
+ALIAS_RCM = {
+    ("MPI-ESM-LR", "CCLM4-8-17"): "CLMcom-CCLM4-8-17",
+    ("MPI-ESM-LR", "REMO"): "REMO2009",
+    ("NorESM1-M", "REMO"): "REMO2015",
+}
+
+ANNEE_PIVOT = 2050
+
+# =========================================================
+# PARSING / TYPAGE
+# =========================================================
+
+def parser_niveau(niveau):
+    """
+    Niveau de réchauffement du tableau -> colonnes :
+      niveau        libellé d'origine sans '°C' ('4.0p', '>4.0', '2.7 à 4.0'...)
+      warming       borne basse : '2.7°C à 4.0°C' -> 2.7, '>4.0°C' -> 4.0, '<2.0°C' -> nan
+      warming_max   borne haute : '2.0°C ou 2.7°C' -> 2.7, '>4.0°C' -> nan, '<2.0°C' -> 2.0
+      ouvert        intervalle ouvert ('>' ou '<')
+      qualificatif  suffixe du libellé ('4.0°Cp' -> 'p', sinon '')
+    """
+    s = niveau.astype(str).str.replace(",", ".").str.strip()
+    libelle = s.str.replace("°C", "", regex=False).str.strip()
+    nombres = s.str.findall(r"\d+\.\d+")
+    superieur = s.str.startswith(">")
+    inferieur = s.str.startswith("<")
+    ouvert = superieur | inferieur
+    warming = pd.to_numeric(nombres.str[0], errors="coerce").where(~inferieur)
+    warming_max = pd.to_numeric(nombres.str[-1], errors="coerce").where(~superieur)
+    qualificatif = libelle.str.extract(r"\d\s*([a-zA-Z]+)$", expand=False).fillna("")
+    return libelle.where(niveau.notna()), warming, warming_max, ouvert, qualificatif
+
+
+def typer(df):
+    """
+    Convertit un inventaire (CSV nettoyé ou produit par le pipeline) au
+    schéma typé. Colonnes requises : modele, date, N45, N50, T_max.
+    """
+    out = pd.DataFrame({
+        "modele": df["modele"].astype(str).str.strip(),
+        "date": pd.to_datetime(df["date"]),
+        "N45": pd.to_numeric(df["N45"], errors="coerce").astype("Int32"),
+        "N50": pd.to_numeric(df["N50"], errors="coerce").astype("Int32"),
+        "T_max": pd.to_numeric(df["T_max"], errors="coerce").astype("float64"),
+    })
+    for col, defaut in [("niveau", np.nan), ("warming", np.nan), ("warming_max", np.nan),
+                        ("warming_ouvert", False), ("qualificatif", ""),
+                        ("commentaire", ""), ("source", "pipeline")]:
+        out[col] = df[col].values if col in df else defaut
+
+    out["warming"] = out["warming"].astype("float64")
+    out["warming_max"] = out["warming_max"].astype("float64")
+    out["warming_ouvert"] = out["warming_ouvert"].astype(bool)
+    out["qualificatif"] = out["qualificatif"].fillna("").astype(str)
+    out["commentaire"] = out["commentaire"].fillna("").astype(str)
+
+    gcm_rcm = out["modele"].str.split("_", n=1, expand=True)
+    out["gcm"] = gcm_rcm[0]
+    out["rcm"] = gcm_rcm[1] if gcm_rcm.shape[1] > 1 else ""
+    out["annee"] = out["date"].dt.year.astype("int16")
+    out["decennie"] = (out["annee"] // 10 * 10).astype("int16")
+    out["apres_2050"] = out["annee"] >= ANNEE_PIVOT
+
+    for col in ["modele", "gcm", "rcm", "niveau", "source"]:
+        out[col] = out[col].astype("category")
+
+    valider(out)
+    return out.sort_values(["modele", "date"], kind="stable").reset_index(drop=True)
+
+
+def valider(df):
+    """Contrôles de cohérence du schéma (lève ValueError)."""
+    erreurs = []
+    if df["date"].isna().any():
+        erreurs.append(f"{int(df['date'].isna().sum())} dates invalides")
+    if (df["N50"] > df["N45"]).any():
+        erreurs.append("N50 > N45 sur certaines lignes")
+    if (df["T_max"] < 50).any():
+        erreurs.append("T_max < 50°C sur certaines lignes")
+    if erreurs:
+        raise ValueError("Inventaire invalide : " + " ; ".join(erreurs))
+
+
+def _modeles(df):
+    """Noms de modèle GCM_RCM (noms des fichiers txx_*.nc) des lignes du tableau."""
+    gcm = df["gcm"].str.strip()
+    rcm = df["rcm"].str.strip()
+    rcm = pd.Series([ALIAS_RCM.get((g, r), r) for g, r in zip(gcm, rcm)], index=df.index)
+    return gcm + "_" + rcm
+
+
+def lire_csv(csv_file=file_inventaire):
+    """Lit le tableau manuel (continuations GCM/RCM, virgules décimales...)."""
+    df = pd.read_csv(csv_file, usecols=range(len(COLONNES_CSV)), dtype=str)
+    df.columns = COLONNES_CSV
+    df[["gcm", "rcm"]] = df[["gcm", "rcm"]].ffill()
+
+    df["date"] = pd.to_datetime(df["date"], format="%d-%m-%Y", errors="coerce")
+    df = df.dropna(subset=["date"]).copy()
+    df["modele"] = _modeles(df)
+
+    df["T_max"] = df["T_max"].str.replace(",", ".")
+    (df["niveau"], df["warming"], df["warming_max"],
+     df["warming_ouvert"], df["qualificatif"]) = parser_niveau(df["niveau"])
+    df["source"] = "manuel"
+
+    return typer(df)
+
+def fiabilite_tableau(csv_file=file_inventaire):
+    """
+    Verdicts manuels par modèle (colonne 9 du tableau) : fiabilite_pct
+    ("Fiable à 55%") et cas_fiables (somme des "2 cas 4.0°C fiables").
+    """
+    df = pd.read_csv(csv_file, usecols=range(len(COLONNES_CSV) + 1), dtype=str)
+    df.columns = COLONNES_CSV + ["verdict"]
+    df[["gcm", "rcm"]] = df[["gcm", "rcm"]].ffill()
+    df = df.dropna(subset=["verdict"])
+    df = df.assign(modele=_modeles(df))
+
+    pct = pd.to_numeric(df["verdict"].str.extract(r"Fiable à (\d+)\s*%", expand=False))
+    cas = pd.to_numeric(df["verdict"].str.extract(r"(\d+) cas .*fiable", expand=False))
+    return pd.DataFrame({
+        "fiabilite_pct": pct.groupby(df["modele"]).max(),
+        "cas_fiables": cas.groupby(df["modele"]).sum(min_count=1),
+    }).dropna(how="all")
+
+# =========================================================
+# CACHE TYPÉ
+# =========================================================
+
+def charger_inventaire(csv_file=file_inventaire, cache_file=file_cache):
+    """Inventaire typé, relu depuis le cache (Parquet ou pickle) s'il est plus récent que le CSV."""
+    parquet = cache_file.endswith(".parquet")
+    if (os.path.exists(cache_file)
+            and os.path.getmtime(cache_file) >= os.path.getmtime(csv_file)):
+        try:
+            return pd.read_parquet(cache_file) if parquet else pd.read_pickle(cache_file)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            print(f" -> Cache inventaire illisible, reconstruit : {e}")
+
+    df = lire_csv(csv_file)
+    try:
+        if parquet:
+            df.to_parquet(cache_file, index=False)
+        else:
+            df.to_pickle(cache_file)
+    except OSError as e:
+        print(f" -> Inventaire non mis en cache : {e}")
+    return df
+
+
+def ajouter_inventaire(df, df_pipeline):
+    """Fusionne un inventaire produit par le pipeline (schéma de typer)."""
+    df_new = typer(df_pipeline)
+    categories = ["modele", "gcm", "rcm", "niveau", "source"]
+    out = pd.concat([df.astype({c: str for c in categories}),
+                     df_new.astype({c: str for c in categories})],
+                    ignore_index=True)
+    for col in categories:
+        out[col] = out[col].astype("category")
+    return out.sort_values(["modele", "date"], kind="stable").reset_index(drop=True)
+
+
+def dates_calendrier(temps):
+    """
+    Axe temps (datetime64 ou cftime, tout calendrier) -> dates grégoriennes
+    à partir de année / mois / jour (comme contexte_evenements.cles_temps).
+    Calendrier 360 jours : un jour absent du calendrier grégorien (30 février)
+    est ramené au dernier jour du mois.
+    """
+    t = temps.dt
+    annee, mois, jour = t.year.values, t.month.values, t.day.values
+    fin_mois = (pd.to_datetime(pd.DataFrame({"year": annee, "month": mois, "day": 1}))
+                + pd.offsets.MonthEnd(0)).dt.day.values
+    return pd.to_datetime(pd.DataFrame({"year": annee, "month": mois,
+                                        "day": np.minimum(jour, fin_mois)})).values
+
+
+def inventaire_depuis_cube(da, model, seuil_45=45.0, seuil_50=50.0):
+    """
+    Inventaire automatique depuis un cube journalier (time, y, x) en °C :
+    une ligne par jour où au moins un point atteint seuil_50.
+    """
+    dims = [d for d in da.dims if d != "time"]
+    n45 = (da >= seuil_45).sum(dim=dims)
+    n50 = (da >= seuil_50).sum(dim=dims)
+    tmax = da.max(dim=dims)
+    jours = (n50 > 0).values
+
+    return typer(pd.DataFrame({
+        "modele": model,
+        "date": dates_calendrier(da.time)[jours],
+        "N45": n45.values[jours],
+        "N50": n50.values[jours],
+        "T_max": np.round(tmax.values[jours], 1),
+    }))
+
+# =========================================================
+# GROUP-BY
+# =========================================================
+
+def resume(df, par=("niveau",)):
+    """
+    Moyennes T_max / N45 / N50 et nombre de cas par groupe. Par défaut
+    par libellé de niveau : '4.0', '4.0p' et '>4.0' restent distincts.
+    """
+    return (df.groupby(list(par), observed=True)
+              .agg(T_max=("T_max", "mean"),
+                   Pts_T45=("N45", "mean"),
+                   Pts_T50=("N50", "mean"),
+                   count=("T_max", "count"))
+              .astype({"Pts_T45": "float64", "Pts_T50": "float64"})
+              .reset_index())
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    df = charger_inventaire()
+    print(df.dtypes)
+    print(f"\n{len(df)} événements, {df['modele'].nunique()} modèles")
+
+    for par in [("niveau",), ("warming", "warming_ouvert"), ("modele",),
+                ("apres_2050",), ("decennie",)]:
+        print(f"\n--- Par {', '.join(par)} ---")
+        print(resume(df, par).round(2))
@@ -0,0 +1,270 @@
+import ast
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import time
+
+from commun import base_path, path_brut, path_cor, path_obs, file_obs, model_files, model_name
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Manifeste par étape (entrées + empreintes, paramètres, version du code,
+# durée, sorties) et saut « à la make » des étapes dont rien n'a changé.
+
+path_manifestes = os.path.join(base_path, "manifestes/")
+
+# Empreintes déjà calculées, réutilisées tant que taille et date sont inchangées
+file_empreintes = os.path.join(path_manifestes, "empreintes.json")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BLOC_LECTURE = 1 << 20
+
+
+def _obs():
+    return [os.path.join(path_obs, file_obs)]
+
+
+def _modeles(*dossiers):
+    return [os.path.join(d, f) for d in dossiers for f in model_files]
+
+
+_CACHE = os.path.join(base_path, "cache_seuils.nc")
+
+
+def _references():
+    from references import REFERENCES
+    return REFERENCES
+
+
+def _journalier():
+    import nc_diff_rmse_histo as nc
+    return nc
+
+
+def _carte():
+    import read_data
+    return read_data
+
+
+def _tasmax_journaliers():
+    from contexte_evenements import trouver_fichier
+    from vagues_chaleur import SOURCE_OBS
+    fichiers = [trouver_fichier("tasmax", s) for s in [SOURCE_OBS] + [model_name(f) for f in model_files]]
+    return [f for f in fichiers if f is not None]
+
+
+def _contexte_journaliers():
+    from contexte_evenements import path_journalier, DAILY_FILE_PATTERN, VARIABLES_CONTEXTE
+    return sorted(f for var in VARIABLES_CONTEXTE
+                  for f in glob.glob(os.path.join(path_journalier,
+                                                  DAILY_FILE_PATTERN.format(var=var, model=""))))
+
+
+def _inventaire():
+    from inventaire import file_inventaire
+    return [file_inventaire]
+
+# commande tx50.py -> (entrées, sorties). Une sortie finissant par "/" est
+# un dossier (tous ses fichiers), sinon un motif glob. Les sorties qui
+# dépendent de la configuration d'un module sont données par une fonction.
+ETAPES = {
+    "cache":       (lambda: _obs() + _modeles(path_brut, path_cor), [_CACHE]),
+    "references":  (lambda: _modeles(path_brut, path_cor)
+                    + [chemin for _, chemin in _references().values()],
+                    [os.path.join(base_path, "cache_references.nc")]),
+    "distrib":     (lambda: _obs() + _modeles(path_brut, path_cor),
+                    [os.path.join(base_path, "distrib_txx/")]),
+    "periodes":    (lambda: _obs() + _modeles(path_brut, path_cor),
+                    [os.path.join(base_path, "delta_periodes/")]),
+    "ensemble":    (lambda: _obs() + _modeles(path_brut, path_cor),
+                    [os.path.join(base_path, "ensemble/")]),
+    "regions":     (lambda: _obs() + _modeles(path_cor)
+                    + glob.glob(os.path.join(base_path, "regions", "*.geojson")),
+                    [os.path.join(base_path, "regions", "depassements_*.csv")]),
+    "qm":          (lambda: _obs() + _modeles(path_brut, path_cor),
+                    [os.path.join(base_path, "correction_qm/")]),
+    "deplacement": (lambda: _obs() + _modeles(path_brut, path_cor),
+                    [os.path.join(base_path, "deplacement_tx/")]),
+    "atlas":       (lambda: _obs() + _modeles(path_brut, path_cor),
+                    [os.path.join(base_path, "atlas", "atlas_*.png")]),
+    "rmse":        (lambda: [_CACHE], [os.path.join(base_path, "plots_rmse/")]),
+    "rmse-seuil":  (lambda: [_CACHE], [os.path.join(base_path, "plots_rmse_bias_gt35/")]),
+    "rmse-bar":    (lambda: [_CACHE], [os.path.join(base_path, "plots_rmse_bar/")]),
+    "rmse-delta":  (lambda: [_CACHE], [os.path.join(base_path, "plots_rmse_diff_thresholds/")]),
+    "journalier":  (lambda: [_journalier().file_1, _journalier().file_2],
+                    lambda: [os.path.abspath(_journalier().output_name)]),
+    "carte":       (lambda: [_carte().FILE_A, _carte().FILE_B], lambda: [_carte().path_out]),
+    "vagues":      (lambda: _tasmax_journaliers() + _inventaire(),
+                    [os.path.join(base_path, "vagues_chaleur/")]),
+    "contexte":    (lambda: _contexte_journaliers() + _inventaire(),
+                    [os.path.join(base_path, "contexte_evenements/")]),
+}
+
+# =========================================================
+# EMPREINTES
+# =========================================================
+
+def _charger_empreintes():
+    try:
+        with open(file_empreintes, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def empreintes(chemins):
+    """sha256 de chaque fichier ({chemin: sha ou None si absent})."""
+    connues = _charger_empreintes()
+    res = {}
+    modifie = False
+    for chemin in chemins:
+        chemin = os.path.abspath(chemin)
+        try:
+            st = os.stat(chemin)
+        except OSError:
+            res[chemin] = None
+            continue
+
+        cle = [st.st_size, st.st_mtime_ns]
+        if chemin in connues and connues[chemin][:2] == cle:
+            res[chemin] = connues[chemin][2]
+            continue
+
+        h = hashlib.sha256()
+        with open(chemin, "rb") as f:
+            for bloc in iter(lambda: f.read(BLOC_LECTURE), b""):
+                h.update(bloc)
+        res[chemin] = h.hexdigest()
+        connues[chemin] = cle + [res[chemin]]
+        modifie = True
+
+    if modifie:
+        os.makedirs(path_manifestes, exist_ok=True)
+        tmp = f"{file_empreintes}.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(connues, f)
+        os.replace(tmp, file_empreintes)
+    return res
+
+
+def fichiers_sorties(sorties):
+    """Fichiers existants désignés par les sorties (dossiers ou motifs)."""
+    if callable(sorties):
+        sorties = sorties()
+    fichiers = []
+    for s in sorties:
+        motif = os.path.join(s, "**", "*") if s.endswith("/") else s
+        fichiers += [f for f in glob.glob(motif, recursive=True) if os.path.isfile(f)]
+    return sorted(fichiers)
+
+# =========================================================
+# CODE ET PARAMÈTRES
+# =========================================================
+
+def _source(module):
+    return os.path.join(HERE, module + ".py")
+
+
+def modules_locaux(module, vus=None):
+    """Le module et les modules du dossier qu'il importe, récursivement."""
+    vus = set() if vus is None else vus
+    if module in vus or not os.path.exists(_source(module)):
+        return vus
+    vus.add(module)
+    with open(_source(module), encoding="utf-8") as f:
+        arbre = ast.parse(f.read())
+    for noeud in ast.walk(arbre):
+        if isinstance(noeud, ast.Import):
+            noms = [a.name for a in noeud.names]
+        elif isinstance(noeud, ast.ImportFrom) and noeud.module:
+            noms = [noeud.module]
+        else:
+            continue
+        for nom in noms:
+            modules_locaux(nom.split(".")[0], vus)
+    return vus
+
+
+def parametres(module):
+    """Constantes en MAJUSCULES du module (valeur, ou expression source)."""
+    with open(_source(module), encoding="utf-8") as f:
+        arbre = ast.parse(f.read())
+    res = {}
+    for noeud in arbre.body:
+        if not isinstance(noeud, ast.Assign):
+            continue
+        for cible in noeud.targets:
+            if isinstance(cible, ast.Name) and cible.id.isupper():
+                try:
+                    res[cible.id] = repr(ast.literal_eval(noeud.value))
+                except ValueError:
+                    res[cible.id] = ast.unparse(noeud.value)
+    return res
+
+
+def version_git():
+    """Commit courant (+ '-modifie' si l'arbre de travail diffère), sinon None."""
+    try:
+        rev = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        sale = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + ("-modifie" if sale else "")
+
+# =========================================================
+# MANIFESTES
+# =========================================================
+
+def _file_manifeste(commande):
+    return os.path.join(path_manifestes, f"{commande}.json")
+
+
+def etat(commande, module, args):
+    """Ce qui détermine le résultat d'une étape : entrées, paramètres, code."""
+    entrees, _ = ETAPES[commande]
+    return {
+        "commande": commande,
+        "args": list(args),
+        "entrees": empreintes(entrees()),
+        "parametres": parametres(module),
+        "code": empreintes(_source(m) for m in sorted(modules_locaux(module))),
+    }
+
+
+def a_jour(commande, module, args):
+    """Vrai si le dernier manifeste a le même état et des sorties intactes."""
+    if commande not in ETAPES:
+        return False
+    try:
+        with open(_file_manifeste(commande), encoding="utf-8") as f:
+            precedent = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    courant = etat(commande, module, args)
+    if any(precedent.get(k) != v for k, v in courant.items()):
+        return False
+
+    _, sorties = ETAPES[commande]
+    return precedent.get("sorties") == empreintes(fichiers_sorties(sorties))
+
+
+def ecrire_manifeste(commande, module, args, debut, duree):
+    """Manifeste de l'étape qui vient de tourner."""
+    _, sorties = ETAPES[commande]
+    manifeste = etat(commande, module, args)
+    manifeste.update({
+        "version_git": version_git(),
+        "debut": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(debut)),
+        "duree_s": round(duree, 3),
+        "sorties": empreintes(fichiers_sorties(sorties)),
+    })
+    os.makedirs(path_manifestes, exist_ok=True)
+    with open(_file_manifeste(commande), "w", encoding="utf-8") as f:
+        json.dump(manifeste, f, indent=2, ensure_ascii=False)
@@ -1,6 +1,9 @@
 import xarray as xr
 import numpy as np
-import matplotlib.pyplot as plt
+import sys
+
+from commun import pyplot, DTYPE_ACCUMULATION, DTYPE_CALCUL, encodage_int16, empaqueter_masque
+from calcul_dask import ouvrir_chunks, demarrer_scheduler, calculer, SCHEDULER
 
 
 path_1 = "/home/florent/Documents/ENM_3A/Tx50/Tx50/data/brut/"
@@ -13,6 +16,11 @@ file_1 = path_1 + file+".nc"
 file_2 = path_2 + file+"(1).nc"
 output_name = "metrics_tasmax_"+file+".nc" # Changement de nom pour refléter le contenu
 
+# Ordonnanceur dask : calcul_dask.SCHEDULER ("cluster", limite mémoire
+# et débordement disque par défaut)
+
+# Seuil journalier (K) du filtre et du masque de dépassement par point
+SEUIL_K = 318.15
 
 
 def plot_bool_hist(bool_list):
@@ -20,6 +28,8 @@ def plot_bool_hist(bool_list):
     Affiche un histogramme du nombre de True cumulés selon l'index,
     et superpose la fonction exponentielle.
     """
+    plt = pyplot()
+
     # Convertir booléens en 0/1
     counts = [int(b) for b in bool_list]
 
@@ -47,95 +57,122 @@ def plot_bool_hist(bool_list):
 
 
 
-try:
-    ds1 = xr.open_dataset(file_1)
-    ds2 = xr.open_dataset(file_2)
-
-    # Assurez-vous d'avoir les variables 'tasmax' ou 'tasmaxAdjust'
-    da1 = ds1['tasmax'] if 'tasmax' in ds1 else ds1['tasmaxAdjust']
-    da2 = ds2['tasmax'] if 'tasmax' in ds2 else ds2['tasmaxAdjust']
-
-    # --- Étape 1: Harmonisation des coordonnées ---
-    
-    # Récupérer les dimensions du fichier source 1 (tasmax brut)
-    dims_da1 = da1.dims
-    # Assumer que les dimensions du fichier source 2 sont dans le même ordre
-    rename_dict = {old: new for old, new in zip(da2.dims, dims_da1)}
-    da2 = da2.rename(rename_dict)
-
-    # Assigner des coordonnées numériques 'i' et 'j' pour assurer la compatibilité spatiale
-    da2 = da2.assign_coords({
-        "i": np.arange(da1.sizes.get("i", 0)),
-        "j": np.arange(da1.sizes.get("j", 0))
-    })
-    
-    # Assigner 'time' à da2 en utilisant celui de da1, pour être sûr de l'alignement
-    if 'time' in da1.coords and 'time' in da2.coords:
-        da2['time'] = da1['time']
-
-    # --- Étape 2: Filtre temporel (condition : Tasmax du second fichier >= 45°C) ---
-    
-    # Dimensions spatiales, en supposant que 'time' est la première dimension
-    # Si da2.dims est ('time', 'j', 'i'), spatial_dims sera ('j', 'i')
-    spatial_dims = da2.dims[1:] 
-    
-    # Créer le masque : True pour tous les pas de temps où AU MOINS UN point spatial est >= 45
-    # La conversion est supposée être en °C, si c'est en K, 45°C = 318.15 K. 
-    # Je suppose ici que les données sont déjà en °C.
-    mask_time = (da2 >= 318.15).any(dim=spatial_dims)
-
-    print(mask_time)
-    plot_bool_hist(mask_time.values.tolist())
-    
-    # Appliquer le filtre aux deux DataArray
-    da1_filt = da1.sel(time=mask_time)
-    da2_filt = da2.sel(time=mask_time)
-
-    print(f"Nombre de pas de temps initiaux : {len(da1['time'])}")
-    print(f"Nombre de pas de temps gardés par le filtre (> 45°C) : {mask_time.sum().item()}")
-
-    # --- Étape 3: Calcul des métriques (Différence, Biais, EQM) ---
-    
-    # 3.1 Différence (Erreur)
-    diff_da = da1_filt - da2_filt
-    diff_da = diff_da.rename("difference")
-    diff_da.attrs['description'] = "Difference (da1_brut - da2_corrige) pour les jours filtres (da2 >= 45°C)"
-
-    # 3.2 Biais (Moyenne de l'erreur sur la dimension spatiale, ou moyenne temporelle si pas de dimensions spatiales)
-    # Le biais est généralement la moyenne temporelle ou spatiale de la différence.
-    # Ici, nous le calculons comme la moyenne spatiale de l'erreur pour chaque pas de temps filtré.
-    bias_da = diff_da.mean(dim=spatial_dims)
-    bias_da = bias_da.rename("bias")
-    bias_da.attrs['description'] = "Biais (Moyenne spatiale de la différence) pour les jours filtres."
-
-    # 3.3 Écart Quadratique Moyen (EQM / RMSE)
-    # EQM pour chaque pas de temps, calculé sur les dimensions spatiales.
-    # $RMSE = \sqrt{\frac{1}{N} \sum_{i} (da1 - da2)^2}$
-    rmse_da = np.sqrt((diff_da**2).mean(dim=spatial_dims))
-    rmse_da = rmse_da.rename("rmse")
-    rmse_da.attrs['description'] = "Ecart Quadratique Moyen (RMSE) calculé spatialement pour chaque jour filtre."
-
-    # --- Étape 4: Création du Dataset et Sauvegarde ---
-    
-    # Créer un Dataset qui contiendra les 3 DataArrays
-    ds_output = xr.Dataset(
-        data_vars={
-            "difference": diff_da,
-            "bias": bias_da,
-            "rmse": rmse_da
-        },
-        coords={
-            "time": da1_filt["time"],
-            "i": da1_filt["i"] if "i" in da1_filt.coords else np.arange(da1_filt.sizes.get("i", 0)),
-            "j": da1_filt["j"] if "j" in da1_filt.coords else np.arange(da1_filt.sizes.get("j", 0))
-        }
-    )
-
-    ds_output.attrs['history'] = f"Calculé à partir de '{file_1}' et '{file_2}'."
-    ds_output.attrs['comment'] = "Contient la différence (spatiale), le biais (moyen spatial), et le RMSE (moyen spatial) uniquement pour les pas de temps où Tasmax corrigé >= 45°C."
-
-    ds_output.to_netcdf(output_name)
-    print(f"\nSuccès ! Fichier '{output_name}' généré avec les variables : difference, bias, rmse.")
-
-except Exception as e:
-    print("\nErreur :", e)
\ No newline at end of file
+if __name__ == "__main__":
+    try:
+        client = demarrer_scheduler(SCHEDULER)
+
+        # Lecture paresseuse par blocs de temps : rien n'est chargé en mémoire ici
+        ds1 = ouvrir_chunks(file_1)
+        ds2 = ouvrir_chunks(file_2)
+
+        # Assurez-vous d'avoir les variables 'tasmax' ou 'tasmaxAdjust'
+        da1 = ds1['tasmax'] if 'tasmax' in ds1 else ds1['tasmaxAdjust']
+        da2 = ds2['tasmax'] if 'tasmax' in ds2 else ds2['tasmaxAdjust']
+
+        # --- Étape 1: Harmonisation des coordonnées ---
+
+        # Récupérer les dimensions du fichier source 1 (tasmax brut)
+        dims_da1 = da1.dims
+        # Assumer que les dimensions du fichier source 2 sont dans le même ordre
+        rename_dict = {old: new for old, new in zip(da2.dims, dims_da1)}
+        da2 = da2.rename(rename_dict)
+
+        # Assigner des coordonnées numériques 'i' et 'j' pour assurer la compatibilité spatiale
+        da2 = da2.assign_coords({
+            "i": np.arange(da1.sizes.get("i", 0)),
+            "j": np.arange(da1.sizes.get("j", 0))
+        })
+
+        # Assigner 'time' à da2 en utilisant celui de da1, pour être sûr de l'alignement
+        if 'time' in da1.coords and 'time' in da2.coords:
+            da2['time'] = da1['time']
+
+        # --- Étape 2: Filtre temporel (condition : Tasmax du second fichier >= 45°C) ---
+
+        # Dimensions spatiales, en supposant que 'time' est la première dimension
+        # Si da2.dims est ('time', 'j', 'i'), spatial_dims sera ('j', 'i')
+        spatial_dims = da2.dims[1:] 
+
+        # Créer le masque : True pour tous les pas de temps où AU MOINS UN point spatial est >= 45
+        # La conversion est supposée être en °C, si c'est en K, 45°C = 318.15 K. 
+        # Je suppose ici que les données sont déjà en °C.
+        mask_time = (da2 >= SEUIL_K).any(dim=spatial_dims)
+
+        # Seul le masque (1 booléen par jour) est calculé à ce stade
+        mask_time, = calculer(mask_time, client=client)
+
+        print(mask_time)
+        plot_bool_hist(mask_time.values.tolist())
+
+        # Appliquer le filtre aux deux DataArray (toujours paresseux)
+        idx_time = np.flatnonzero(mask_time.values)
+        da1_filt = da1.isel(time=idx_time)
+        da2_filt = da2.isel(time=idx_time)
+
+        print(f"Nombre de pas de temps initiaux : {len(da1['time'])}")
+        print(f"Nombre de pas de temps gardés par le filtre (> 45°C) : {mask_time.sum().item()}")
+
+        # --- Étape 3: Calcul des métriques (Différence, Biais, EQM) ---
+
+        # 3.1 Différence (Erreur)
+        diff_da = da1_filt - da2_filt
+        diff_da = diff_da.rename("difference")
+        diff_da.attrs['description'] = "Difference (da1_brut - da2_corrige) pour les jours filtres (da2 >= 45°C)"
+
+        # 3.2 Biais (Moyenne de l'erreur sur la dimension spatiale, ou moyenne temporelle si pas de dimensions spatiales)
+        # Le biais est généralement la moyenne temporelle ou spatiale de la différence.
+        # Ici, nous le calculons comme la moyenne spatiale de l'erreur pour chaque pas de temps filtré.
+        bias_da = diff_da.mean(dim=spatial_dims)
+        bias_da = bias_da.rename("bias")
+        bias_da.attrs['description'] = "Biais (Moyenne spatiale de la différence) pour les jours filtres."
+
+        # 3.3 Écart Quadratique Moyen (EQM / RMSE)
+        # EQM pour chaque pas de temps, calculé sur les dimensions spatiales.
+        # $RMSE = \sqrt{\frac{1}{N} \sum_{i} (da1 - da2)^2}$
+        # Champs en float32 ; seule la moyenne des carrés est accumulée en float64
+        rmse_da = np.sqrt((diff_da**2).mean(dim=spatial_dims, dtype=DTYPE_ACCUMULATION)).astype(DTYPE_CALCUL)
+        rmse_da = rmse_da.rename("rmse")
+        rmse_da.attrs['description'] = "Ecart Quadratique Moyen (RMSE) calculé spatialement pour chaque jour filtre."
+
+        # 3.4 Masque de dépassement par point (da2 >= seuil), 8 points par octet
+        depasse = da2_filt >= SEUIL_K
+        dim_bits = depasse.dims[-1]
+        n_bits = depasse.sizes[dim_bits]
+        octets = depasse.data.map_blocks(lambda m: empaqueter_masque(m)[0], dtype=np.uint8,
+                                         chunks=depasse.data.chunks[:-1] + (((n_bits + 7) // 8,),))
+        masque_da = xr.DataArray(octets, dims=depasse.dims[:-1] + (f"{dim_bits}_octet",),
+                                 name="depassement")
+        masque_da.attrs['description'] = (f"Masque da2 >= {SEUIL_K} K empaqueté en bits le long de "
+                                          f"'{dim_bits}' (commun.depaqueter_masque(octets, n_bits)).")
+        masque_da.attrs['n_bits'] = n_bits
+
+        # --- Étape 4: Création du Dataset et Sauvegarde ---
+
+        # Créer un Dataset qui contiendra les 3 DataArrays
+        ds_output = xr.Dataset(
+            data_vars={
+                "difference": diff_da,
+                "bias": bias_da,
+                "rmse": rmse_da,
+                "depassement": masque_da
+            },
+            coords={
+                "time": da1_filt["time"],
+                "i": da1_filt["i"] if "i" in da1_filt.coords else np.arange(da1_filt.sizes.get("i", 0)),
+                "j": da1_filt["j"] if "j" in da1_filt.coords else np.arange(da1_filt.sizes.get("j", 0))
+            }
+        )
+
+        ds_output.attrs['history'] = f"Calculé à partir de '{file_1}' et '{file_2}'."
+        ds_output.attrs['comment'] = "Contient la différence (spatiale), le biais (moyen spatial), et le RMSE (moyen spatial) uniquement pour les pas de temps où Tasmax corrigé >= 45°C."
+
+        # Écriture bloc par bloc : le graphe dask est exécuté au moment de l'écriture
+        # Différence stockée en int16 au 1/100 (moitié moins de disque que float32)
+        delayed_write = ds_output.to_netcdf(output_name, compute=False,
+                                            encoding=encodage_int16("difference"))
+        calculer(delayed_write, client=client)
+        print(f"\nSuccès ! Fichier '{output_name}' généré avec les variables : difference, bias, rmse, depassement.")
+
+    except Exception as e:
+        # Code de sortie non nul : tx50.py n'écrit pas de manifeste pour un échec
+        sys.exit(f"\nErreur : {e}")
@@ -0,0 +1,139 @@
+import numpy as np
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from commun import base_path, path_obs, file_obs, VAR_NAMES, load_and_clean
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Service obs partagé : le fichier SAFRAN est décodé une seule fois par
+# machine (°C, années, float32) dans un .npy ; chaque script / processus
+# l'ouvre ensuite en mmap lecture seule, sans copie ni relecture NetCDF.
+# /dev/shm (mémoire partagée) si disponible, sinon un dossier de cache.
+
+REP_PARTAGE = ("/dev/shm/tx50" if os.path.isdir("/dev/shm")
+               else os.path.join(base_path, "cache_obs"))
+
+# Lecture journalière : taille des blocs lus en arrière-plan (jours)
+PREFETCH_JOURS = 365
+
+# =========================================================
+# PUBLICATION / LECTURE
+# =========================================================
+
+def _base(filepath, rep):
+    """Nom des fichiers partagés, lié à la taille et la date du NetCDF."""
+    st = os.stat(filepath)
+    nom = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(rep, nom), f"{st.st_size}_{st.st_mtime_ns}"
+
+
+def publier(path=path_obs, filename=file_obs, rep=REP_PARTAGE):
+    """
+    Décode l'obs et écrit valeurs (.npy) + coordonnées (.npz) si ce n'est
+    pas déjà fait. Retourne le préfixe des fichiers, None si obs illisible.
+    """
+    full_path = os.path.join(path, filename)
+    if not os.path.exists(full_path):
+        return None
+
+    nom, version = _base(full_path, rep)
+    base = f"{nom}_{version}"
+    if os.path.exists(base + ".npy"):
+        return base
+
+    da = load_and_clean(path, filename)
+    if da is None:
+        return None
+
+    os.makedirs(rep, exist_ok=True)
+    meta = {"dims": np.array(da.dims, dtype=str), "name": np.array(da.name or "tasmax")}
+    for c_nom, c in da.coords.items():
+        meta[f"coord__{c_nom}"] = c.values
+        meta[f"dims__{c_nom}"] = np.array(c.dims, dtype=str)
+
+    # Écriture sous un nom temporaire puis renommage : plusieurs processus
+    # peuvent publier en même temps, le .npy (renommé en dernier) signale
+    # une publication complète
+    tmp = f"{base}.{os.getpid()}"
+    np.savez(tmp + ".npz", **meta)
+    np.save(tmp + ".npy", np.ascontiguousarray(da.values, dtype=np.float32))
+    os.replace(tmp + ".npz", base + ".npz")
+    os.replace(tmp + ".npy", base + ".npy")
+
+    # Versions précédentes du même fichier
+    for ancien in glob.glob(f"{nom}_*.np[yz]"):
+        if not ancien.startswith(base + "."):
+            try:
+                os.remove(ancien)
+            except OSError:
+                pass
+
+    return base
+
+
+def charger_obs(path=path_obs, filename=file_obs, rep=REP_PARTAGE):
+    """
+    Même résultat que load_and_clean(path_obs, file_obs), en float32 :
+    DataArray adossé à un mmap lecture seule, partagé entre processus.
+    """
+    import xarray as xr
+
+    base = publier(path, filename, rep)
+    if base is None:
+        return None
+
+    data = np.load(base + ".npy", mmap_mode="r")
+    with np.load(base + ".npz") as meta:
+        coords = {}
+        for cle in meta.files:
+            if cle.startswith("coord__"):
+                c_nom = cle[len("coord__"):]
+                coords[c_nom] = ([str(d) for d in meta[f"dims__{c_nom}"]], meta[cle])
+        dims = [str(d) for d in meta["dims"]]
+        name = str(meta["name"])
+
+    return xr.DataArray(data, dims=dims, coords=coords, name=name)
+
+# =========================================================
+# LECTURE JOURNALIÈRE AVEC PRÉCHARGEMENT
+# =========================================================
+
+def blocs_journaliers(filepath, var=None, jours=PREFETCH_JOURS):
+    """
+    Itère sur (temps, valeurs float32 en °C) par blocs de `jours` ; le bloc
+    suivant est lu et décodé dans un thread pendant le traitement du courant.
+    """
+    import xarray as xr
+
+    with xr.open_dataset(filepath) as ds:
+        da = ds[var or next(v for v in VAR_NAMES if v in ds)]
+        n_time = da.sizes["time"]
+
+        def lire(t0):
+            bloc = da.isel(time=slice(t0, t0 + jours))
+            v = bloc.values.astype(np.float32)
+            if np.nanmean(v) > 200:
+                v -= np.float32(273.15)
+            return bloc.time.values, v
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            suivant = pool.submit(lire, 0) if n_time else None
+            for t0 in range(0, n_time, jours):
+                courant = suivant.result()
+                if t0 + jours < n_time:
+                    suivant = pool.submit(lire, t0 + jours)
+                yield courant
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    base = publier()
+    if base is None:
+        raise SystemExit("Impossible de charger les observations")
+    da = charger_obs()
+    print(f"-> Obs partagées : {base}.npy ({da.nbytes / 1e6:.1f} Mo, {dict(da.sizes)})")
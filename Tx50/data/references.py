@@ -0,0 +1,233 @@
+import xarray as xr
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import hashlib
+import os
+
+from commun import (base_path, path_brut, path_cor, path_obs, file_obs, DTYPE_CALCUL,
+                    model_files, model_name, paires_modeles, align_spatial, positions)
+from obs_partage import charger_obs
+from cache_seuils import THRESHOLDS, VERSIONS, sommes_par_seuil, rmse_moyen, biais_annuel
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Évaluation brut / cor contre plusieurs références en une seule lecture
+# de chaque fichier modèle :
+#   "safran" : grille des modèles (alignement par dimensions, comme partout)
+#   "grille" : TXx annuel sur une autre grille (ERA5...), interpolé une
+#              fois sur la grille SAFRAN (k voisins, inverse distance)
+#   "points" : TXx annuels de stations (CSV station, lon, lat, annee, txx),
+#              les modèles sont lus au point de grille le plus proche
+# Les poids d'interpolation (matrices creuses) sont mis en cache, indexés
+# par une empreinte des deux jeux de coordonnées.
+
+REFERENCES = {
+    "SAFRAN":   ("safran", os.path.join(path_obs, file_obs)),
+    "ERA5":     ("grille", os.path.join(path_obs, "txx_ERA5_year.nc")),
+    "stations": ("points", os.path.join(path_obs, "txx_stations.csv")),
+}
+
+K_VOISINS = 4            # grille -> grille SAFRAN
+K_VOISINS_STATIONS = 1   # grille modèle -> station
+
+path_poids = os.path.join(base_path, "poids_references/")
+file_cache = os.path.join(base_path, "cache_references.nc")
+
+# =========================================================
+# POIDS D'INTERPOLATION
+# =========================================================
+
+def poids_voisins(pos_source, pos_cible, k):
+    """Matrice creuse (n_cible, n_source) : k plus proches voisins, poids en 1 / distance."""
+    from scipy.spatial import cKDTree
+
+    k = min(k, len(pos_source))
+    d, j = cKDTree(pos_source).query(pos_cible, k=k)
+    d, j = d.reshape(len(pos_cible), k), j.reshape(len(pos_cible), k)
+    w = 1.0 / np.maximum(d, 1e-12)
+    return sp.csr_matrix((w.ravel(), (np.repeat(np.arange(len(pos_cible)), k), j.ravel())),
+                         shape=(len(pos_cible), len(pos_source)))
+
+
+def charger_ou_calculer_poids(nom, pos_source, pos_cible, k):
+    """Poids relus du cache si les coordonnées n'ont pas changé, sinon calculés et sauvés."""
+    h = hashlib.sha256()
+    for a in (pos_source, pos_cible):
+        h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+    h.update(str(k).encode())
+    cache = os.path.join(path_poids, f"poids_{nom}_{h.hexdigest()[:16]}.npz")
+    if os.path.exists(cache):
+        return sp.load_npz(cache)
+
+    W = poids_voisins(pos_source, pos_cible, k)
+    os.makedirs(path_poids, exist_ok=True)
+    sp.save_npz(cache, W)
+    return W
+
+
+def appliquer_poids(W, x):
+    """x (n_temps, n_source) -> (n_temps, n_cible), poids renormalisés sur les valeurs non NaN."""
+    ok = np.isfinite(x)
+    num = W @ np.where(ok, x, 0).T
+    den = W @ ok.T.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan).T.astype(DTYPE_CALCUL)
+
+# =========================================================
+# RÉFÉRENCES
+# =========================================================
+# Une référence = années, valeurs (n_annees, n_points d'évaluation) et
+# projection des champs modèles (grille SAFRAN aplatie) sur ces points
+# (None : mêmes points).
+
+def _reference_grille(nom, chemin, da_grille, terre):
+    da = charger_obs(os.path.dirname(chemin), os.path.basename(chemin))
+    if da is None:
+        return None
+    dims = [d for d in da.dims if d != "time"]
+    x = da.transpose("time", *dims).values.reshape(da.sizes["time"], -1)
+
+    pos_src, sph_src = positions(da)
+    pos_cib, sph_cib = positions(da_grille)
+    if not (sph_src and sph_cib):
+        raise ValueError(f"{nom} : lon/lat nécessaires pour l'interpolation")
+    W = charger_ou_calculer_poids(nom, pos_src, pos_cib, K_VOISINS)
+
+    valeurs = appliquer_poids(W, x)
+    valeurs[:, ~terre] = np.nan      # même domaine que SAFRAN
+    return {"annees": np.asarray(da.time.values), "valeurs": valeurs, "projection": None}
+
+
+def _reference_points(nom, chemin, da_grille, terre):
+    df = pd.read_csv(chemin)
+    tab = df.pivot_table(index="annee", columns="station", values="txx", aggfunc="max")
+    coords = df.groupby("station")[["lon", "lat"]].first().loc[tab.columns]
+
+    lon, lat = np.radians(coords["lon"].values), np.radians(coords["lat"].values)
+    pos_st = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    pos_grille, sph = positions(da_grille)
+    if not sph:
+        raise ValueError(f"{nom} : lon/lat de la grille nécessaires pour placer les stations")
+
+    # Voisins cherchés parmi les points de terre uniquement
+    W = charger_ou_calculer_poids(nom, pos_grille[terre], pos_st, K_VOISINS_STATIONS)
+    W = sp.csr_matrix((W.data, np.flatnonzero(terre)[W.indices], W.indptr),
+                      shape=(len(pos_st), terre.size))
+    return {"annees": tab.index.to_numpy(), "valeurs": tab.to_numpy(DTYPE_CALCUL),
+            "projection": W, "points": list(tab.columns)}
+
+
+def charger_references(da_grille, references=REFERENCES):
+    """{nom: référence} pour les fichiers présents ; chaque référence n'est préparée qu'une fois."""
+    dims = [d for d in da_grille.dims if d != "time"]
+    terre = np.isfinite(da_grille.transpose("time", *dims).values
+                        .reshape(da_grille.sizes["time"], -1)).any(axis=0)
+
+    refs = {}
+    for nom, (genre, chemin) in references.items():
+        if not os.path.exists(chemin):
+            print(f" -> Référence {nom} absente : {chemin}")
+            continue
+        if genre == "safran":
+            x = da_grille.transpose("time", *dims).values.reshape(da_grille.sizes["time"], -1)
+            refs[nom] = {"annees": np.asarray(da_grille.time.values), "valeurs": x, "projection": None}
+        elif genre == "grille":
+            ref = _reference_grille(nom, chemin, da_grille, terre)
+            if ref is not None:
+                refs[nom] = ref
+        elif genre == "points":
+            refs[nom] = _reference_points(nom, chemin, da_grille, terre)
+        else:
+            raise ValueError(f"Type de référence inconnu : {genre}")
+    return refs
+
+# =========================================================
+# ÉVALUATION EN UNE PASSE
+# =========================================================
+
+def remplir_modele_refs(da_b, da_c, refs, all_years, thresholds=THRESHOLDS):
+    """
+    Champs brut / cor déjà alignés sur la grille SAFRAN -> tableau
+    (référence, version, stat, seuil, année) ; filtre Tx_ref >= seuil.
+    """
+    years_modele = np.intersect1d(da_b.time.values, da_c.time.values)
+    dims = [d for d in da_b.dims if d != "time"]
+    champs = [da.sel(time=years_modele).transpose("time", *dims).values.reshape(len(years_modele), -1)
+              for da in (da_b, da_c)]
+
+    out = np.zeros((len(refs), len(VERSIONS), 3, len(thresholds), len(all_years)))
+    for ir, ref in enumerate(refs.values()):
+        years = np.intersect1d(years_modele, ref["annees"])
+        if not years.size:
+            continue
+        im = np.searchsorted(years_modele, years)
+        o = ref["valeurs"][np.searchsorted(ref["annees"], years)]
+        b, c = (x[im] for x in champs)
+        if ref["projection"] is not None:
+            b, c = appliquer_poids(ref["projection"], b), appliquer_poids(ref["projection"], c)
+
+        iy = np.searchsorted(all_years, years)
+        for k in range(len(years)):
+            out[ir, ..., iy[k]] = sommes_par_seuil(o[k], [b[k] - o[k], c[k] - o[k]], thresholds)
+    return out
+
+
+def construire_cache_references(thresholds=THRESHOLDS, out_file=file_cache):
+    """Une passe sur les modèles, toutes références ; écrit et retourne le Dataset."""
+    da_grille = charger_obs()
+    if da_grille is None:
+        raise RuntimeError("Impossible de charger la grille SAFRAN")
+
+    refs = charger_references(da_grille)
+    if not refs:
+        raise RuntimeError("Aucune référence disponible")
+    all_years = np.unique(np.concatenate([r["annees"] for r in refs.values()]))
+
+    models, blocs = [], []
+    for filename, da_b, da_c in paires_modeles(model_files, (path_brut, path_cor)):
+        model = model_name(filename)
+        print(f"--- {model} ---")
+        if da_b is None or da_c is None:
+            print(" -> Fichier manquant ou invalide")
+            continue
+        da_b, da_c = align_spatial(da_b, da_grille), align_spatial(da_c, da_grille)
+        if da_b is None or da_c is None:
+            print(" -> Alignement impossible")
+            continue
+        models.append(model)
+        blocs.append(remplir_modele_refs(da_b, da_c, refs, all_years, thresholds))
+
+    data = np.stack(blocs)
+    dims = ["model", "reference", "version", "threshold", "year"]
+    ds = xr.Dataset(
+        data_vars={
+            "count": (dims, data[:, :, :, 0].astype(np.int32)),
+            "sum":   (dims, data[:, :, :, 1]),
+            "sumsq": (dims, data[:, :, :, 2]),
+        },
+        coords={"model": models, "reference": list(refs), "version": VERSIONS,
+                "threshold": np.asarray(thresholds, dtype=float), "year": all_years},
+    )
+    ds.attrs["comment"] = ("Sommes de (modèle - référence) sur les points où Tx_ref >= seuil ; "
+                           "threshold = -inf : tous les points.")
+    ds.to_netcdf(out_file)
+    print(f"-> Cache écrit : {out_file}")
+    return ds
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    ds = construire_cache_references()
+
+    seuils = [THRESHOLDS[0], 35.0, 40.0]
+    r = rmse_moyen(ds).mean(dim="model", skipna=True)
+    b = biais_annuel(ds).mean(dim=["model", "year"], skipna=True)
+    for version in VERSIONS:
+        print(f"\n--- RMSE moyen multi-modèles ({version}) ---")
+        print(r.sel(version=version, threshold=seuils).to_pandas().round(2))
+        print(f"--- Biais moyen multi-modèles ({version}) ---")
+        print(b.sel(version=version, threshold=seuils).to_pandas().round(2))
@@ -0,0 +1,215 @@
+import xarray as xr
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import json
+import os
+
+from commun import (base_path, path_cor,
+                    model_files, model_name, paires_modeles, align_spatial, grille_lonlat)
+from obs_partage import charger_obs
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Masques régions / départements sur la grille SAFRAN, calculés une fois
+# et stockés comme index point de grille -> région. Toute réduction
+# spatiale (RMSE, biais, comptes de dépassement, TXx) devient un produit
+# matrice creuse x cube.
+
+path_regions = os.path.join(base_path, "regions/")
+
+# GeoJSON des contours (ex : france-geojson, propriété "nom")
+REGION_FILES = {
+    "regions":      os.path.join(path_regions, "regions.geojson"),
+    "departements": os.path.join(path_regions, "departements.geojson"),
+}
+NAME_PROPERTY = "nom"
+
+TEMP_THRESHOLD = 50.0
+
+# =========================================================
+# RASTÉRISATION
+# =========================================================
+
+def lire_polygones(geojson_file, name_property=NAME_PROPERTY):
+    """{nom: [(anneau extérieur, [trous])]} depuis un GeoJSON (lon, lat)."""
+    with open(geojson_file, encoding="utf-8") as f:
+        features = json.load(f)["features"]
+
+    polygones = {}
+    for feat in features:
+        geom = feat["geometry"]
+        nom = feat["properties"][name_property]
+        if geom["type"] == "Polygon":
+            parts = [geom["coordinates"]]
+        elif geom["type"] == "MultiPolygon":
+            parts = geom["coordinates"]
+        else:
+            continue
+        polygones.setdefault(nom, []).extend(
+            (np.asarray(p[0]), [np.asarray(h) for h in p[1:]]) for p in parts
+        )
+    return polygones
+
+
+def rasteriser(polygones, lon, lat):
+    """
+    Index région de chaque point de grille (centre de maille), -1 hors régions.
+    Un point sur une frontière est attribué à la première région rencontrée.
+    """
+    from matplotlib.path import Path
+
+    pts = np.column_stack([lon.ravel(), lat.ravel()])
+    region_id = np.full(pts.shape[0], -1, dtype=np.int16)
+
+    for r, (nom, parts) in enumerate(polygones.items()):
+        libre = region_id < 0
+        for ext, trous in parts:
+            # Pré-filtre sur la boîte englobante avant le test point-polygone
+            bb = (libre
+                  & (pts[:, 0] >= ext[:, 0].min()) & (pts[:, 0] <= ext[:, 0].max())
+                  & (pts[:, 1] >= ext[:, 1].min()) & (pts[:, 1] <= ext[:, 1].max()))
+            idx = np.flatnonzero(bb)
+            if idx.size == 0:
+                continue
+            dedans = Path(ext).contains_points(pts[idx])
+            for h in trous:
+                dedans &= ~Path(h).contains_points(pts[idx])
+            region_id[idx[dedans]] = r
+            libre[idx[dedans]] = False
+
+    return region_id.reshape(lon.shape)
+
+# =========================================================
+# INDEX CREUX
+# =========================================================
+
+def construire_index(da_grille, geojson_file):
+    """Index {'noms', 'region_id' (y, x)} pour la grille de da_grille."""
+    polygones = lire_polygones(geojson_file)
+    lon, lat = grille_lonlat(da_grille)
+    return {"noms": list(polygones), "region_id": rasteriser(polygones, lon, lat)}
+
+
+def sauver_index(index, out_file):
+    np.savez_compressed(out_file, noms=np.array(index["noms"]), region_id=index["region_id"])
+
+
+def charger_index(in_file):
+    with np.load(in_file) as f:
+        return {"noms": [str(n) for n in f["noms"]], "region_id": f["region_id"]}
+
+
+def charger_ou_construire_index(niveau, da_grille):
+    """Relit l'index du niveau ('regions', 'departements') ou le construit."""
+    cache = os.path.join(path_regions, f"index_{niveau}.npz")
+    if os.path.exists(cache):
+        index = charger_index(cache)
+        if index["region_id"].shape == tuple(da_grille.shape[-2:]):
+            return index
+
+    index = construire_index(da_grille, REGION_FILES[niveau])
+    os.makedirs(path_regions, exist_ok=True)
+    sauver_index(index, cache)
+    return index
+
+
+def matrice_regions(index):
+    """Matrice creuse (n_regions, n_points) d'appartenance (0/1)."""
+    rid = index["region_id"].ravel()
+    pts = np.flatnonzero(rid >= 0)
+    return sp.csr_matrix(
+        (np.ones(pts.size), (rid[pts], pts)),
+        shape=(len(index["noms"]), rid.size),
+    )
+
+# =========================================================
+# RÉDUCTIONS
+# =========================================================
+
+def reduire_regions(da, index, stat="mean"):
+    """
+    Réduit un cube (time, y, x) ou une carte (y, x) en séries par région.
+    stat : 'mean' (NaN ignorés), 'sum' ou 'max'.
+    Retourne un DataArray (region[, time]).
+    """
+    spatial = [d for d in da.dims if d != 'time']
+    autres = [d for d in da.dims if d not in spatial]
+    n_points = da.sizes[spatial[0]] * da.sizes[spatial[1]]
+    X = da.transpose(*spatial, *autres).values.reshape(n_points, -1).astype(np.float64)
+
+    if stat == "max":
+        rid = index["region_id"].ravel()
+        out = np.full((len(index["noms"]), X.shape[1]), np.nan)
+        for r in range(len(index["noms"])):
+            sel = X[rid == r]
+            if sel.size:
+                out[r] = np.nanmax(sel, axis=0)
+    else:
+        W = matrice_regions(index)
+        valide = np.isfinite(X)
+        somme = W @ np.where(valide, X, 0.0)
+        if stat == "sum":
+            out = somme
+        else:
+            n = W @ valide.astype(np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out = somme / n
+
+    coords = {"region": index["noms"]}
+    for d in autres:
+        coords[d] = da[d].values
+    out = out.reshape([len(index["noms"])] + [da.sizes[d] for d in autres])
+    return xr.DataArray(out, dims=["region"] + autres, coords=coords)
+
+
+def rmse_regions(diff, index):
+    """RMSE régional : racine de la moyenne régionale des carrés."""
+    return np.sqrt(reduire_regions(diff ** 2, index, stat="mean"))
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    print("Chargement observations (grille SAFRAN)...")
+    da_obs = charger_obs()
+    if da_obs is None:
+        raise RuntimeError("Impossible de charger les observations")
+
+    for niveau in REGION_FILES:
+        if not os.path.exists(REGION_FILES[niveau]):
+            print(f" -> Contours {niveau} absents : {REGION_FILES[niveau]}")
+            continue
+
+        index = charger_ou_construire_index(niveau, da_obs)
+        print(f"\n=== {niveau} : {len(index['noms'])} zones ===")
+
+        lignes = []
+        for filename, da_c in paires_modeles(model_files, (path_cor,)):
+            if da_c is None:
+                continue
+            da_c = align_spatial(da_c, da_obs)
+            if da_c is None:
+                continue
+
+            counts = reduire_regions((da_c >= TEMP_THRESHOLD).astype(np.float32), index, stat="sum")
+            txx = reduire_regions(da_c, index, stat="max")
+            for r, nom in enumerate(index["noms"]):
+                lignes.append({
+                    "modele": model_name(filename),
+                    "zone": nom,
+                    "points_annees_gt50": float(counts[r].sum()),
+                    "annees_gt50": int((counts[r] > 0).sum()),
+                    "txx_max": float(np.nanmax(txx[r])),
+                })
+
+        df = pd.DataFrame(lignes)
+        out = os.path.join(path_regions, f"depassements_{niveau}.csv")
+        df.to_csv(out, index=False)
+
+        classement = (df.groupby("zone")["annees_gt50"].sum()
+                        .sort_values(ascending=False))
+        print(classement.head(10))
+        print(f" -> {out}")
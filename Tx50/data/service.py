@@ -0,0 +1,291 @@
+import numpy as np
+import json
+import os
+import sys
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from cache_seuils import (file_cache, rmse_annuel, biais_annuel, rmse_moyen)
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Service de requêtes local (hors ligne) sur les résultats déjà calculés :
+# cache des métriques par seuil (cache_seuils.nc), cache multi-références
+# s'il existe, et inventaire Tx50. Tout est chargé une fois en mémoire
+# avec des index par modèle, GCM, seuil, année, décennie et niveau de
+# réchauffement ; les requêtes ne font que des recherches dans ces index.
+#
+#   python service.py serve [port]               serveur HTTP/JSON
+#   python service.py rmse modele=NorESM1-M_HIRHAM5 seuil=40
+#   python service.py tx50 gcm=HadGEM2-ES decennie=2080
+#
+# Routes HTTP : /modeles, /rmse, /biais, /tx50 (mêmes paramètres en query
+# string, valeurs multiples séparées par des virgules).
+
+HOTE = "127.0.0.1"
+PORT = 8050
+
+# Colonnes de l'inventaire renvoyées par /tx50
+COLONNES_TX50 = ["modele", "date", "niveau", "warming", "warming_max", "warming_ouvert",
+                 "qualificatif", "N45", "N50", "T_max", "commentaire", "source"]
+
+# =========================================================
+# CHARGEMENT ET INDEX
+# =========================================================
+
+def _index(valeurs):
+    """{valeur: position} d'un axe."""
+    return {v: i for i, v in enumerate(valeurs)}
+
+
+def _index_lignes(df, col):
+    """{valeur: indices des lignes} d'une colonne de l'inventaire."""
+    return {k: np.asarray(v) for k, v in df.groupby(col, observed=True).indices.items()}
+
+
+def charger_metriques(fichier, axe):
+    """
+    Cache (model, axe, version, threshold, year) -> RMSE / biais annuels et
+    RMSE moyen en tableaux numpy, avec l'index de chaque axe. None si absent.
+    """
+    import xarray as xr
+
+    if not os.path.exists(fichier):
+        return None
+    ds = xr.load_dataset(fichier)
+    ordre = ["model", axe, "version", "threshold", "year"]
+    return {
+        "axe": axe,
+        "rmse": rmse_annuel(ds).transpose(*ordre).values,
+        "biais": biais_annuel(ds).transpose(*ordre).values,
+        "rmse_moyen": rmse_moyen(ds).transpose(*ordre[:-1]).values,
+        "biais_moyen": biais_annuel(ds).mean(dim="year", skipna=True).transpose(*ordre[:-1]).values,
+        "index": {"model": _index(ds.model.values.astype(str).tolist()),
+                  axe: _index(ds[axe].values.astype(str).tolist()),
+                  "version": _index(ds.version.values.astype(str).tolist()),
+                  "threshold": _index(ds.threshold.values.astype(float).tolist()),
+                  "year": _index(ds.year.values.astype(int).tolist())},
+    }
+
+
+def charger_inventaire_indexe():
+    """Inventaire Tx50 et index de lignes, None si l'inventaire est illisible."""
+    from inventaire import charger_inventaire
+
+    try:
+        df = charger_inventaire()
+    except (OSError, ValueError) as e:
+        print(f" -> Inventaire indisponible : {e}")
+        return None
+
+    lignes = df[[c for c in COLONNES_TX50 if c in df]].copy()
+    lignes["date"] = lignes["date"].dt.strftime("%Y-%m-%d")
+    lignes = lignes.astype(object).where(lignes.notna(), None)
+    return {
+        "lignes": lignes.to_dict("records"),
+        "index": {
+            "modele": _index_lignes(df, "modele"),
+            "gcm": _index_lignes(df, "gcm"),
+            "rcm": _index_lignes(df, "rcm"),
+            "annee": _index_lignes(df, "annee"),
+            "decennie": _index_lignes(df, "decennie"),
+            "niveau": _index_lignes(df, "niveau"),
+            "warming": _index_lignes(df, "warming"),
+            "apres_2050": _index_lignes(df, "apres_2050"),
+        },
+        "n": len(df),
+    }
+
+
+def charger():
+    """Toutes les données du service (lecture seule, partagées entre threads)."""
+    from references import file_cache as file_references
+
+    debut = time.perf_counter()
+    donnees = {
+        "seuils": charger_metriques(file_cache, "condition"),
+        "references": charger_metriques(file_references, "reference"),
+        "inventaire": charger_inventaire_indexe(),
+    }
+    print(f"Données chargées en {time.perf_counter() - debut:.2f} s")
+    return donnees
+
+# =========================================================
+# REQUÊTES
+# =========================================================
+
+class RequeteInvalide(ValueError):
+    pass
+
+
+def _liste(params, cle, defaut=None):
+    """Valeurs d'un paramètre ('a,b' ou répété), défaut si absent."""
+    vals = [v for brut in params.get(cle, []) for v in str(brut).split(",") if v != ""]
+    return vals if vals else defaut
+
+
+def _seuil(v):
+    return -np.inf if v in ("aucun", "-inf") else float(v)
+
+
+def _modeles(metr, params):
+    """Modèles demandés : noms exacts, ou GCM (préfixe avant '_')."""
+    noms = list(metr["index"]["model"])
+    demandes = _liste(params, "modele")
+    gcms = _liste(params, "gcm")
+    if demandes is None and gcms is None:
+        return noms
+    res = [m for m in noms if (demandes and m in demandes)
+           or (gcms and m.split("_", 1)[0] in gcms)]
+    if not res:
+        raise RequeteInvalide(f"Aucun modèle ne correspond (modèles : {', '.join(noms)})")
+    return res
+
+
+def _positions(index, valeurs, nom):
+    try:
+        return [index[v] for v in valeurs]
+    except KeyError as e:
+        raise RequeteInvalide(f"{nom} inconnu : {e.args[0]} (disponibles : {list(index)})")
+
+
+def metrique(donnees, stat, params):
+    """RMSE ou biais par modèle, condition / référence, version, seuil (et année)."""
+    source = "references" if "reference" in params else "seuils"
+    metr = donnees[source]
+    if metr is None:
+        raise RequeteInvalide(f"Cache '{source}' absent")
+    axe, idx = metr["axe"], metr["index"]
+
+    modeles = _modeles(metr, params)
+    axes = _liste(params, axe, ["cor"] if axe == "condition" else list(idx[axe]))
+    versions = _liste(params, "version", list(idx["version"]))
+    seuils = [_seuil(v) for v in _liste(params, "seuil", ["aucun"])]
+    annees = _liste(params, "annee")
+
+    im = _positions(idx["model"], modeles, "modèle")
+    ia = _positions(idx[axe], axes, axe)
+    iv = _positions(idx["version"], versions, "version")
+    it = _positions(idx["threshold"], seuils, "seuil")
+
+    if annees is None:
+        bloc = metr[f"{stat}_moyen"][np.ix_(im, ia, iv, it)]
+    else:
+        iy = _positions(idx["year"], [int(a) for a in annees], "année")
+        bloc = metr[stat][np.ix_(im, ia, iv, it, iy)]
+
+    res = []
+    for a, m in enumerate(modeles):
+        for b, x in enumerate(axes):
+            for c, v in enumerate(versions):
+                for d, s in enumerate(seuils):
+                    ligne = {"modele": m, axe: x, "version": v,
+                             "seuil": None if np.isinf(s) else s}
+                    val = bloc[a, b, c, d]
+                    if annees is None:
+                        ligne[stat] = None if np.isnan(val) else round(float(val), 4)
+                    else:
+                        ligne[stat] = {int(y): (None if np.isnan(z) else round(float(z), 4))
+                                       for y, z in zip(annees, val)}
+                    res.append(ligne)
+    return res
+
+
+def tx50(donnees, params):
+    """Événements de l'inventaire : intersection des index demandés."""
+    inv = donnees["inventaire"]
+    if inv is None:
+        raise RequeteInvalide("Inventaire absent")
+
+    conversions = {"annee": int, "decennie": int, "warming": float,
+                   "apres_2050": lambda v: v.lower() in ("1", "true", "oui")}
+    lignes = None
+    for cle, index in inv["index"].items():
+        vals = _liste(params, cle)
+        if vals is None:
+            continue
+        conv = conversions.get(cle, str)
+        sel = [index[conv(v)] for v in vals if conv(v) in index]
+        sel = np.unique(np.concatenate(sel)) if sel else np.zeros(0, dtype=np.int64)
+        lignes = sel if lignes is None else np.intersect1d(lignes, sel, assume_unique=True)
+
+    if lignes is None:
+        lignes = np.arange(inv["n"])
+    return [inv["lignes"][i] for i in lignes]
+
+
+def repondre(donnees, route, params):
+    """(statut HTTP, objet JSON) d'une requête."""
+    debut = time.perf_counter()
+    try:
+        if route == "modeles":
+            res = {k: list(donnees[k]["index"]["model"]) if donnees[k] else []
+                   for k in ("seuils", "references")}
+            inv = donnees["inventaire"]
+            res["inventaire"] = sorted(map(str, inv["index"]["modele"])) if inv else []
+        elif route in ("rmse", "biais"):
+            res = metrique(donnees, route, params)
+        elif route == "tx50":
+            res = tx50(donnees, params)
+        else:
+            return 404, {"erreur": f"Route inconnue : /{route} (modeles, rmse, biais, tx50)"}
+    except (RequeteInvalide, ValueError) as e:
+        return 400, {"erreur": str(e)}
+    return 200, {"resultats": res, "duree_ms": round(1000 * (time.perf_counter() - debut), 3)}
+
+# =========================================================
+# SERVEUR HTTP
+# =========================================================
+
+def creer_serveur(donnees, hote=HOTE, port=PORT):
+    """Serveur multi-threads ; tous les threads lisent la même copie des données."""
+
+    class Gestionnaire(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            statut, corps = repondre(donnees, url.path.strip("/"), parse_qs(url.query))
+            data = json.dumps(corps, ensure_ascii=False).encode("utf-8")
+            self.send_response(statut)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    serveur = ThreadingHTTPServer((hote, port), Gestionnaire)
+    serveur.daemon_threads = True
+    return serveur
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        print("Usage : python service.py serve [port]  |  python service.py <route> cle=valeur ...")
+        print("Routes : modeles, rmse, biais, tx50")
+        sys.exit(1)
+
+    donnees = charger()
+
+    if args[0] == "serve":
+        port = int(args[1]) if len(args) > 1 else PORT
+        serveur = creer_serveur(donnees, port=port)
+        print(f"Service Tx50 : http://{HOTE}:{port}/ (Ctrl+C pour arrêter)")
+        try:
+            serveur.serve_forever()
+        except KeyboardInterrupt:
+            serveur.server_close()
+    else:
+        params = {}
+        for a in args[1:]:
+            cle, _, val = a.partition("=")
+            params.setdefault(cle, []).append(val)
+        statut, corps = repondre(donnees, args[0], params)
+        print(json.dumps(corps, ensure_ascii=False, indent=2))
+        sys.exit(0 if statut == 200 else 1)
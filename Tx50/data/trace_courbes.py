@@ -0,0 +1,170 @@
+import numpy as np
+import json
+
+from commun import pyplot
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Tracé de nombreuses courbes (une par modèle) : une seule LineCollection,
+# labels en bout de courbe placés par tri + balayage (O(n log n)), sortie
+# PNG statique et HTML interactif autonome (sans dépendance).
+
+MIN_DY = 0.15          # séparation verticale minimale des labels (unités de y)
+DECALAGE_LABEL = 0.3   # décalage horizontal label / dernier point (unités de x)
+PALETTE = "tab20"
+
+# =========================================================
+# LABELS
+# =========================================================
+
+def derniers_points(x, Y):
+    """Dernier point valide de chaque courbe : (indices des courbes, x, y)."""
+    ok = np.isfinite(Y)
+    garde = np.flatnonzero(ok.any(axis=1))
+    i_fin = Y.shape[1] - 1 - np.argmax(ok[garde, ::-1], axis=1)
+    return garde, np.asarray(x)[i_fin], Y[garde, i_fin]
+
+
+def placer_labels(y, min_dy=MIN_DY):
+    """
+    Positions verticales des labels, espacées d'au moins min_dy : tri puis
+    balayage, chaque label étant repoussé vers le haut si besoin.
+    p_i = max(y_i, p_{i-1} + min_dy), soit un maximum cumulé de y_i - i*min_dy.
+    """
+    y = np.asarray(y, dtype=float)
+    order = np.argsort(y, kind="stable")
+    decal = min_dy * np.arange(y.size)
+    pos = np.empty_like(y)
+    pos[order] = np.maximum.accumulate(y[order] - decal) + decal
+    return pos
+
+# =========================================================
+# SORTIES
+# =========================================================
+
+def couleurs(n, palette=PALETTE):
+    """n couleurs RGBA réparties sur la palette, répétée au-delà de sa taille."""
+    plt = pyplot()
+    cmap = plt.get_cmap(palette)
+    if n <= cmap.N:
+        return cmap(np.linspace(0, 1, n))
+    return cmap(np.arange(n) % cmap.N)
+
+
+def tracer_courbes(x, Y, noms, out_file, titre="", xlabel="", ylabel="",
+                   min_dy=MIN_DY, labels=True, dpi=200):
+    """
+    Y (n_courbes, n_x) -> PNG. Les NaN interrompent les courbes ; chaque
+    courbe se termine par un point et (option) un label à son nom.
+    """
+    from matplotlib.collections import LineCollection
+
+    plt = pyplot()
+    x = np.asarray(x, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    c = couleurs(len(Y))
+
+    fig, ax = plt.subplots(figsize=(13, 7))
+    segments = np.stack([np.broadcast_to(x, Y.shape), Y], axis=-1)
+    ax.add_collection(LineCollection(segments, colors=c, linewidths=1.5, alpha=0.8))
+
+    garde, x_fin, y_fin = derniers_points(x, Y)
+    ax.scatter(x_fin, y_fin, color=c[garde], s=30, zorder=5)
+
+    if labels and len(garde):
+        y_label = placer_labels(y_fin, min_dy)
+        for i, xl, yl in zip(garde, x_fin, y_label):
+            ax.text(xl + DECALAGE_LABEL, yl, noms[i], fontsize=9, fontweight="bold",
+                    verticalalignment="center", color=c[i])
+
+    ax.axhline(0, color="black", linewidth=1)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(titre)
+    ax.grid(alpha=0.3)
+    ax.autoscale_view()
+    ax.set_xlim(x[0], x[-1] + 5 if labels else x[-1])
+
+    fig.tight_layout()
+    fig.savefig(out_file, dpi=dpi)
+    plt.close(fig)
+
+
+_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{titre}</title>
+<style>
+body {{ font-family: sans-serif; margin: 20px; }}
+svg polyline {{ fill: none; stroke-width: 1.5; opacity: 0.8; }}
+svg polyline.actif {{ stroke-width: 4; opacity: 1; }}
+#info {{ height: 1.5em; font-weight: bold; }}
+</style></head>
+<body>
+<h3>{titre}</h3>
+<div id="info"></div>
+<svg id="fig" width="1100" height="600"></svg>
+<script>
+const D = {donnees};
+const W = 1100, H = 600, M = {{g: 70, d: 20, h: 20, b: 50}};
+const svg = document.getElementById("fig"), info = document.getElementById("info");
+const ns = "http://www.w3.org/2000/svg";
+const ys = D.y.flat().filter(v => v !== null);
+const y0 = Math.min(0, ...ys), y1 = Math.max(0, ...ys);
+const x0 = D.x[0], x1 = D.x[D.x.length - 1];
+const sx = v => M.g + (v - x0) / (x1 - x0) * (W - M.g - M.d);
+const sy = v => H - M.b - (v - y0) / ((y1 - y0) || 1) * (H - M.h - M.b);
+function el(nom, attrs, texte) {{
+  const e = document.createElementNS(ns, nom);
+  for (const k in attrs) e.setAttribute(k, attrs[k]);
+  if (texte !== undefined) e.textContent = texte;
+  svg.appendChild(e);
+  return e;
+}}
+el("line", {{x1: M.g, x2: W - M.d, y1: sy(0), y2: sy(0), stroke: "black"}});
+for (let k = 0; k <= 5; k++) {{
+  const v = y0 + k * (y1 - y0) / 5;
+  el("text", {{x: M.g - 8, y: sy(v) + 4, "text-anchor": "end", "font-size": 11}}, v.toFixed(2));
+}}
+D.x.forEach(v => el("text", {{x: sx(v), y: H - M.b + 16, "text-anchor": "middle", "font-size": 11}}, v));
+el("text", {{x: W / 2, y: H - 8, "text-anchor": "middle"}}, D.xlabel);
+el("text", {{x: 14, y: H / 2, transform: `rotate(-90 14 ${{H / 2}})`, "text-anchor": "middle"}}, D.ylabel);
+D.y.forEach((serie, i) => {{
+  // Une polyline par tronçon sans valeur manquante
+  let pts = [];
+  const troncons = [];
+  serie.forEach((v, j) => {{
+    if (v === null) {{ if (pts.length) troncons.push(pts); pts = []; }}
+    else pts.push(`${{sx(D.x[j])}},${{sy(v)}}`);
+  }});
+  if (pts.length) troncons.push(pts);
+  troncons.forEach(p => {{
+    const l = el("polyline", {{points: p.join(" "), stroke: D.couleurs[i]}});
+    l.addEventListener("mouseenter", () => {{ l.classList.add("actif"); info.textContent = D.noms[i]; }});
+    l.addEventListener("mouseleave", () => {{ l.classList.remove("actif"); info.textContent = ""; }});
+    const t = document.createElementNS(ns, "title");
+    t.textContent = D.noms[i];
+    l.appendChild(t);
+  }});
+}});
+</script>
+</body></html>
+"""
+
+
+def exporter_html(x, Y, noms, out_file, titre="", xlabel="", ylabel="", decimales=3):
+    """Même figure en HTML autonome : survol d'une courbe = nom du modèle."""
+    from matplotlib.colors import to_hex
+
+    Y = np.round(np.asarray(Y, dtype=float), decimales)
+    y = Y.astype(object)
+    y[~np.isfinite(Y)] = None
+    donnees = {
+        "x": np.asarray(x, dtype=float).tolist(),
+        "y": y.tolist(),
+        "noms": [str(n) for n in noms],
+        "couleurs": [to_hex(ci) for ci in couleurs(len(Y))],
+        "xlabel": xlabel,
+        "ylabel": ylabel,
+    }
+    with open(out_file, "w", encoding="utf-8") as f:
+        f.write(_HTML.format(titre=titre, donnees=json.dumps(donnees)))
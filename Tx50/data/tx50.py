@@ -0,0 +1,116 @@
+import runpy
+import sys
+import time
+
+# =========================================================
+# POINT D'ENTRÉE UNIQUE
+# =========================================================
+# python tx50.py <commande> [arguments]
+#
+# Seul le module de la commande demandée est importé : les commandes de
+# calcul ne chargent jamais matplotlib / cartopy, et les commandes de
+# tracé passent en backend non interactif (Agg) quand il n'y a pas d'écran.
+#
+# Les étapes décrites dans manifeste.ETAPES écrivent un manifeste (entrées,
+# paramètres, code, durée, sorties) et sont sautées si rien n'a changé ;
+# --force les relance. Une étape en échec (exception ou code de sortie non
+# nul) n'écrit pas de manifeste. "tout" enchaîne ces étapes dans l'ordre.
+
+# commande -> (module, trace, description)
+COMMANDES = {
+    "stats":      ("anaylse_compare", False, "Statistiques d'un fichier de différence [fichier] [variable]"),
+    "inventaire": ("inventaire", False, "Inventaire Tx50 typé et résumés"),
+    "coherence":  ("coherence", False, "Règles de cohérence des simulations"),
+    "obs":        ("obs_partage", False, "Publication des obs SAFRAN décodées (mmap partagé)"),
+    "cache":      ("cache_seuils", False, "Remplissage du cache RMSE indexé par seuil"),
+    "references": ("references", False, "RMSE / biais brut et cor contre SAFRAN, ERA5, stations (une passe)"),
+    "contexte":   ("contexte_evenements", False, "Extraction du contexte autour des événements"),
+    "regions":    ("regions", False, "Dépassements par région / département"),
+    "distrib":    ("distrib_tmax", True, "Distributions des TXx (+ figures)"),
+    "periodes":   ("delta_periodes", False, "Moyennes, quantiles, fréquences et deltas par période"),
+    "ensemble":   ("ensemble", False, "Cartes et séries d'ensemble (moyenne, médiane, dispersion, accord)"),
+    "qm":         ("correction_qm", False, "Correction quantile mapping locale vs DRIAS"),
+    "deplacement": ("deplacement_tx", False, "Déplacement des points chauds brut / cor / obs"),
+    "vagues":     ("vagues_chaleur", False, "Épisodes de chaleur journaliers (début, fin, pic, degrés-jours)"),
+    "rmse":       ("compare_obs", True, "RMSE annuel brut/cor vs obs"),
+    "rmse-seuil": ("compare_obs_seuil", True, "RMSE et biais annuels filtrés (Tx_ref > seuil)"),
+    "rmse-bar":   ("diff_rmse_brut_cor_obs_tout", True, "Barplots RMSE moyen par seuil"),
+    "rmse-delta": ("diff_rmse_selon_seui", True, "Courbes ΔRMSE en fonction du seuil (PNG + HTML)"),
+    "journalier": ("nc_diff_rmse_histo", True, "Différence / biais / RMSE journaliers filtrés"),
+    "carte":      ("read_data", True, "Cartes des moyennes temporelles brut/cor"),
+    "atlas":      ("atlas", True, "Atlas de cartes de tous les modèles (pyramides) [niveau]"),
+    "verif":      ("verif_golden", False, "Non-régression des métriques [--maj]"),
+    "service":    ("service", False, "Requêtes sur les caches et l'inventaire [serve [port] | route cle=valeur]"),
+}
+
+
+def usage():
+    print("Usage : python tx50.py <commande> [arguments] [--force]\n")
+    for nom, (module, trace, description) in COMMANDES.items():
+        print(f"  {nom:12s} {description}{' [tracé]' if trace else ''}")
+    print(f"  {'tout':12s} Toutes les étapes avec manifeste, sautées si à jour")
+
+
+def lancer(commande, args, force=False):
+    """Exécute une commande ; étapes à manifeste sautées si à jour."""
+    module, trace, _ = COMMANDES[commande]
+
+    if commande == "stats" and args:
+        from anaylse_compare import calculer_statistiques, VARIABLE_NAME
+        calculer_statistiques(args[0], args[1] if len(args) > 1 else VARIABLE_NAME)
+        return 0
+
+    import manifeste
+    suivie = commande in manifeste.ETAPES
+    if suivie and not force and manifeste.a_jour(commande, module, args):
+        print(f"[{commande}] à jour (entrées, paramètres et code inchangés) : ignorée")
+        return 0
+
+    if trace:
+        from commun import pyplot
+        pyplot()
+
+    debut = time.time()
+    sys.argv = [module + ".py"] + args
+    try:
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            # Étape en échec : pas de manifeste, elle sera relancée
+            print(f"[{commande}] échec : {e.code}")
+            return e.code if isinstance(e.code, int) else 1
+
+    if suivie:
+        manifeste.ecrire_manifeste(commande, module, args, debut, time.time() - debut)
+    return 0
+
+
+def main(argv):
+    force = "--force" in argv
+    argv = [a for a in argv if a != "--force"]
+
+    if argv and argv[0] == "tout":
+        from manifeste import ETAPES
+        echecs = []
+        for commande in ETAPES:
+            try:
+                code = lancer(commande, [], force)
+            except Exception as e:
+                print(f"[{commande}] échec : {e}")
+                code = 1
+            if code:
+                echecs.append(commande)
+        if echecs:
+            print(f"\nÉtapes en échec : {', '.join(echecs)}")
+            return 1
+        return 0
+
+    if not argv or argv[0] not in COMMANDES:
+        usage()
+        return 1
+
+    return lancer(argv[0], argv[1:], force)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,260 @@
+import numpy as np
+import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from commun import base_path, model_files, model_name
+from contexte_evenements import trouver_fichier, cle_date
+from obs_partage import blocs_journaliers
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Épisodes de chaleur sur Tx journalière : suites de jours consécutifs
+# avec Tx >= SEUIL_VAGUE en chaque point de grille (début, fin, pic,
+# degrés-jours au-dessus du seuil). Le fichier est lu par blocs ; un
+# épisode en cours à la fin d'un bloc se prolonge dans le suivant.
+
+path_out = os.path.join(base_path, "vagues_chaleur/")
+
+SEUIL_VAGUE = 35.0   # °C
+DUREE_MIN = 3        # jours consécutifs
+
+# Jours lus à la fois (le bloc suivant est préchargé en arrière-plan)
+JOURS_BLOC = 365
+
+N_PROCESS = 4
+
+SOURCE_OBS = "SAFRAN"
+
+COLONNES = ["cellule", "i_debut", "i_fin", "duree", "pic", "i_pic", "degres_jours"]
+
+# =========================================================
+# MOTEUR (vectorisé sur la grille)
+# =========================================================
+
+def etat_vide(n_cellules):
+    """Épisodes en cours, par point de grille."""
+    return {
+        "ouvert": np.zeros(n_cellules, dtype=bool),
+        "debut": np.zeros(n_cellules, dtype=np.int64),
+        "pic": np.zeros(n_cellules, dtype=np.float32),
+        "i_pic": np.zeros(n_cellules, dtype=np.int64),
+        "dd": np.zeros(n_cellules, dtype=np.float64),
+    }
+
+
+def _episodes(cellule, debut, fin, pic, i_pic, dd):
+    return {"cellule": cellule, "i_debut": debut, "i_fin": fin, "duree": fin - debut + 1,
+            "pic": pic, "i_pic": i_pic, "degres_jours": dd}
+
+
+def _filtrer(ep, duree_min):
+    garde = ep["duree"] >= duree_min
+    return {k: v[garde] for k, v in ep.items()}
+
+
+def traiter_bloc(etat, x, t0, seuil=SEUIL_VAGUE, duree_min=DUREE_MIN):
+    """
+    x (n_jours, n_cellules), t0 = indice global du premier jour.
+    Met à jour `etat` et retourne les épisodes terminés dans ce bloc.
+
+    Chaque ligne (cellule) est complétée par un jour froid puis aplatie :
+    les suites ne chevauchent jamais deux cellules, et débuts / fins se
+    lisent sur la dérivée du masque. Sommes par épisode via cumsum,
+    pics via maximum.reduceat.
+    """
+    n_t, n_c = x.shape
+    L = n_t + 1
+    chaud = np.zeros((n_c, L), dtype=bool)
+    chaud[:, :n_t] = (x >= seuil).T
+    val = np.zeros((n_c, L), dtype=np.float32)
+    val[:, :n_t] = x.T
+
+    cf, vf = chaud.ravel(), val.ravel()
+    d = np.diff(cf.astype(np.int8), prepend=np.int8(0))
+    starts = np.flatnonzero(d == 1)
+    ends = np.flatnonzero(d == -1)          # exclusif (jour froid)
+
+    cellule = starts // L
+    ts, te = starts % L, ends % L
+
+    cs = np.concatenate([[0.0], np.cumsum(np.where(cf, vf - seuil, 0.0), dtype=np.float64)])
+    dd = cs[ends] - cs[starts]
+
+    if starts.size:
+        bornes = np.empty(2 * starts.size, dtype=np.int64)
+        bornes[0::2], bornes[1::2] = starts, ends
+        pic = np.maximum.reduceat(vf, bornes)[0::2]
+
+        # Premier jour atteignant le pic de chaque épisode
+        pos = np.flatnonzero(cf)
+        rid = np.searchsorted(starts, pos, side="right") - 1
+        est_pic = vf[pos] == pic[rid]
+        _, premier = np.unique(rid[est_pic], return_index=True)
+        i_pic = t0 + pos[est_pic][premier] % L
+    else:
+        pic = np.zeros(0, dtype=np.float32)
+        i_pic = np.zeros(0, dtype=np.int64)
+
+    debut = t0 + ts
+    fin = t0 + te - 1
+
+    # Épisodes en cours au bloc précédent : prolongés si le premier jour
+    # est chaud, clos la veille sinon
+    suite = (ts == 0) & etat["ouvert"][cellule]
+    c = cellule[suite]
+    debut[suite] = etat["debut"][c]
+    dd[suite] += etat["dd"][c]
+    avant = etat["pic"][c] >= pic[suite]
+    pic[suite] = np.where(avant, etat["pic"][c], pic[suite])
+    i_pic[suite] = np.where(avant, etat["i_pic"][c], i_pic[suite])
+
+    clos = np.flatnonzero(etat["ouvert"] & ~chaud[:, 0])
+    termines = [_episodes(clos, etat["debut"][clos], np.full(clos.size, t0 - 1),
+                          etat["pic"][clos], etat["i_pic"][clos], etat["dd"][clos])]
+
+    # Épisodes touchant la fin du bloc : gardés ouverts
+    ouvert = te == n_t
+    etat["ouvert"][:] = False
+    c = cellule[ouvert]
+    etat["ouvert"][c] = True
+    etat["debut"][c] = debut[ouvert]
+    etat["pic"][c] = pic[ouvert]
+    etat["i_pic"][c] = i_pic[ouvert]
+    etat["dd"][c] = dd[ouvert]
+
+    f = ~ouvert
+    termines.append(_episodes(cellule[f], debut[f], fin[f], pic[f], i_pic[f], dd[f]))
+    return _filtrer({k: np.concatenate([t[k] for t in termines]) for k in COLONNES}, duree_min)
+
+
+def cloturer(etat, n_jours, duree_min=DUREE_MIN):
+    """Épisodes encore ouverts au dernier jour du fichier."""
+    c = np.flatnonzero(etat["ouvert"])
+    ep = _episodes(c, etat["debut"][c], np.full(c.size, n_jours - 1),
+                   etat["pic"][c], etat["i_pic"][c], etat["dd"][c])
+    etat["ouvert"][:] = False
+    return _filtrer(ep, duree_min)
+
+
+def cles_jours(temps):
+    """Clés AAAAMMJJ d'un axe temps datetime64 ou cftime (calendriers 360 j)."""
+    if np.issubdtype(np.asarray(temps).dtype, np.datetime64):
+        t = pd.DatetimeIndex(temps)
+        return (t.year * 10000 + t.month * 100 + t.day).to_numpy(np.int64)
+    return np.array([t.year * 10000 + t.month * 100 + t.day for t in temps], dtype=np.int64)
+
+
+def episodes_fichier(filepath, seuil=SEUIL_VAGUE, duree_min=DUREE_MIN, jours=JOURS_BLOC):
+    """Tous les épisodes d'un fichier journalier : (dict de colonnes, clés des jours, forme grille)."""
+    etat = None
+    blocs, cles = [], []
+    t0 = 0
+    forme = None
+    for temps, v in blocs_journaliers(filepath, jours=jours):
+        forme = v.shape[1:]
+        x = v.reshape(len(temps), -1)
+        if etat is None:
+            etat = etat_vide(x.shape[1])
+        blocs.append(traiter_bloc(etat, x, t0, seuil, duree_min))
+        cles.append(cles_jours(temps))
+        t0 += len(temps)
+
+    if etat is None:
+        return None, None, None
+    blocs.append(cloturer(etat, t0, duree_min))
+    ep = {k: np.concatenate([b[k] for b in blocs]) for k in COLONNES}
+    return ep, np.concatenate(cles), forme
+
+# =========================================================
+# SORTIES
+# =========================================================
+
+def _file_episodes(source):
+    return os.path.join(path_out, f"episodes_{source}.npz")
+
+
+def traiter_source(source):
+    """Épisodes d'un modèle (ou de SAFRAN) écrits en .npz ; nombre d'épisodes."""
+    fichier = trouver_fichier("tasmax", source)
+    if fichier is None:
+        return None
+    ep, cles, forme = episodes_fichier(fichier)
+    if ep is None:
+        return None
+    np.savez_compressed(_file_episodes(source), cles=cles, forme=np.asarray(forme),
+                        seuil=SEUIL_VAGUE, **ep)
+    return len(ep["cellule"])
+
+
+def charger_episodes(source):
+    """DataFrame des épisodes avec dates AAAAMMJJ, None si non calculés."""
+    f = _file_episodes(source)
+    if not os.path.exists(f):
+        return None
+    with np.load(f) as z:
+        df = pd.DataFrame({k: z[k] for k in COLONNES})
+        cles = z["cles"]
+    for col in ["debut", "fin", "pic"]:
+        df[f"date_{col}"] = cles[df[f"i_{col}"]]
+    df.attrs["cles"] = cles
+    return df
+
+
+def demarrage_evenements(df_ep, cles_evenements):
+    """
+    Pour chaque jour d'événement (clé AAAAMMJJ) : épisodes de chaleur en
+    cours ce jour-là (nombre de points, début le plus précoce, jours de
+    chaleur déjà écoulés, pic et degrés-jours maximaux).
+    """
+    cles = df_ep.attrs["cles"]
+    lignes = []
+    for cle in cles_evenements:
+        i_evt = np.searchsorted(cles, cle)
+        actifs = df_ep[(df_ep["i_debut"] <= i_evt) & (df_ep["i_fin"] >= i_evt)]
+        if i_evt >= len(cles) or cles[i_evt] != cle or actifs.empty:
+            lignes.append({"date": cle, "n_points": 0})
+            continue
+        lignes.append({
+            "date": cle,
+            "n_points": len(actifs),
+            "debut_precoce": int(actifs["date_debut"].min()),
+            "jours_avant_max": int(i_evt - actifs["i_debut"].min()),
+            "jours_avant_median": float((i_evt - actifs["i_debut"]).median()),
+            "pic_max": float(actifs["pic"].max()),
+            "degres_jours_max": float(actifs["degres_jours"].max()),
+        })
+    return pd.DataFrame(lignes)
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    from inventaire import charger_inventaire
+
+    os.makedirs(path_out, exist_ok=True)
+    sources = [SOURCE_OBS] + [model_name(f) for f in model_files]
+
+    # Un processus par source ; chaque fichier est lu une seule fois
+    with ProcessPoolExecutor(max_workers=N_PROCESS) as pool:
+        for source, n in zip(sources, pool.map(traiter_source, sources)):
+            print(f"{source:35s} " + ("pas de fichier journalier" if n is None
+                                      else f"{n} épisodes -> {_file_episodes(source)}"))
+
+    # Démarrage des événements Tx50 de l'inventaire
+    df = charger_inventaire()
+    tables = []
+    for model, groupe in df.groupby("modele", observed=True):
+        df_ep = charger_episodes(str(model))
+        if df_ep is None:
+            continue
+        res = demarrage_evenements(df_ep, [cle_date(d) for d in groupe["date"].dt.strftime("%Y-%m-%d")])
+        res.insert(0, "modele", str(model))
+        tables.append(res)
+
+    if tables:
+        out = os.path.join(path_out, "demarrage_evenements.csv")
+        pd.concat(tables, ignore_index=True).to_csv(out, index=False)
+        print(f"\n-> Démarrage des événements : {out}")
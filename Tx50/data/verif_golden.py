@@ -0,0 +1,611 @@
+import xarray as xr
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import os
+import sys
+import tempfile
+import warnings
+
+from commun import (path_brut, path_cor, model_files, model_name, PERIODES, ECHELLE_INT16,
+                    load_and_clean, align_spatial, encodage_int16, positions,
+                    empaqueter_masque, depaqueter_masque)
+from obs_partage import charger_obs
+import cache_seuils
+import coherence
+import delta_periodes
+import ensemble
+import references
+from inventaire import lire_csv, fiabilite_tableau
+
+# =========================================================
+# CONFIGURATION
+# =========================================================
+# Non-régression des métriques : les moteurs optimisés (cache par seuil,
+# vectorisé / parallèle) sont comparés aux implémentations d'origine
+# (figées ci-dessous) sur des cubes synthétiques et des extraits de
+# cubes réels. Les sorties du cube synthétique sont aussi comparées aux
+# fichiers de référence versionnés dans golden/ (à côté de ce script) :
+# un fichier absent est un échec, --maj les réécrit. L'extrait réel n'est
+# contrôlé que si les fichiers du poste sont présents ; seuls RMSE / biais
+# annuels à quelques seuils et le tableau cor - brut y sont enregistrés.
+
+path_golden = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden/")
+
+RTOL = 1e-5
+ATOL = 1e-4   # °C (obs partagées en float32)
+
+SEUILS = [30.0, 35.0, 40.0, 45.0, 50.0]
+CONDITIONS = ["cor", "brut", "obs"]
+
+# Extraits réels : premiers modèles disponibles, un point de grille sur PAS
+N_MODELES_REELS = 2
+PAS_REEL = 4
+# Sorties de l'extrait réel enregistrées (clés sans le nom du modèle)
+SEUILS_REEL = [30.0, 45.0]
+CLES_REEL = ([f"{stat}/{version}/aucun" for stat in ("annees", "rmse_annuel")
+              for version in ("brut", "cor")]
+             + [f"{stat}/{version}/cor/{th:g}" for stat in ("rmse_annuel", "biais_annuel")
+                for version in ("brut", "cor") for th in SEUILS_REEL])
+
+YEARS_OBS = slice(1959, 2024)
+
+# Sous-grille des contrôles des autres moteurs (fichiers de référence compacts)
+PAS_SYNTH = 2
+
+# Années de l'ensemble contrôlées
+ANNEES_ENSEMBLE = PERIODES["fin_siecle"]
+
+# Découpage en blocs d'années volontairement décalé des périodes
+CHUNK_PERIODES = 7
+
+# Stations synthétiques de la référence "points"
+N_STATIONS = 6
+
+# Fiabilité par modèle des règles de cohérence vs verdicts du tableau
+# versionné (points de pourcentage)
+file_tableau = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..", "Tableau_Tx50 - Feuille 1.csv")
+ECART_FIABILITE_MAX = 15.0
+ECART_FIABILITE_MOYEN = 8.0
+# Verdicts portés sur le modèle entier, pas sur ses événements : ses
+# événements ont les mêmes N45 / N50 / T_max que ceux jugés fiables ailleurs
+VERDICTS_MODELE = {
+    "HadGEM2-ES_HadREM3-GA7-05": "modèle qui chauffe le sud-est, 26 % fiable",
+}
+
+# =========================================================
+# IMPLÉMENTATIONS DE RÉFÉRENCE (figées, ne pas optimiser)
+# =========================================================
+
+def compute_rmse_robust(da_model, da_obs):
+    """Calcule le RMSE sur les années communes uniquement."""
+    common_years = sorted(set(da_model.time.values) & set(da_obs.time.values))
+    if not common_years:
+        return None, None
+
+    da_m = da_model.sel(time=common_years)
+    da_o = da_obs.sel(time=common_years)
+
+    dims_o = [d for d in da_o.dims if d != 'time']
+    dims_m = [d for d in da_m.dims if d != 'time']
+    if len(dims_o) == 2 and len(dims_m) == 2:
+        da_m = da_m.rename({dims_m[0]: dims_o[0], dims_m[1]: dims_o[1]})
+    da_m = da_m.assign_coords({dims_o[0]: da_o[dims_o[0]], dims_o[1]: da_o[dims_o[1]]})
+
+    diff = da_m - da_o
+    rmse = np.sqrt((diff**2).mean(dim=dims_o))
+    return common_years, rmse.values
+
+
+def compute_metrics_filtered(da_model, da_obs, da_filter_ref, threshold):
+    """Calcule le RMSE et le Biais filtrés."""
+    common_years = sorted(set(da_model.time.values) & set(da_obs.time.values)
+                          & set(da_filter_ref.time.values))
+    if not common_years:
+        return None, None, None
+
+    da_m = da_model.sel(time=common_years)
+    da_o = da_obs.sel(time=common_years)
+    da_ref = da_filter_ref.sel(time=common_years)
+
+    dims_o = [d for d in da_o.dims if d != 'time']
+    da_m = align_spatial(da_m, da_o)
+    da_ref = align_spatial(da_ref, da_o)
+    if da_m is None or da_ref is None:
+        return None, None, None
+
+    mask = da_ref >= threshold
+    diff_masked = (da_m - da_o).where(mask)
+    bias = diff_masked.mean(dim=dims_o, skipna=True)
+    rmse = np.sqrt((diff_masked**2).mean(dim=dims_o, skipna=True))
+    return common_years, rmse.values, bias.values
+
+
+def compute_rmse_filtered(da_model, da_obs, da_filter, threshold):
+    """RMSE spatial moyen annuel, filtré par da_filter > threshold."""
+    years = sorted(set(da_model.time.values) & set(da_obs.time.values)
+                   & set(da_filter.time.values))
+    if not years:
+        return None
+
+    da_m = align_spatial(da_model.sel(time=years), da_obs.sel(time=years))
+    da_f = align_spatial(da_filter.sel(time=years), da_obs.sel(time=years))
+    if da_m is None or da_f is None:
+        return None
+
+    diff = (da_m - da_obs.sel(time=years)).where(da_f >= threshold)
+    rmse_year = np.sqrt((diff ** 2).mean(dim=[d for d in diff.dims if d != 'time'],
+                                         skipna=True))
+    return np.nanmean(rmse_year.values)
+
+
+def table_stats(cube):
+    """Tableau à la trace_data.py : écart cor - brut (moyen, type, min, max)."""
+    lignes = []
+    for model, (da_b, da_c) in cube["modeles"].items():
+        years = sorted(set(da_b.time.values) & set(da_c.time.values))
+        diff = align_spatial(da_c.sel(time=years), da_b) - da_b.sel(time=years)
+        lignes.append({"Modèle": model, "écart_moyen": diff.mean().item(),
+                       "écart_type": diff.std().item(), "écart_min": diff.min().item(),
+                       "écart_max": diff.max().item()})
+    return pd.DataFrame(lignes).set_index("Modèle")
+
+# =========================================================
+# CUBES DE TEST
+# =========================================================
+
+def _grille(valeurs, years, dims):
+    return xr.DataArray(valeurs, dims=["time"] + dims,
+                        coords={"time": np.asarray(years)})
+
+
+def cube_synthetique(seed=0, ny=12, nx=15, n_modeles=3):
+    """Obs 1959-2024 et modèles 1951-2100 (dims différentes, trous, mer en NaN)."""
+    rng = np.random.default_rng(seed)
+    mer = rng.random((ny, nx)) < 0.15
+    gradient = np.linspace(0, 8, nx)[None, None, :]
+
+    years_obs = np.arange(1959, 2025)
+    obs = 34 + gradient + rng.normal(0, 3, (len(years_obs), ny, nx))
+    obs[:, mer] = np.nan
+
+    modeles = {}
+    years = np.arange(1951, 2101)
+    tendance = np.linspace(0, 5, len(years))[:, None, None]
+    for m in range(n_modeles):
+        brut = 33 + gradient + tendance + rng.normal(m - 1, 3.5, (len(years), ny, nx))
+        cor = brut + rng.normal(1.0, 1.5, brut.shape)
+        brut[:, mer] = np.nan
+        cor[:, mer] = np.nan
+        # Points isolés manquants côté corrigé
+        cor[rng.random(cor.shape) < 0.01] = np.nan
+        modeles[f"SYNTH-{m}"] = (_grille(brut, years, ["rlat", "rlon"]),
+                                 _grille(cor, years, ["rlat", "rlon"]))
+
+    return {"obs": _grille(obs, years_obs, ["y", "x"]), "modeles": modeles}
+
+
+def cube_reel(n_modeles=N_MODELES_REELS, pas=PAS_REEL):
+    """Extrait des fichiers réels (sous-grille), None si indisponibles."""
+    da_obs = charger_obs()
+    if da_obs is None:
+        return None
+
+    def extrait(da):
+        dims = [d for d in da.dims if d != "time"]
+        return da.isel({dims[0]: slice(None, None, pas), dims[1]: slice(None, None, pas)}).load()
+
+    modeles = {}
+    for filename in model_files:
+        da_b = load_and_clean(path_brut, filename)
+        da_c = load_and_clean(path_cor, filename)
+        if da_b is None or da_c is None:
+            continue
+        modeles[model_name(filename)] = (extrait(da_b), extrait(da_c))
+        if len(modeles) == n_modeles:
+            break
+
+    if not modeles:
+        return None
+    return {"obs": extrait(da_obs.sel(time=YEARS_OBS)), "modeles": modeles}
+
+# =========================================================
+# RÉFÉRENCE / MOTEUR
+# =========================================================
+
+def sorties_reference(cube):
+    """Métriques des implémentations d'origine : {clé: tableau}."""
+    o = cube["obs"]
+    ref = {}
+    for model, (da_b, da_c) in cube["modeles"].items():
+        for version, da_m in (("brut", da_b), ("cor", da_c)):
+            years, rmse = compute_rmse_robust(da_m, o)
+            ref[f"{model}/rmse_annuel/{version}/aucun"] = np.asarray(rmse, dtype=float)
+            ref[f"{model}/annees/{version}/aucun"] = np.asarray(years, dtype=float)
+
+            filtres = {"cor": da_c, "brut": da_b, "obs": o}
+            for cond in CONDITIONS:
+                for th in SEUILS:
+                    years, rmse, bias = compute_metrics_filtered(da_m, o, filtres[cond], th)
+                    cle = f"{version}/{cond}/{th:g}"
+                    ref[f"{model}/annees/{cle}"] = np.asarray(years, dtype=float)
+                    ref[f"{model}/rmse_annuel/{cle}"] = np.asarray(rmse, dtype=float)
+                    ref[f"{model}/biais_annuel/{cle}"] = np.asarray(bias, dtype=float)
+                    ref[f"{model}/rmse_moyen/{cle}"] = np.atleast_1d(
+                        compute_rmse_filtered(da_m, o, filtres[cond], th))
+    return ref
+
+
+def sorties_moteur(cube):
+    """Mêmes clés que sorties_reference, calculées par cache_seuils."""
+    o = cube["obs"]
+    thresholds = np.concatenate([[cache_seuils.SEUIL_AUCUN], SEUILS])
+    res = {}
+    for model, (da_b, da_c) in cube["modeles"].items():
+        years, out = cache_seuils.remplir_modele(da_b, da_c, o, thresholds)
+        count, s, sumsq = out[:, :, 0], out[:, :, 1], out[:, :, 2]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rmse = np.sqrt(sumsq / np.where(count > 0, count, np.nan))
+            biais = s / np.where(count > 0, count, np.nan)
+
+        for iv, version in enumerate(cache_seuils.VERSIONS):
+            # Le moteur travaille sur les années brut ∩ cor ∩ obs : une année
+            # absente d'une seule version apparaît comme un écart d'années
+            res[f"{model}/annees/{version}/aucun"] = years.astype(float)
+            # Sans filtre (seuil -inf) : toutes les conditions sont identiques
+            res[f"{model}/rmse_annuel/{version}/aucun"] = rmse[0, iv, 0]
+
+            for cond in CONDITIONS:
+                ic = cache_seuils.CONDITIONS.index(cond)
+                for it, th in enumerate(SEUILS, start=1):
+                    cle = f"{version}/{cond}/{th:g}"
+                    res[f"{model}/annees/{cle}"] = years.astype(float)
+                    res[f"{model}/rmse_annuel/{cle}"] = rmse[ic, iv, it]
+                    res[f"{model}/biais_annuel/{cle}"] = biais[ic, iv, it]
+                    res[f"{model}/rmse_moyen/{cle}"] = np.atleast_1d(np.nanmean(rmse[ic, iv, it]))
+    return res
+
+# =========================================================
+# AUTRES MOTEURS
+# =========================================================
+# Chaque contrôle retourne (référence, moteur) : {clé: tableau}.
+
+def sous_cube(cube, pas=PAS_SYNTH):
+    """Cube synthétique réduit à un point sur pas, modèles alignés sur la grille obs."""
+    o = cube["obs"]
+    dims = [d for d in o.dims if d != "time"]
+    sel = {dims[0]: slice(None, None, pas), dims[1]: slice(None, None, pas)}
+    o = o.isel(sel)
+    modeles = {}
+    for model, (da_b, da_c) in cube["modeles"].items():
+        dims_m = [d for d in da_b.dims if d != "time"]
+        sel_m = {dims_m[0]: slice(None, None, pas), dims_m[1]: slice(None, None, pas)}
+        modeles[model] = (align_spatial(da_b.isel(sel_m), o), align_spatial(da_c.isel(sel_m), o))
+    return {"obs": o, "modeles": modeles}
+
+
+def _plat(da):
+    """(time, y, x) -> (n_temps, n_points)."""
+    return da.values.reshape(da.sizes["time"], -1)
+
+
+def references_stations(cube, seed=1, n_stations=N_STATIONS):
+    """Référence SAFRAN (même grille) + stations synthétiques projetées par poids."""
+    rng = np.random.default_rng(seed)
+    o = cube["obs"]
+    x = _plat(o)
+    terre = np.isfinite(x).any(axis=0)
+
+    pos, _ = positions(o)
+    pos_st = pos[rng.choice(np.flatnonzero(terre), n_stations, replace=False)]
+    pos_st = pos_st + rng.normal(0, 2.0, pos_st.shape) * [1, 1, 0]
+    W = references.poids_voisins(pos[terre], pos_st, 2)
+    W = sp.csr_matrix((W.data, np.flatnonzero(terre)[W.indices], W.indptr),
+                     shape=(n_stations, terre.size))
+
+    # Stations sur une partie des années seulement, avec des trous
+    annees = np.asarray(o.time.values)[5:-5]
+    valeurs = (W.toarray() @ np.nan_to_num(x[5:-5].T)).T / W.sum(axis=1).A.ravel()
+    valeurs = (valeurs + rng.normal(0, 1.0, valeurs.shape)).astype(np.float32)
+    valeurs[rng.random(valeurs.shape) < 0.05] = np.nan
+
+    return {
+        "SAFRAN": {"annees": np.asarray(o.time.values), "valeurs": x, "projection": None},
+        "stations": {"annees": annees, "valeurs": valeurs, "projection": W},
+    }
+
+
+def controle_references(cube):
+    """references.remplir_modele_refs contre une boucle directe (année, seuil)."""
+    refs = references_stations(cube)
+    thresholds = np.concatenate([[cache_seuils.SEUIL_AUCUN], SEUILS])
+    all_years = np.unique(np.concatenate([r["annees"] for r in refs.values()]))
+
+    ref, moteur = {}, {}
+    for model, (da_b, da_c) in cube["modeles"].items():
+        out = references.remplir_modele_refs(da_b, da_c, refs, all_years, thresholds)
+        years_m = np.intersect1d(da_b.time.values, da_c.time.values)
+
+        for ir, (nom, r) in enumerate(refs.items()):
+            attendu = np.zeros((len(cache_seuils.VERSIONS), 3, len(thresholds), len(all_years)))
+            W = None if r["projection"] is None else r["projection"].toarray()
+            for iv, da in enumerate((da_b, da_c)):
+                for y in np.intersect1d(years_m, r["annees"]):
+                    m = da.sel(time=y).values.ravel().astype(float)
+                    if W is not None:
+                        ok = np.isfinite(m)
+                        num, den = W @ np.where(ok, m, 0), W @ ok
+                        m = np.where(den > 0, num / np.where(den > 0, den, 1), np.nan)
+                    ob = r["valeurs"][np.searchsorted(r["annees"], y)].astype(float)
+                    d = m - ob
+                    for it, th in enumerate(thresholds):
+                        with np.errstate(invalid="ignore"):
+                            sel = np.isfinite(d) & (ob >= th)
+                        attendu[iv, :, it, np.searchsorted(all_years, y)] = (
+                            sel.sum(), d[sel].sum(), (d[sel] ** 2).sum())
+
+            for iv, version in enumerate(cache_seuils.VERSIONS):
+                for k, stat in enumerate(["count", "sum", "sumsq"]):
+                    cle = f"references/{model}/{nom}/{version}/{stat}"
+                    ref[cle] = attendu[iv, k]
+                    moteur[cle] = out[ir, iv, k]
+    return ref, moteur
+
+
+def controle_periodes(cube, chunk_years=CHUNK_PERIODES):
+    """delta_periodes.cumuls / stats_periode contre les statistiques directes par période."""
+    seuils = delta_periodes.SEUILS_FREQUENCE
+    quantiles = delta_periodes.QUANTILES_CELLULE
+    ref, moteur = {}, {}
+    for model, (_, da_c) in cube["modeles"].items():
+        years = np.asarray(da_c.time.values)
+        x = _plat(da_c)
+        lire = lambda i0, i1: x[i0:i1]
+        bornes = delta_periodes.bornes_periodes(years, PERIODES)
+        cum = delta_periodes.cumuls(lire, len(years), x.shape[1],
+                                    [i for b in bornes.values() for i in b], seuils, chunk_years)
+
+        for nom, (i0, i1) in bornes.items():
+            st = delta_periodes.stats_periode(cum, lire, i0, i1, quantiles)
+            bloc = x[i0:i1].astype(float)
+            n = np.isfinite(bloc).sum(axis=0)
+            attendu = {
+                "n_annees": n.astype(float),
+                "moyenne": np.nanmean(bloc, axis=0),
+                "ecart_type": np.nanstd(bloc, axis=0),
+                "quantile": np.nanquantile(bloc, quantiles, axis=0),
+                "frequence": np.stack([(bloc >= s).sum(axis=0) for s in seuils]) / n,
+            }
+            for stat, a in attendu.items():
+                ref[f"periodes/{model}/{nom}/{stat}"] = a
+                moteur[f"periodes/{model}/{nom}/{stat}"] = np.asarray(st[stat], dtype=float)
+    return ref, moteur
+
+
+def controle_ensemble(cube, annees=ANNEES_ENSEMBLE):
+    """
+    Réducteur d'ensemble (ajouter / produits) contre les statistiques
+    directes sur les modèles empilés. Quantiles : écart attendu < BIN_WIDTH
+    quand la valeur reste dans la fenêtre de cases du point.
+    """
+    o = cube["obs"]
+    clim = np.nanmean(_plat(o), axis=0)
+    terre = np.isfinite(clim)
+    qs = ensemble.QUANTILES_ENSEMBLE
+    seuils = ensemble.SEUILS_ACCORD
+
+    ref, moteur, hors_fenetre = {}, {}, {}
+    for iv, version in enumerate(ensemble.VERSIONS):
+        champs = [_plat(paire[iv].sel(time=slice(*annees)))[:, terre]
+                  for paire in cube["modeles"].values()]
+        etat = ensemble.etat_vide(champs[0].shape[0], clim[terre], len(champs), len(seuils))
+        for x in champs:
+            ensemble.ajouter(etat, x.ravel(), seuils)
+        res = ensemble.produits(etat, qs)
+
+        pile = np.stack([x.ravel() for x in champs]).astype(float)
+        n = np.isfinite(pile).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            attendu = {
+                "n_modeles": n,
+                "moyenne": np.where(n > 0, np.nanmean(pile, axis=0), np.nan),
+                "ecart_type": np.where(n > 1, np.nanstd(pile, axis=0, ddof=1), np.nan),
+                "quantiles": np.nanquantile(pile, qs, axis=0),
+                "accord": np.stack([(pile >= s).sum(axis=0) for s in seuils]) / np.where(n > 0, n, np.nan),
+            }
+
+        # Valeurs hors de la fenêtre de cases : pas de garantie de précision
+        base = np.tile(etat["base"], champs[0].shape[0]).astype(float)
+        hors_fenetre[version] = ((attendu["quantiles"] < base)
+                                 | (attendu["quantiles"] > base + ensemble.BIN_WIDTH * ensemble.N_BINS))
+        for stat, a in attendu.items():
+            ref[f"ensemble/{version}/{stat}"] = np.asarray(a, dtype=float)
+            moteur[f"ensemble/{version}/{stat}"] = np.asarray(res[stat], dtype=float)
+    return ref, moteur, hors_fenetre
+
+
+def controle_int16(cube, seuil=45.0):
+    """
+    Chemin journalier de nc_diff_rmse_histo : différence écrite en int16
+    au 1/100 (encodage_int16) et masque de dépassement empaqueté en bits,
+    relus depuis un NetCDF.
+    """
+    ref, moteur = {}, {}
+    for model, (da_b, da_c) in cube["modeles"].items():
+        years = np.intersect1d(da_b.time.values, da_c.time.values)
+        diff = (da_b.sel(time=years) - da_c.sel(time=years)).astype(np.float32)
+        depasse = da_c.sel(time=years).values >= seuil
+        octets, n_bits = empaqueter_masque(depasse)
+        dims = list(diff.dims)
+
+        ds = xr.Dataset({
+            "difference": diff,
+            "depassement": (dims[:-1] + [f"{dims[-1]}_octet"], octets),
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            f = os.path.join(tmp, "journalier.nc")
+            ds.to_netcdf(f, encoding=encodage_int16("difference"))
+            with xr.open_dataset(f) as relu:
+                relu.load()
+
+        # Arrondi au 1/100 le plus proche, NaN conservés
+        ref[f"int16/{model}/difference"] = np.round(diff.values.astype(float) / ECHELLE_INT16) * ECHELLE_INT16
+        moteur[f"int16/{model}/difference"] = relu["difference"].values.astype(float)
+        ref[f"int16/{model}/depassement"] = depasse.astype(float)
+        moteur[f"int16/{model}/depassement"] = depaqueter_masque(relu["depassement"].values,
+                                                                 n_bits).astype(float)
+    return ref, moteur
+
+# =========================================================
+# COMPARAISON
+# =========================================================
+
+def comparer(attendu, obtenu, rtol=RTOL, atol=ATOL):
+    """Liste des écarts : (clé, écart max) pour les clés hors tolérance."""
+    ecarts = []
+    for cle, a in attendu.items():
+        b = obtenu.get(cle)
+        if b is None or np.shape(a) != np.shape(b):
+            ecarts.append((cle, np.inf))
+            continue
+        if not np.allclose(a, b, rtol=rtol, atol=atol, equal_nan=True):
+            with np.errstate(invalid="ignore"):
+                ecarts.append((cle, float(np.nanmax(np.abs(np.asarray(a) - np.asarray(b))))))
+    return ecarts
+
+
+def verifier_moteur(nom, ref, moteur, atol=ATOL):
+    """Moteur vs implémentation directe ; nb d'échecs."""
+    ecarts = comparer(ref, moteur, atol=atol)
+    print(f"[{nom}] moteur vs référence : {len(ref) - len(ecarts)}/{len(ref)} OK")
+    for cle, e in ecarts[:10]:
+        print(f"   ! {cle} : écart max {e:.3g}")
+    return len(ecarts)
+
+
+def verifier_golden(nom, sorties, maj=False, stats=None):
+    """Sorties vs fichiers de référence versionnés (réécrits avec --maj) ; nb d'échecs."""
+    f_ref = os.path.join(path_golden, f"golden_{nom}.npz")
+    f_stats = os.path.join(path_golden, f"golden_stats_{nom}.csv")
+    if maj:
+        os.makedirs(path_golden, exist_ok=True)
+        np.savez_compressed(f_ref, **sorties)
+        if stats is not None:
+            stats.to_csv(f_stats)
+        print(f"[{nom}] sorties de référence enregistrées : {f_ref}")
+        return 0
+
+    manquants = [f for f in [f_ref] + ([f_stats] if stats is not None else [])
+                 if not os.path.exists(f)]
+    if manquants:
+        print(f"[{nom}] fichier de référence absent : {', '.join(manquants)} "
+              "(python tx50.py verif --maj pour le créer)")
+        return 1
+
+    with np.load(f_ref) as golden:
+        ecarts = comparer({k: golden[k] for k in golden.files}, sorties)
+    ok_stats = True
+    if stats is not None:
+        golden_stats = pd.read_csv(f_stats, index_col=0)
+        ok_stats = (golden_stats.index.equals(stats.index)
+                    and np.allclose(golden_stats.values, stats.values, rtol=RTOL, atol=ATOL))
+    print(f"[{nom}] sorties vs enregistré : {'OK' if not ecarts else f'{len(ecarts)} écarts'}"
+          + ("" if stats is None else f", tableau stats : {'OK' if ok_stats else 'ÉCART'}"))
+    for cle, e in ecarts[:10]:
+        print(f"   ! {cle} : écart max {e:.3g}")
+    return len(ecarts) + (not ok_stats)
+
+
+def verifier_cube(nom, cube, maj=False, cles=None):
+    """
+    Moteur vs référence, puis référence vs sorties enregistrées (toutes, ou
+    les clés `cles` de chaque modèle). Nb d'échecs.
+    """
+    # Années / seuils sans aucun point : NaN attendus des deux côtés
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        ref = sorties_reference(cube)
+        moteur = sorties_moteur(cube)
+
+    echecs = verifier_moteur(nom, ref, moteur)
+    if cles is not None:
+        ref = {k: v for k, v in ref.items() if k.split("/", 1)[1] in cles}
+    echecs += verifier_golden(nom, ref, maj, table_stats(cube))
+    return echecs
+
+
+def verifier_controles(cube, maj=False):
+    """Références, périodes, ensemble et chemin int16 sur le cube réduit. Nb d'échecs."""
+    cube = sous_cube(cube)
+    echecs = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        controles = {
+            "references": controle_references(cube),
+            "periodes": controle_periodes(cube),
+            "int16": controle_int16(cube),
+        }
+        ref, moteur, hors_fenetre = controle_ensemble(cube)
+
+    for nom, (ref_c, moteur_c) in controles.items():
+        echecs += verifier_moteur(nom, ref_c, moteur_c)
+        echecs += verifier_golden(nom, moteur_c, maj)
+
+    # Quantiles d'ensemble à BIN_WIDTH près, hors fenêtre de cases exclus
+    quantiles = {k for k in ref if k.endswith("/quantiles")}
+    echecs += verifier_moteur("ensemble", {k: v for k, v in ref.items() if k not in quantiles},
+                              {k: v for k, v in moteur.items() if k not in quantiles})
+    for version, hors in hors_fenetre.items():
+        cle = f"ensemble/{version}/quantiles"
+        print(f"[ensemble] {cle} : {hors.mean():.1%} hors fenêtre de cases")
+        echecs += verifier_moteur(f"ensemble/{version}", {cle: np.where(hors, np.nan, ref[cle])},
+                                  {cle: np.where(hors, np.nan, moteur[cle])},
+                                  atol=ensemble.BIN_WIDTH)
+    echecs += verifier_golden("ensemble", moteur, maj)
+    return echecs
+
+
+def verifier_coherence(csv_file=file_tableau):
+    """Fiabilité par modèle des règles de coherence.py vs "Fiable à X%" du tableau. Nb d'échecs."""
+    if not os.path.exists(csv_file):
+        print(f"[coherence] tableau absent : {csv_file}")
+        return 1
+    scores = coherence.scorer(lire_csv(csv_file))
+    modeles = coherence.synthese_modeles(scores, fiabilite_tableau(csv_file))
+    ecart = (modeles["fiabilite_pct"] - modeles["fiabilite_pct_tableau"]).abs().dropna()
+    ecart = ecart.drop(list(VERDICTS_MODELE), errors="ignore")
+
+    hors = ecart[ecart > ECART_FIABILITE_MAX]
+    print(f"[coherence] fiabilité vs tableau : {len(ecart) - len(hors)}/{len(ecart)} modèles "
+          f"à moins de {ECART_FIABILITE_MAX:g} points, écart moyen {ecart.mean():.1f}")
+    for model, e in hors.items():
+        print(f"   ! {model} : {modeles.loc[model, 'fiabilite_pct']:.0f} % "
+              f"(tableau {modeles.loc[model, 'fiabilite_pct_tableau']:.0f} %)")
+    for model, raison in VERDICTS_MODELE.items():
+        print(f"   - {model} non comparé : {raison}")
+    return len(hors) + (ecart.mean() > ECART_FIABILITE_MOYEN)
+
+
+def main(argv):
+    maj = "--maj" in argv
+    cube = cube_synthetique()
+    echecs = verifier_cube("synthetique", cube, maj)
+    echecs += verifier_controles(cube, maj)
+    echecs += verifier_coherence()
+
+    # Extrait réel : fichiers propres au poste, contrôlé s'ils sont présents
+    cube = cube_reel()
+    if cube is None:
+        print("[reel] fichiers indisponibles : extrait réel ignoré")
+    else:
+        echecs += verifier_cube("reel", cube, maj, CLES_REEL)
+
+    return 1 if echecs else 0
+
+# =========================================================
+# MAIN
+# =========================================================
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
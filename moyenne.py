@@ -1,38 +1,16 @@
-import pandas as pd
+import os
+import sys
 
-# Charger le fichier
-df = pd.read_csv("Tableau_Tx50 - Feuille 1.csv")
+# Couche inventaire typée (Tx50/data/inventaire.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Tx50", "data"))
+from inventaire import charger_inventaire, resume
 
-# Nettoyage des niveaux de réchauffement
-df["warming"] = (
-    df["Niv. réchauffement"]
-    .astype(str)
-    .str.replace("°C", "", regex=False)
-    .str.strip()
-)
+# Charger le fichier (parsé, validé et mis en cache une seule fois, dans
+# le cache de la couche inventaire)
+df = charger_inventaire("Tableau_Tx50 - Feuille 1.csv")
 
-# Nettoyage T_max (certaines valeurs utilisent la virgule)
-df["T_max"] = (
-    df["T_max"]
-    .astype(str)
-    .str.replace(",", ".")
-)
-df["T_max"] = pd.to_numeric(df["T_max"], errors="coerce")
-
-# Conversion des points >45 et >50
-df["Pts T>45"] = pd.to_numeric(df["Pts T>45"], errors="coerce")
-df["Pts T>50"] = pd.to_numeric(df["Pts T>50"], errors="coerce")
-
-# Calcul des moyennes + nombre de cas
-grouped = (
-    df.groupby("warming")
-      .agg(
-          T_max=("T_max", "mean"),
-          Pts_T45=("Pts T>45", "mean"),
-          Pts_T50=("Pts T>50", "mean"),
-          count=("T_max", "count")
-      )
-      .reset_index()
-)
+# Calcul des moyennes + nombre de cas par niveau de réchauffement
+# (libellé d'origine : '4.0', '4.0p' et '>4.0' sont des groupes distincts)
+grouped = resume(df, par=["niveau"]).rename(columns={"niveau": "warming"})
 
 print(grouped)